@@ -1,13 +1,20 @@
 import os
 
+from dzi_builder.core.constants import (
+    BASE_LAYER,
+    ENGINE_GRID,
+    ENGINE_NUMPY,
+    ENGINE_PYVIPS,
+    ENGINE_SUBPROCESS
+)
+
 from dzi_builder.core.illustrator import (
     generate_tiles
 )
 
 from dzi_builder.core.toolkit import (
     create_folder_structure,
-    get_file_list,
-    get_layer_list
+    get_file_list
 )
 
 from dzi_builder.core.vips import (
@@ -15,6 +22,81 @@ from dzi_builder.core.vips import (
     make_image_pyramid
 )
 
+from dzi_builder.core.archive import (
+    archive_pyramids,
+    extract_pyramids,
+    get_archive_file
+)
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    get_catalog_layers,
+    get_catalog_tiles,
+    update_tile_catalog
+)
+
+from dzi_builder.core.combination import (
+    build_combination_pyramids,
+    get_combination_name
+)
+
+from dzi_builder.core.composition import (
+    build_composed_pyramids,
+    read_composition
+)
+
+from dzi_builder.core.dedup import (
+    dedupe_pyramids
+)
+
+from dzi_builder.core.deploy import (
+    make_deploy
+)
+
+from dzi_builder.core.engine import (
+    resolve_engine
+)
+
+from dzi_builder.core.events import (
+    add_event_hook,
+    remove_event_hook,
+    set_event_log,
+    track_stage
+)
+
+from dzi_builder.core.manifest import (
+    get_changed_layers,
+    get_changed_tiles,
+    get_layer_inputs,
+    write_build_manifest
+)
+
+from dzi_builder.core.numpy_engine import (
+    build_pyramids_numpy
+)
+
+from dzi_builder.core.optimize import (
+    optimize_pyramids
+)
+
+from dzi_builder.core.pyramid import (
+    Image,
+    build_pyramids_grid,
+    patch_pyramids,
+    remove_empty_pyramid_tiles
+)
+
+from dzi_builder.core.scheduler import (
+    build_layer_graph,
+    run_task_graph
+)
+
+from dzi_builder.core.pyvips_engine import (
+    build_pyramids_pyvips,
+    combine_layers_pyvips,
+    make_image_pyramid_pyvips
+)
+
 from dzi_builder.core.image_magick import (
     convert_tiles,
     combine_tiles
@@ -24,9 +106,14 @@ from dzi_builder.core.tile_filler import (
     build_matrix,
     create_matrix,
     get_filler_tiles,
+    read_filler_spec,
     restructure_layer_matrix
 )
 
+from dzi_builder.core.watcher import (
+    stream_layers
+)
+
 from dzi_builder.html.openseadragon_html import (
     make_site
 )
@@ -43,31 +130,37 @@ def create_tiles(ai_path, offset_right, transparency=True):
     """
     offset_right_f = float(offset_right / 10)
     create_folder_structure(ai_path)
-    layer_names = generate_tiles(ai_path, offset_right_f, transparency)
+    layer_names = get_catalog_layers(generate_tiles(ai_path, offset_right_f, transparency))
 
     return layer_names
 
 
-def fill_incomplete(layer_path, col, row, verbose=False):
+def fill_incomplete(layer_path, col, row, filler_spec=None, catalog=None, verbose=False):
     """
-    Given a folder of individual tiles, fills the grid in with "filler" tiles, as specified by user input.
+    Given a folder of individual tiles, fills the grid in with "filler" tiles, as named by filler_spec (see
+    read_filler_spec()), or else as specified by user input. Filler positions are hardlinks to the filler tile.
 
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
     :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
     :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :param filler_spec:     dict/str, optional  filler tiles and the grid positions to place them in; if None, prompts
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
     :param verbose:         bool, optional      if True, prints out details of task
-    :return:                none
+    :return:                dict                filler tile number keyed by grid position; see read_filler_spec()
     """
-    layer_names = get_layer_list(layer_path, verbose=verbose)
-    tile_list = get_file_list(layer_path)
+    if filler_spec is None:
+        create_matrix(col, row)
+        filler_spec = get_filler_tiles()
 
-    create_matrix(col, row)
-    filler_tile_ct, duplicates = get_filler_tiles()
-    layers_list, filler_list = build_matrix(tile_list, filler_tile_ct, duplicates, col, row)
-    restructure_layer_matrix(layer_path, layers_list, layer_names, filler_list)
+    fillers = read_filler_spec(filler_spec, col, row)
+    layer_matrix = build_matrix(catalog['files'] if catalog else get_file_list(layer_path), fillers, col, row)
+    restructure_layer_matrix(layer_path, layer_matrix, fillers, catalog, verbose=verbose)
 
+    return fillers
 
-def create_layers(layer_path, vips_path, col, offset_right, offset_down=0, transparency=True, verbose=False):
+
+def create_layers(layer_path, vips_path, col, offset_right, offset_down=0, transparency=True,
+                  engine=ENGINE_SUBPROCESS, jobs=1, max_memory=0, catalog=None, verbose=False):
     """
     Given a folder path containing tiles, combines tiles into single layer png files, named for each layer.
     Assumes layer_path contains tiles named [layer]-[iter]; for instance:
@@ -90,36 +183,140 @@ def create_layers(layer_path, vips_path, col, offset_right, offset_down=0, trans
     :param offset_right:    int, required       width of artboard tile
     :param offset_down:     int, optional       height of artboard tile
     :param transparency:    bool, optional      if True, runs subsequent functions through libvips, not ImageMagick
+    :param engine:          str, optional       ENGINE_SUBPROCESS runs vips.exe; ENGINE_PYVIPS runs libvips in-process
+    :param jobs:            int, optional       number of layers to process at once, sharing CPU and memory
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                none
     """
     offset_down_rect = offset_right if offset_down == 0 else offset_down
-    layer_names = get_layer_list(layer_path, verbose=verbose)
-
-    if transparency:
-        combine_transparent_layer(layer_path, col, vips_path, verbose)
+    catalog = build_tile_catalog(layer_path) if catalog is None else catalog
+    layer_names = get_catalog_layers(catalog)
+    engine = resolve_engine(engine, verbose=verbose)
+
+    if transparency and engine == ENGINE_PYVIPS:
+        combine_layers_pyvips(layer_path, col, layer_names, jobs, max_memory, catalog, verbose=verbose)
+    elif transparency:
+        combine_transparent_layer(layer_path, col, vips_path, jobs, max_memory, layer_names, catalog, verbose=verbose)
     else:
+        svg_list = [f for f in catalog['files'] if f.endswith('.svg')]
         convert_tiles(layer_path, offset_right, verbose=verbose)
-        [os.remove(layer_path + f) for f in os.listdir(layer_path) if f.endswith('.svg')]
-        combine_tiles(layer_path, layer_names, offset_down_rect, col, verbose=verbose)
+        [os.remove(layer_path + f) for f in svg_list]
+        update_tile_catalog(catalog, svg_list + [f[:-len('.svg')] + '.png' for f in svg_list])
+        combine_tiles(layer_path, layer_names, offset_down_rect, col, jobs=jobs, max_memory=max_memory,
+                      verbose=verbose)
 
 
-def create_dzi_and_site(layer_path, vips_path, verbose=False):
+def create_dzi_and_site(layer_path, vips_path, engine=ENGINE_SUBPROCESS, jobs=1, max_memory=0, dedupe=None,
+                        skip_empty=False, tile_format=None, optimize=False, archive=False, catalog=None,
+                        verbose=False):
     """
     Given a folder path containing layer tiles, creates dzi structures and relevant html/css/js for basic site.
 
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
     :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param engine:          str, optional       ENGINE_SUBPROCESS runs vips.exe; ENGINE_PYVIPS runs libvips in-process
+    :param jobs:            int, optional       number of layers to process at once, sharing CPU and memory
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param dedupe:          str, optional       if DEDUP_HARDLINK or DEDUP_MANIFEST, stores identical tiles once
+    :param skip_empty:      bool, optional      if True, fully transparent pyramid tiles are not kept
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param optimize:        bool, optional      if True, losslessly recompresses png pyramid tiles
+    :param archive:         bool, optional      if True, packs each layer's pyramid tiles into a single file
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                none
     """
-    layer_names = get_layer_list(layer_path, verbose=verbose)
-    make_image_pyramid(layer_path, layer_names, vips_path, verbose=verbose)
+    catalog = build_tile_catalog(layer_path, headers=False) if catalog is None else catalog
+    layer_names = get_catalog_layers(catalog)
+
+    if resolve_engine(engine, verbose=verbose) == ENGINE_PYVIPS:
+        make_image_pyramid_pyvips(layer_path, layer_names, layer_path + 'html\\dzi\\', jobs, max_memory, tile_format,
+                                  catalog, verbose=verbose)
+    else:
+        make_image_pyramid(layer_path, layer_names, vips_path, jobs, max_memory, tile_format, catalog=catalog,
+                           verbose=verbose)
+
+    if skip_empty:
+        remove_empty_pyramid_tiles(layer_path + 'html\\dzi\\', layer_names, jobs, max_memory, verbose=verbose)
+    if dedupe:
+        dedupe_pyramids(layer_path + 'html\\dzi\\', layer_names, dedupe, jobs, max_memory, verbose=verbose)
+    if optimize:
+        optimize_pyramids(layer_path + 'html\\dzi\\', layer_names, jobs, max_memory, verbose=verbose)
+    if archive:
+        archive_pyramids(layer_path + 'html\\dzi\\', layer_names, jobs, max_memory, verbose=verbose)
     make_site(layer_path, layer_names)
 
 
+def compose_dzi(spec_path, jobs=1, max_memory=0, dedupe=None, skip_empty=False, tile_format=None, optimize=False,
+                archive=False, verbose=False):
+    """
+    Given a composition spec placing the tiles of several Illustrator files on one artboard grid (see
+    read_composition()), creates a Deep Zoom Image for each layer across all files, and the relevant html/css/js for
+    a basic site, in a 'layers' folder next to the spec.
+
+    Each source file must first have been run through create_tiles() (and fill_incomplete(), if incomplete). Tiles are
+    read in place; nothing is copied, renamed, or combined into a layer png, as pyramids are written straight from the
+    composed tile grid with build_pyramid_from_grid(). Requires Pillow.
+
+    :param spec_path:       str, required       path to composition spec, e.g. 'C:\\path\\to\\map.json'
+    :param jobs:            int, optional       number of layers to process at once, sharing CPU and memory
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param dedupe:          str, optional       if DEDUP_HARDLINK or DEDUP_MANIFEST, stores identical tiles once
+    :param skip_empty:      bool, optional      if True, fully transparent pyramid tiles are not kept
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param optimize:        bool, optional      if True, losslessly recompresses png pyramid tiles
+    :param archive:         bool, optional      if True, packs each layer's pyramid tiles into a single file
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                list                list of layer names
+    """
+    if Image is None:
+        raise ImportError('compose_dzi() requires Pillow')
+
+    composition = read_composition(spec_path)
+    layer_path, html_path, dzi_path, osd_path = create_folder_structure(spec_path)
+
+    layer_names = build_composed_pyramids(composition, dzi_path, jobs, max_memory, skip_empty, tile_format,
+                                          verbose=verbose)
+    if dedupe:
+        dedupe_pyramids(dzi_path, layer_names, dedupe, jobs, max_memory, verbose=verbose)
+    if optimize:
+        optimize_pyramids(dzi_path, layer_names, jobs, max_memory, verbose=verbose)
+    if archive:
+        archive_pyramids(dzi_path, layer_names, jobs, max_memory, verbose=verbose)
+
+    make_site(layer_path, layer_names)
+
+    return layer_names
+
+
+def patch_dzi(layer_path, layer_changes, col, skip_empty=False, verbose=False):
+    """
+    Given a folder path containing tiles, and the tiles of each layer which have changed since its dzi was generated,
+    re-renders only the pyramid tiles above those artboards; see patch_layer_pyramid(). Requires Pillow. Layers
+    packed by archive_pyramid() are extracted to be patched, then packed again.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_changes:   dict, required      indices of changed artboard tiles keyed by layer, e.g. {'base': [4]}
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param skip_empty:      bool, optional      if True, fully transparent pyramid tiles are not kept
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    dzi_path = layer_path + 'html\\dzi\\'
+    archived = [layer for layer in layer_changes if os.path.isfile(get_archive_file(dzi_path, layer))]
+
+    extract_pyramids(dzi_path, archived, verbose=verbose)
+    patch_pyramids(layer_path, layer_changes, col, dzi_path, skip_empty, verbose=verbose)
+    archive_pyramids(dzi_path, archived, verbose=verbose)
+
+
 def dzi_builder(ai_path, vips_path, col, row, offset_right,
-                offset_down=0, transparency=True, incomplete=False, verbose=False):
+                offset_down=0, transparency=True, incomplete=False, engine=ENGINE_SUBPROCESS, jobs=1, max_memory=0,
+                dedupe=None, skip_empty=False, incremental=False, stream=False, tile_format=None, optimize=False,
+                archive=False, combinations=None, crop=False, viewer_options=None, precache_level=None, deploy=False,
+                filler_spec=None, event_log=None, on_event=None, verbose=False):
     """
     Given an illustrator file, creates a Deep Zoom Image for each top-level layer of the Illustrator file,
     and generates an html and css file to resolve a basic example, when adding the requisite openseadragon
@@ -142,8 +339,83 @@ def dzi_builder(ai_path, vips_path, col, row, offset_right,
     make_image_pyramid()
     Use libvips to generate a dzi structure from layer png files, for every layer name provided.
 
+    Rather than running each of these stages for every layer before starting the next, each layer's normalize, join
+    and pyramid steps (and any removal of empty tiles, and dedupe) are run as a chain of tasks, by a scheduler running
+    up to jobs tasks at once, largest layers first; see build_layer_graph() and run_task_graph().
+
+    remove_empty_pyramid_tiles()
+    If skip_empty is True, removes fully transparent pyramid tiles, which the generated viewer then never requests.
+
+    dedupe_pyramids()
+    If dedupe is set, stores byte-identical pyramid tiles (filler ocean, empty overlay tiles) once; see
+    dedupe_pyramid().
+
+    optimize_pyramids()
+    If optimize is True, losslessly recompresses every png pyramid tile, keeping the result only where smaller; tiles
+    optimized by an earlier run are skipped. See optimize_pyramid().
+
+    build_combination_pyramids()
+    If combinations are given, builds a pyramid for each combination of layers, composited tile by tile from the
+    layers' pyramids; the generated viewer shows it in place of its layers whenever they're toggled on together. See
+    build_combination_pyramid().
+
+    archive_pyramids()
+    If archive is True, packs each layer's pyramid tiles into a single indexed SQLite file, dzi/[layer].sqlite, in
+    place of its layer_files/ folder; the site must then be served by serve_site() (python -m dzi_builder.server),
+    which serves tiles from the archives at the same URLs. See archive_pyramid().
+
     make_site()
-    Generates the necessary html/css/js files for OpenJavascript to load a dzi file on the web.
+    Generates the necessary html/css/js files for OpenJavascript to load a dzi file on the web. The viewer opens with
+    the base layer only, and adds each other layer the first time it's toggled on; viewer_options are passed to
+    OpenSeadragon, e.g. {'imageLoaderLimit': 4, 'drawer': 'canvas'}. See make_openseadragon_html(). If
+    precache_level is given, a service worker is generated too, which precaches every tile at or below that level, and
+    keeps a bounded cache of deeper tiles; see make_service_worker().
+
+    make_deploy()
+    If deploy is True, compares the generated site against the hash index stored by the previous build, and lists the
+    files added, changed and removed since, so only those need publishing; see make_deploy().
+
+    Pyramid tiles are written in the format given by tile_format, for every layer or per layer, with optional quality
+    and effort; by default, layers with no transparent pixels are written as JPEG, and overlay layers as png. The
+    format is written to each .dzi descriptor, which the generated viewer follows; see get_tile_format(). Low-colour
+    png layers (grid, borders, labels) are written as 8 bit palette tiles, exact, or quantized within a tolerance.
+
+    If crop is True, or a list of layer names, each overlay layer's pyramid is built only over the bounding box of its
+    non-transparent pixels, and the generated viewer places it at that offset in the full layer; a layer covering a
+    small area of a large map then has a fraction of the tiles and levels. The base layer, and layers in combinations,
+    are never cropped. See get_crop_bounds().
+
+    If incremental is True, the source tiles of every layer are hashed once generated, and compared, along with the
+    build parameters (filler positions included, if incomplete), against the build manifest left in layer_path by the
+    previous run; see get_changed_layers().
+    Only layers whose inputs have changed are combined and have their pyramids regenerated; the html/dzi/ output of
+    every other layer is left alone. Where only some artboard tiles of a layer have changed, the layer's pyramid is
+    patched in place instead; see patch_layer_pyramid().
+
+    If incomplete is True, the grid positions with no artboard are filled in with filler tiles before any layer is
+    built; see fill_incomplete(). Filler tiles and their positions are read from filler_spec, a dict, JSON file, mask
+    string or mask image (see read_filler_spec()), so unattended builds don't stop for input; if filler_spec is None,
+    the user is prompted for them.
+
+    If stream is True, layers are built while Illustrator is still exporting tiles: the layers folder is watched, and
+    as soon as all of a layer's tiles have been exported, its chain of tasks is started, while the next layer is still
+    exporting; see stream_layers(). Streaming requires transparency and ENGINE_SUBPROCESS, and isn't supported with
+    incomplete or incremental.
+
+    If engine is ENGINE_PYVIPS (and pyvips can be imported), combine_transparent_layer() and make_image_pyramid() are
+    replaced by build_pyramids_pyvips(), which runs alpha normalization, arrayjoin and dzsave as one lazy libvips
+    pipeline per layer, without writing the intermediate layer png files.
+
+    If engine is ENGINE_GRID (and Pillow can be imported), they are instead replaced by build_pyramids_grid(), which
+    writes each pyramid straight from the artboard tile grid, holding at most a couple of rows of artboards in memory.
+
+    If engine is ENGINE_NUMPY (and NumPy and Pillow can be imported), they are instead replaced by
+    build_pyramids_numpy(), which stitches each layer into a memory-mapped canvas on disk and downsamples it with
+    NumPy; no vips install is used.
+
+    Each stage above (and each layer within it) emits start and end events, with durations, peak memory and byte
+    counts, and every vips or ImageMagick command emits its exit code and stderr; see track_stage() and run_command().
+    Events are appended to event_log as JSON lines, and passed to on_event, if given.
 
     By default, make_site() sets any layer named 'base' to the 0th position, and is otherwise ignored for
     opacity toggling; if you need to set a specific order for your layers, do it between make_image_pyramid()
@@ -165,30 +437,153 @@ def dzi_builder(ai_path, vips_path, col, row, offset_right,
     :param offset_right:    int, required       width of artboard tile
     :param offset_down:     int, optional       height of artboard tile
     :param transparency:    bool, optional      if True, runs subsequent functions through libvips, not ImageMagick
-    :param incomplete:      bool, optional      if True, requests user input to fill in missing tiles
+    :param incomplete:      bool, optional      if True, fills in missing tiles, per filler_spec or user input
+    :param engine:          str, optional       ENGINE_SUBPROCESS, ENGINE_PYVIPS, ENGINE_GRID or ENGINE_NUMPY
+    :param jobs:            int, optional       number of layers to process at once, sharing CPU and memory
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param dedupe:          str, optional       if DEDUP_HARDLINK or DEDUP_MANIFEST, stores identical tiles once
+    :param skip_empty:      bool, optional      if True, fully transparent pyramid tiles are not kept
+    :param incremental:     bool, optional      if True, only rebuilds layers whose tiles or build parameters changed
+    :param stream:          bool, optional      if True, builds layers while tiles are still being exported
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param optimize:        bool, optional      if True, losslessly recompresses png pyramid tiles
+    :param archive:         bool, optional      if True, packs each layer's pyramid tiles into a single file
+    :param combinations:    list, optional      lists of layer names to pre-composite, e.g. [['base', 'rivers']]
+    :param crop:            bool/list, optional if True, or a list of layer names, crops overlay layers to their content
+    :param viewer_options:  dict, optional      OpenSeadragon viewer options, e.g. {'imageLoaderLimit': 4}
+    :param precache_level:  int, optional       deepest pyramid level for the service worker to precache
+    :param deploy:          bool, optional      if True, lists the site files changed since the previous build
+    :param filler_spec:     dict/str, optional  filler tiles and grid positions, if incomplete; see read_filler_spec()
+    :param event_log:       str, optional       path to a JSON-lines file to append build events to
+    :param on_event:        function, optional  function called with every build event; see add_event_hook()
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                None
     """
     offset_right_f = float(offset_right / 10)
     offset_down_rect = offset_right if offset_down == 0 else offset_down
-
-    layer_path, html_path, dzi_path, osd_path = create_folder_structure(ai_path)
-
-    layer_names = generate_tiles(ai_path, offset_right_f, transparency)
-
-    if incomplete:
-        tile_list = get_file_list(layer_path)
-        create_matrix(col, row)
-        filler_tile_ct, duplicates = get_filler_tiles()
-        layers_list, filler_list = build_matrix(tile_list, filler_tile_ct, duplicates, col, row)
-        restructure_layer_matrix(layer_path, layers_list, layer_names, filler_list)
-
-    if transparency:
-        combine_transparent_layer(layer_path, col, vips_path, verbose)
-    else:
-        convert_tiles(layer_path, offset_right, verbose=verbose)
-        [os.remove(layer_path + f) for f in os.listdir(layer_path) if f.endswith('.svg')]
-        combine_tiles(layer_path, layer_names, offset_down_rect, col, verbose=verbose)
-
-    make_image_pyramid(layer_path, layer_names, vips_path, verbose=verbose)
-    make_site(layer_path, layer_names)
+    engine = resolve_engine(engine, verbose=verbose)
+    if stream and (not transparency or engine != ENGINE_SUBPROCESS or incomplete or incremental):
+        raise ValueError('stream requires transparency and ENGINE_SUBPROCESS, without incomplete or incremental')
+
+    set_event_log(event_log) if event_log else None
+    add_event_hook(on_event) if on_event else None
+
+    uncropped = set([BASE_LAYER] + [layer for combination in combinations or [] for layer in combination])
+
+    def get_crop_layers(layers):
+        return [layer for layer in layers if crop and (crop is True or layer in crop) and layer not in uncropped]
+
+    try:
+        layer_path, html_path, dzi_path, osd_path = create_folder_structure(ai_path)
+
+        streamed_layers = []
+        if stream:
+            with track_stage('stream_layers', outputs=[layer_path, dzi_path]):
+                catalog, streamed_layers = stream_layers(
+                    layer_path, col * row, lambda: generate_tiles(ai_path, offset_right_f, transparency),
+                    lambda layer: build_layer_graph(layer_path, [layer], col, vips_path, skip_empty=skip_empty,
+                                                    dedupe=dedupe, tile_format=tile_format, optimize=optimize,
+                                                    archive=archive, crop=get_crop_layers([layer]),
+                                                    verbose=verbose),
+                    jobs, max_memory, verbose=verbose)
+        else:
+            with track_stage('generate_tiles', outputs=[layer_path]):
+                catalog = generate_tiles(ai_path, offset_right_f, transparency)
+
+        layer_names = get_catalog_layers(catalog)
+        fillers = {}
+        if incomplete:
+            with track_stage('fill_incomplete'):
+                fillers = fill_incomplete(layer_path, col, row, filler_spec, catalog, verbose=verbose)
+
+        build_layers = [layer for layer in layer_names if layer not in streamed_layers]
+        layer_changes = {}
+        if incremental:
+            with track_stage('get_changed_layers'):
+                build_params = {
+                    'col': col, 'row': row, 'offset_right': offset_right, 'offset_down': offset_down,
+                    'transparency': transparency, 'engine': engine, 'dedupe': dedupe, 'skip_empty': skip_empty,
+                    'tile_format': tile_format, 'optimize': optimize, 'archive': archive,
+                    'combinations': combinations, 'crop': crop, 'incomplete': incomplete,
+                    'fillers': {str(position): filler for position, filler in sorted(fillers.items())}
+                }
+                layer_inputs = get_layer_inputs(layer_path, layer_names, build_params, catalog)
+                build_layers = get_changed_layers(layer_path, dzi_path, layer_inputs, verbose=verbose)
+                if transparency and Image is not None:
+                    layer_changes = get_changed_tiles(layer_path, dzi_path, layer_inputs, build_layers)
+                    build_layers = [layer for layer in build_layers if layer not in layer_changes]
+
+        if not transparency:
+            with track_stage('convert_tiles', outputs=[layer_path]):
+                svg_list = [f for f in catalog['files'] if f.endswith('.svg')]
+                convert_tiles(layer_path, offset_right, verbose=verbose)
+                [os.remove(layer_path + f) for f in svg_list]
+                update_tile_catalog(catalog, svg_list + [f[:-len('.svg')] + '.png' for f in svg_list])
+
+        tile_files = [layer_path + f for f in get_catalog_tiles(catalog, build_layers)]
+
+        if engine in (ENGINE_PYVIPS, ENGINE_GRID, ENGINE_NUMPY):
+            with track_stage('build_pyramids', inputs=tile_files, outputs=[dzi_path]):
+                if engine == ENGINE_PYVIPS:
+                    build_pyramids_pyvips(layer_path, build_layers, col, dzi_path, jobs, max_memory, tile_format,
+                                          get_crop_layers(build_layers), catalog, verbose=verbose)
+                elif engine == ENGINE_GRID:
+                    build_pyramids_grid(layer_path, build_layers, col, row, dzi_path, jobs, max_memory, skip_empty,
+                                        tile_format, get_crop_layers(build_layers), catalog, verbose=verbose)
+                else:
+                    build_pyramids_numpy(layer_path, build_layers, col, row, dzi_path, jobs, max_memory, skip_empty,
+                                         tile_format, get_crop_layers(build_layers), catalog, verbose=verbose)
+        else:
+            with track_stage('build_layers', inputs=tile_files, outputs=[dzi_path]):
+                layer_graph = build_layer_graph(layer_path, build_layers, col, vips_path, transparency,
+                                                offset_down_rect, skip_empty=skip_empty, dedupe=dedupe,
+                                                tile_format=tile_format, optimize=optimize, archive=archive,
+                                                crop=get_crop_layers(build_layers), catalog=catalog, verbose=verbose)
+                run_task_graph(layer_graph, jobs, max_memory, verbose=verbose)
+
+        if skip_empty and engine == ENGINE_PYVIPS:                  # other engines never keep empty tiles
+            with track_stage('remove_empty_pyramid_tiles', outputs=[dzi_path]):
+                remove_empty_pyramid_tiles(dzi_path, build_layers, jobs, max_memory, verbose=verbose)
+        if layer_changes:
+            with track_stage('patch_pyramids', outputs=[dzi_path]):
+                extract_pyramids(dzi_path, list(layer_changes), jobs, max_memory, verbose=verbose)
+                patch_pyramids(layer_path, layer_changes, col, dzi_path, skip_empty, catalog, verbose=verbose)
+        stack_order = sorted(layer_names, key=lambda layer: layer != BASE_LAYER)    # viewer order, BASE_LAYER first
+        combination_names = []
+        build_combinations = []
+        for combination in combinations or []:
+            if any(layer not in layer_names for layer in combination):
+                raise ValueError('combination {} includes a layer not in {}'.format(combination, layer_names))
+            combination = sorted(combination, key=stack_order.index)
+            combination_names.append(get_combination_name(combination))
+            changed = [layer for layer in combination if layer in build_layers + list(layer_changes) + streamed_layers]
+            if not incremental or changed or not os.path.isfile(dzi_path + combination_names[-1] + '.dzi'):
+                build_combinations.append(combination)
+        if build_combinations:
+            with track_stage('build_combination_pyramids', outputs=[dzi_path]):
+                build_combination_pyramids(dzi_path, build_combinations, jobs, max_memory, tile_format,
+                                           verbose=verbose)
+
+        post_layers = list(layer_changes) + (build_layers if engine != ENGINE_SUBPROCESS else [])
+        post_layers += [get_combination_name(combination) for combination in build_combinations]
+        if dedupe and post_layers:
+            with track_stage('dedupe_pyramids', outputs=[dzi_path]):
+                dedupe_pyramids(dzi_path, post_layers, dedupe, jobs, max_memory, verbose=verbose)
+        if optimize and post_layers:
+            with track_stage('optimize_pyramids', outputs=[dzi_path]):
+                optimize_pyramids(dzi_path, post_layers, jobs, max_memory, verbose=verbose)
+        if archive and post_layers:
+            with track_stage('archive_pyramids', outputs=[dzi_path]):
+                archive_pyramids(dzi_path, post_layers, jobs, max_memory, verbose=verbose)
+        if incremental:
+            write_build_manifest(layer_path, layer_inputs)
+
+        with track_stage('make_site', outputs=[html_path]):
+            make_site(layer_path, layer_names, combination_names, viewer_options, precache_level=precache_level)
+        if deploy:
+            with track_stage('make_deploy', inputs=[html_path]):
+                make_deploy(layer_path, verbose=verbose)
+
+    finally:
+        remove_event_hook(on_event)
+        set_event_log(None) if event_log else None
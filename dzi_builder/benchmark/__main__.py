@@ -0,0 +1,60 @@
+import argparse
+import json
+
+from dzi_builder.benchmark.run import (
+    run_benchmark
+)
+
+from dzi_builder.core.constants import (
+    ENGINE_GRID,
+    ENGINE_NUMPY,
+    ENGINE_PYVIPS,
+    ENGINE_SUBPROCESS,
+    TILE_FORMAT_AUTO,
+    TILE_SUFFIXES
+)
+
+
+def main():
+    """
+    Command line entry point for run_benchmark(), e.g.:
+
+        python -m dzi_builder.benchmark /tmp/bench/ --col 6 --row 4 --layers 4 --engine grid
+        python -m dzi_builder.benchmark /tmp/bench/ --layers 4 --jobs 2 --export-interval 0.5 --stream
+
+    :return:                none
+    """
+    parser = argparse.ArgumentParser(prog='python -m dzi_builder.benchmark', description='Benchmark dzi-builder stages '
+                                     'on a synthetic tile grid.')
+    parser.add_argument('bench_path', help='empty folder to benchmark in')
+    parser.add_argument('--col', type=int, default=4, help='count of artboard columns')
+    parser.add_argument('--row', type=int, default=4, help='count of artboard rows')
+    parser.add_argument('--tile-width', type=int, default=1000, help='width of artboard tile')
+    parser.add_argument('--tile-height', type=int, default=0, help='height of artboard tile; 0 for square tiles')
+    parser.add_argument('--layers', type=int, default=2, help='number of layers')
+    parser.add_argument('--transparent-ratio', type=float, default=0.5, help='share of overlay layers')
+    parser.add_argument('--filler-ratio', type=float, default=0.0, help='share of grid filled by filler tiles')
+    parser.add_argument('--opaque', action='store_true', help='combine with ImageMagick rather than libvips')
+    parser.add_argument('--engine', default=ENGINE_SUBPROCESS,
+                        choices=[ENGINE_SUBPROCESS, ENGINE_PYVIPS, ENGINE_GRID, ENGINE_NUMPY])
+    parser.add_argument('--vips-path', default=None, help='folder containing the vips binary')
+    parser.add_argument('--jobs', type=int, default=1, help='number of layers to process at once')
+    parser.add_argument('--max-memory', type=int, default=0, help='memory budget in MB shared by all jobs')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for synthetic tiles')
+    parser.add_argument('--export-interval', type=float, default=0.0, help='seconds between tiles being written')
+    parser.add_argument('--stream', action='store_true', help='build layers while tiles are written')
+    parser.add_argument('--tile-format', default=TILE_FORMAT_AUTO, choices=[TILE_FORMAT_AUTO] + sorted(TILE_SUFFIXES),
+                        help='output tile format of every layer')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        args.bench_path, args.col, args.row, args.tile_width, args.tile_height, args.layers, args.transparent_ratio,
+        args.filler_ratio, not args.opaque, args.engine, args.vips_path, args.jobs, args.max_memory, args.seed,
+        args.export_interval, args.stream, args.tile_format, args.verbose
+    )
+    print(json.dumps(results['stages'], indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import io
+import random
+import time
+
+from PIL import (
+    Image,
+    ImageDraw
+)
+
+from dzi_builder.core.constants import (
+    BENCH_LAYER_NAMES
+)
+
+from dzi_builder.core.vips import (
+    tile_number
+)
+
+
+def draw_features(draw, tile_width, tile_height, rng, feature_count, alpha=255):
+    """
+    Draws random map-like features (lines, polygons and dots) onto a tile, so synthetic tiles compress roughly like
+    real artwork, rather than like flat colour or noise.
+
+    :param draw:            ImageDraw, required drawing context of tile
+    :param tile_width:      int, required       width of tile
+    :param tile_height:     int, required       height of tile
+    :param rng:             Random, required    random number generator
+    :param feature_count:   int, required       number of features to draw
+    :param alpha:           int, optional       alpha of features
+    :return:                none
+    """
+    for _ in range(feature_count):
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256), alpha)
+        points = [(rng.randrange(tile_width), rng.randrange(tile_height)) for _ in range(rng.randint(2, 6))]
+        feature = rng.choice(['line', 'polygon', 'dot'])
+
+        if feature == 'line':
+            draw.line(points, fill=colour, width=rng.randint(1, 8))
+        elif feature == 'polygon' and len(points) > 2:
+            draw.polygon(points, fill=colour)
+        else:
+            x, y = points[0]
+            radius = rng.randint(2, 20)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=colour)
+
+
+def make_tile(tile_width, tile_height, transparent, rng):
+    """
+    Generates a single synthetic artboard tile. Opaque tiles are 24 bit, as Illustrator exports tiles with no
+    transparency, so combine_transparent_layer() has alpha channels to add; transparent tiles are 32 bit, with a few
+    features on an empty background, like an overlay layer.
+
+    :param tile_width:      int, required       width of tile
+    :param tile_height:     int, required       height of tile
+    :param transparent:     bool, required      if True, generates a mostly transparent overlay tile
+    :param rng:             Random, required    random number generator
+    :return:                PIL.Image           tile image
+    """
+    if transparent:
+        tile = Image.new('RGBA', (tile_width, tile_height), (0, 0, 0, 0))
+        draw_features(ImageDraw.Draw(tile), tile_width, tile_height, rng, rng.randint(0, 12))
+        return tile
+
+    ground = (rng.randrange(64, 192), rng.randrange(64, 192), rng.randrange(64, 192))
+    tile = Image.new('RGBA', (tile_width, tile_height), ground + (255,))
+    draw_features(ImageDraw.Draw(tile), tile_width, tile_height, rng, 40)
+
+    return tile.convert('RGB')
+
+
+def make_tile_grid(layer_path, col, row, tile_width=1000, tile_height=0, layer_count=2, transparent_ratio=0.5,
+                   filler_ratio=0.0, seed=0, interval=0.0):
+    """
+    Writes a synthetic grid of artboard tiles to layer_path, named as generate_tiles() names them, e.g.:
+
+        base-000.png    roads-000.png
+        base-001.png    roads-001.png
+        etc.
+
+    The first layer ('base') is opaque; of the remaining layers, transparent_ratio of them are transparent overlays.
+    If filler_ratio is greater than 0, that share of grid positions (never the first) are left out of every layer, as
+    with an incomplete Illustrator file; the returned filler tile and positions make the filler spec (see
+    read_filler_spec()) for fill_incomplete() to fill those positions with tile 0.
+
+    If interval is greater than 0, tiles are dropped into layer_path one at a time, a layer at a time, interval seconds
+    apart, each written in two parts, as Illustrator exports them; this stands in for generate_tiles() when testing
+    stream_layers().
+
+    :param layer_path:      str, required       folder path, e.g. '/tmp/bench/layers/'
+    :param col:             int, required       count of artboard columns (starting at 1)
+    :param row:             int, required       count of artboard rows (starting at 1)
+    :param tile_width:      int, optional       width of artboard tile
+    :param tile_height:     int, optional       height of artboard tile; if 0, equal to tile_width
+    :param layer_count:     int, optional       number of layers, up to len(BENCH_LAYER_NAMES)
+    :param transparent_ratio:   float, optional share of layers after 'base' which are transparent overlays
+    :param filler_ratio:    float, optional     share of grid positions left empty, to be filled by filler tiles
+    :param seed:            int, optional       random seed; the same seed writes the same tiles
+    :param interval:        float, optional     seconds between tiles being written
+    :return:                list                list of layer names
+                            int                 filler tile position
+                            list                grid positions to place filler tile into
+    """
+    if layer_count > len(BENCH_LAYER_NAMES):
+        raise ValueError('layer_count must be at most {}'.format(len(BENCH_LAYER_NAMES)))
+
+    rng = random.Random(seed)
+    tile_height = tile_width if tile_height == 0 else tile_height
+    layer_names = BENCH_LAYER_NAMES[:layer_count]
+    overlay_count = int(round((layer_count - 1) * transparent_ratio))
+    duplicates = sorted(rng.sample(range(1, col * row), int((col * row - 1) * filler_ratio)))
+
+    for layer_ct, layer in enumerate(layer_names):
+        transparent = 0 < layer_ct <= overlay_count
+        for tile_ct in range(col * row - len(duplicates)):
+            tile = make_tile(tile_width, tile_height, transparent, rng)
+            tile_file = layer_path + layer + '-' + tile_number(tile_ct) + '.png'
+            if interval:
+                write_tile_slowly(tile, tile_file, interval)
+            else:
+                tile.save(tile_file)
+
+    return layer_names, 0, duplicates
+
+
+def write_tile_slowly(tile, tile_file, interval):
+    """
+    Writes a tile in two halves, interval seconds apart, so that a watcher scanning the folder in between finds a
+    partly written png; see make_tile_grid().
+
+    :param tile:            PIL.Image, required tile image
+    :param tile_file:       str, required       path to write tile to, e.g. '/tmp/bench/layers/base-000.png'
+    :param interval:        float, required     seconds to take writing tile
+    :return:                none
+    """
+    buffer = io.BytesIO()
+    tile.save(buffer, 'png')
+    tile_bytes = buffer.getvalue()
+
+    with open(tile_file, 'wb') as f:
+        f.write(tile_bytes[:len(tile_bytes) // 2])
+        f.flush()
+        time.sleep(interval / 2)
+        f.write(tile_bytes[len(tile_bytes) // 2:])
+    time.sleep(interval / 2)
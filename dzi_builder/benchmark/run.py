@@ -0,0 +1,253 @@
+import json
+import os
+import platform
+import re
+import time
+
+from dzi_builder.benchmark.fixtures import (
+    make_tile_grid
+)
+
+from dzi_builder.core.constants import (
+    BENCH_LAYER_NAMES,
+    BENCH_RESULTS,
+    ENGINE_GRID,
+    ENGINE_NUMPY,
+    ENGINE_PYVIPS,
+    ENGINE_SUBPROCESS,
+    LAYERS_FOLDER,
+    WATCH_TILE_PATTERN
+)
+
+from dzi_builder.core.engine import (
+    resolve_engine
+)
+
+from dzi_builder.core.events import (
+    get_peak_memory,
+    reset_peak_memory
+)
+
+from dzi_builder.core.image_magick import (
+    combine_tiles
+)
+
+from dzi_builder.core.numpy_engine import (
+    build_pyramids_numpy
+)
+
+from dzi_builder.core.pyramid import (
+    build_pyramids_grid
+)
+
+from dzi_builder.core.pyvips_engine import (
+    combine_layers_pyvips,
+    make_image_pyramid_pyvips
+)
+
+from dzi_builder.core.scheduler import (
+    build_layer_graph
+)
+
+from dzi_builder.core.tile_filler import (
+    build_matrix,
+    read_filler_spec,
+    restructure_layer_matrix
+)
+
+from dzi_builder.core.toolkit import (
+    create_file,
+    get_file_list
+)
+
+from dzi_builder.core.vips import (
+    combine_transparent_layer,
+    make_image_pyramid
+)
+
+from dzi_builder.core.watcher import (
+    stream_layers
+)
+
+from dzi_builder.html.openseadragon_html import (
+    make_site
+)
+
+
+def get_folder_usage(path):
+    """
+    Returns the total size and count of files in a folder, including subfolders.
+
+    :param path:            str, required       folder path
+    :return:                int                 total bytes
+                            int                 count of files
+    """
+    total_bytes = file_ct = 0
+    for folder, _, files in os.walk(path):
+        for f in files:
+            total_bytes += os.path.getsize(os.path.join(folder, f))
+            file_ct += 1
+
+    return total_bytes, file_ct
+
+
+def run_benchmark(bench_path, col, row, tile_width=1000, tile_height=0, layer_count=2, transparent_ratio=0.5,
+                  filler_ratio=0.0, transparency=True, engine=ENGINE_SUBPROCESS, vips_path=None, jobs=1,
+                  max_memory=0, seed=0, export_interval=0.0, stream=False, tile_format=None,
+                  verbose=False):
+    """
+    Benchmarks the pipeline after generate_tiles(), on a synthetic grid of tiles (see make_tile_grid()), so it runs
+    without Illustrator. Each stage is timed separately:
+
+        restructure_layer_matrix()      only if filler_ratio is greater than 0
+        combine_transparent_layer()     or combine_layers_pyvips() with ENGINE_PYVIPS, or combine_tiles() (ImageMagick)
+                                        if transparency is False
+        make_image_pyramid()            or make_image_pyramid_pyvips(), build_pyramids_grid() or build_pyramids_numpy()
+                                        in place of both stages, depending on engine
+        make_site()
+
+    If export_interval is greater than 0, tiles are written over time as Illustrator would export them (see
+    make_tile_grid()), and writing them is timed as a stage, make_tile_grid(). If stream is also True, layers are
+    instead built while tiles are written, as one stage, stream_layers(), to compare against the sum of the stages;
+    streaming requires ENGINE_SUBPROCESS, and no filler tiles.
+
+    For each stage, wall time, peak RSS (see get_peak_memory()), and bytes and files written to bench_path are recorded.
+    Results are written as JSON to bench_path, e.g. '/tmp/bench/benchmark.json', to compare against other runs.
+
+    :param bench_path:      str, required       empty folder to benchmark in, e.g. '/tmp/bench/'
+    :param col:             int, required       count of artboard columns (starting at 1)
+    :param row:             int, required       count of artboard rows (starting at 1)
+    :param tile_width:      int, optional       width of artboard tile
+    :param tile_height:     int, optional       height of artboard tile; if 0, equal to tile_width
+    :param layer_count:     int, optional       number of layers
+    :param transparent_ratio:   float, optional share of layers after 'base' which are transparent overlays
+    :param filler_ratio:    float, optional     share of grid positions filled by filler tiles
+    :param transparency:    bool, optional      if True, combines tiles with libvips, not ImageMagick
+    :param engine:          str, optional       ENGINE_SUBPROCESS, ENGINE_PYVIPS, ENGINE_GRID or ENGINE_NUMPY
+    :param vips_path:       str, optional       folder containing the vips binary; if None, vips must be on PATH
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param seed:            int, optional       random seed for synthetic tiles
+    :param export_interval: float, optional     seconds between synthetic tiles being written
+    :param stream:          bool, optional      if True, builds layers while tiles are written; see stream_layers()
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                dict                benchmark results
+    """
+    engine = resolve_engine(engine, verbose=verbose)
+    if stream and (engine != ENGINE_SUBPROCESS or filler_ratio > 0):
+        raise ValueError('stream requires ENGINE_SUBPROCESS, and a filler_ratio of 0')
+
+    vips_path = os.getcwd() if vips_path is None else vips_path
+    tile_height = tile_width if tile_height == 0 else tile_height
+    layer_path = os.path.join(bench_path, LAYERS_FOLDER, '')
+    dzi_path = os.path.join(layer_path, 'html', 'dzi', '')
+    os.makedirs(dzi_path, exist_ok=True)
+    os.makedirs(os.path.join(layer_path, 'html', 'openseadragon', ''), exist_ok=True)     # as create_folder_structure()
+
+    layer_names = BENCH_LAYER_NAMES[:layer_count]
+    tile_grid = {}
+
+    def export_tiles():
+        print('Generating {}x{} grid of {} layers...'.format(col, row, layer_count)) if verbose else None
+        tile_grid['layer_names'], tile_grid['filler'], tile_grid['duplicates'] = make_tile_grid(
+            layer_path, col, row, tile_width, tile_height, layer_count, transparent_ratio, filler_ratio, seed,
+            export_interval)
+        tile_files = [layer_path + f for f in get_file_list(layer_path) if re.match(WATCH_TILE_PATTERN, f)]
+        tile_grid['source'] = {'bytes': sum(os.path.getsize(f) for f in tile_files), 'files': len(tile_files)}
+
+    stages = []
+    if stream:
+        stages.append(('stream_layers', lambda: stream_layers(
+            layer_path, col * row, export_tiles,
+            lambda layer: build_layer_graph(layer_path, [layer], col, vips_path, transparency, tile_height,
+                                            tile_format=tile_format),
+            jobs, max_memory, verbose=verbose)))
+    elif export_interval:
+        stages.append(('make_tile_grid', export_tiles))
+    else:
+        export_tiles()
+
+    if filler_ratio > 0:
+        def restructure():
+            fillers = read_filler_spec({tile_grid['filler']: tile_grid['duplicates']}, col, row)
+            restructure_layer_matrix(layer_path, build_matrix(get_file_list(layer_path), fillers, col, row), fillers)
+        stages.append(('restructure_layer_matrix', restructure))
+
+    if not stream:
+        if engine == ENGINE_GRID:
+            stages.append(('build_pyramids_grid', lambda: build_pyramids_grid(
+                layer_path, layer_names, col, row, dzi_path, jobs, max_memory, tile_format=tile_format,
+                verbose=verbose)))
+        elif engine == ENGINE_NUMPY:
+            stages.append(('build_pyramids_numpy', lambda: build_pyramids_numpy(
+                layer_path, layer_names, col, row, dzi_path, jobs, max_memory, tile_format=tile_format,
+                verbose=verbose)))
+        else:
+            if not transparency:
+                stages.append(('combine_tiles', lambda: combine_tiles(
+                    layer_path, layer_names, tile_width, col, tile_height, jobs, max_memory, verbose=verbose)))
+            elif engine == ENGINE_PYVIPS:
+                stages.append(('combine_layers_pyvips', lambda: combine_layers_pyvips(
+                    layer_path, col, layer_names, jobs, max_memory, verbose=verbose)))
+            else:
+                stages.append(('combine_transparent_layer', lambda: combine_transparent_layer(
+                    layer_path, col, vips_path, jobs, max_memory, layer_names, verbose)))
+
+            if engine == ENGINE_PYVIPS:
+                stages.append(('make_image_pyramid_pyvips', lambda: make_image_pyramid_pyvips(
+                    layer_path, layer_names, dzi_path, jobs, max_memory, tile_format, verbose=verbose)))
+            else:
+                stages.append(('make_image_pyramid', lambda: make_image_pyramid(
+                    layer_path, layer_names, vips_path, jobs, max_memory, tile_format, verbose=verbose)))
+
+    stages.append(('make_site', lambda: make_site(layer_path, layer_names)))
+
+    results = {
+        'params': {
+            'col': col, 'row': row, 'tile_width': tile_width, 'tile_height': tile_height,
+            'layer_count': layer_count, 'transparent_ratio': transparent_ratio, 'filler_ratio': filler_ratio,
+            'transparency': transparency, 'engine': engine, 'jobs': jobs, 'max_memory': max_memory, 'seed': seed,
+            'export_interval': export_interval, 'stream': stream, 'tile_format': tile_format
+        },
+        'platform': {'system': platform.system(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'stages': [time_stage(stage, stage_fn, bench_path, verbose) for stage, stage_fn in stages]
+    }
+    results['source'] = tile_grid['source']
+    results['seconds'] = sum(s['seconds'] for s in results['stages'])
+
+    create_file(os.path.join(bench_path, ''), BENCH_RESULTS, json.dumps(results, indent=4))
+
+    return results
+
+
+def time_stage(stage, stage_fn, bench_path, verbose=False):
+    """
+    Runs a single benchmark stage, returning its wall time, peak memory, and the bytes and files it wrote to
+    bench_path (net of any it removed).
+
+    :param stage:           str, required       name of stage, e.g. 'make_image_pyramid'
+    :param stage_fn:        function, required  runs the stage, taking no arguments
+    :param bench_path:      str, required       benchmark folder, e.g. '/tmp/bench/'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                dict                stage results
+    """
+    bytes_before, files_before = get_folder_usage(bench_path)
+    reset_peak_memory()
+
+    start = time.perf_counter()
+    stage_fn()
+    seconds = time.perf_counter() - start
+
+    peak_rss, peak_rss_children = get_peak_memory()
+    bytes_after, files_after = get_folder_usage(bench_path)
+    print('{}: {:.2f}s'.format(stage, seconds)) if verbose else None
+
+    return {
+        'stage': stage,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(peak_rss, 1),
+        'peak_rss_children_mb': round(peak_rss_children, 1),
+        'bytes_written': bytes_after - bytes_before,
+        'files_written': files_after - files_before
+    }
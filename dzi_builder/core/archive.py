@@ -0,0 +1,207 @@
+import os
+import shutil
+import sqlite3
+import urllib.request
+
+from dzi_builder.core.constants import (
+    ARCHIVE_FILE,
+    ARCHIVE_SCHEMA
+)
+
+from dzi_builder.core.events import (
+    emit_event
+)
+
+from dzi_builder.core.parallel import (
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    get_pyramid_tiles,
+    get_tile_file,
+    read_dzi
+)
+
+from dzi_builder.core.toolkit import (
+    hash_data,
+    hash_file
+)
+
+
+def archive_pyramid(dzi_path, layer, verbose=False):
+    """
+    Packs a layer's pyramid tiles into a single SQLite archive, dzi/[layer].sqlite, in place of the layer_files/
+    folder, so a deploy copies one file per layer rather than one per tile. Tiles are indexed by their key, e.g.
+    '12/3_4'; byte-identical tiles (e.g., hardlinked by dedupe_pyramid()) are stored once. The .dzi descriptor and
+    layer metadata are left as files.
+
+    The archive is written to a temp file which then replaces any existing archive; the layer_files/ folder is only
+    removed once it has. Tiles are served from the archive by serve_site(), at the same URLs as the folder layout, so
+    the generated site works against either.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                int                 count of tiles archived
+    """
+    archive_file = get_archive_file(dzi_path, layer)
+    pyramid_tiles = get_pyramid_tiles(dzi_path, layer)
+    if not pyramid_tiles:
+        return 0
+
+    if os.path.isfile(archive_file + '.tmp'):
+        os.remove(archive_file + '.tmp')
+
+    data_ids = {}
+    connection = sqlite3.connect(archive_file + '.tmp')
+    try:
+        connection.executescript(ARCHIVE_SCHEMA)
+        connection.execute('INSERT INTO archive VALUES (?, ?)', ('suffix', read_dzi(dzi_path, layer)['suffix']))
+        for tile_key, tile_file in pyramid_tiles.items():
+            tile_hash = hash_file(tile_file)
+            if tile_hash not in data_ids:
+                with open(tile_file, 'rb') as f:
+                    data_ids[tile_hash] = connection.execute('INSERT INTO tile_data (data) VALUES (?)',
+                                                             (f.read(),)).lastrowid
+            connection.execute('INSERT INTO tiles VALUES (?, ?)', (tile_key, data_ids[tile_hash]))
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(archive_file + '.tmp', archive_file)
+    shutil.rmtree(dzi_path + layer + '_files', ignore_errors=True)
+
+    emit_event('archive', layer=layer, tiles=len(pyramid_tiles), unique_tiles=len(data_ids),
+               bytes=os.path.getsize(archive_file))
+    print('{}: archived {} tiles ({} unique)'.format(layer, len(pyramid_tiles), len(data_ids))) if verbose else None
+
+    return len(pyramid_tiles)
+
+
+def archive_pyramids(dzi_path, layer_list, jobs=1, max_memory=0, verbose=False):
+    """
+    Runs archive_pyramid() for every layer name provided.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    run_layer_jobs(archive_pyramid, layer_list, jobs, max_memory, dzi_path=dzi_path, verbose=verbose)
+
+
+def extract_pyramid(dzi_path, layer, verbose=False):
+    """
+    Unpacks a layer's archive, written by archive_pyramid(), back into the layer_files/ folder (e.g., so an
+    incremental build can patch the pyramid in place), and removes the archive. Tiles which were stored once are
+    hardlinked to one another again, where the file system allows.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                int                 count of tiles extracted
+    """
+    archive_file = get_archive_file(dzi_path, layer)
+    if not os.path.isfile(archive_file):
+        return 0
+
+    data_files = {}
+    connection = sqlite3.connect(archive_file)
+    try:
+        suffix = connection.execute("SELECT value FROM archive WHERE name = 'suffix'").fetchone()[0]
+        tile_rows = connection.execute('SELECT tile_key, data_id FROM tiles ORDER BY data_id').fetchall()
+        for tile_key, data_id in tile_rows:
+            tile_file = get_tile_file(dzi_path, layer, tile_key, suffix)
+            os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+            if data_id in data_files:
+                try:
+                    os.link(data_files[data_id], tile_file)
+                    continue
+                except OSError:                                     # no hardlinks; written as a copy instead
+                    pass
+            data = connection.execute('SELECT data FROM tile_data WHERE id = ?', (data_id,)).fetchone()[0]
+            with open(tile_file, 'wb') as f:
+                f.write(data)
+            data_files.setdefault(data_id, tile_file)
+    finally:
+        connection.close()
+
+    os.remove(archive_file)
+    print('{}: extracted {} tiles'.format(layer, len(tile_rows))) if verbose else None
+
+    return len(tile_rows)
+
+
+def extract_pyramids(dzi_path, layer_list, jobs=1, max_memory=0, verbose=False):
+    """
+    Runs extract_pyramid() for every layer name provided.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    run_layer_jobs(extract_pyramid, layer_list, jobs, max_memory, dzi_path=dzi_path, verbose=verbose)
+
+
+def get_archive_file(dzi_path, layer):
+    """
+    Returns the path of a layer's pyramid archive; see archive_pyramid().
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                str                 archive path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\base.sqlite'
+    """
+    return dzi_path + ARCHIVE_FILE.format(layer)
+
+
+def hash_archive_tiles(archive_file, max_level=None):
+    """
+    Returns a content hash of every tile in a layer's archive, as hash_file() would hash the tile file; tiles which
+    are stored once are hashed once.
+
+    :param archive_file:    str, required       archive path, from get_archive_file()
+    :param max_level:       int, optional       deepest level to include; if None, every level
+    :return:                dict                hex digests keyed by tile key, e.g. '12/3_4'
+    """
+    data_hashes = {}
+    tile_hashes = {}
+    connection = sqlite3.connect('file:{}?mode=ro'.format(urllib.request.pathname2url(archive_file)), uri=True)
+    try:
+        for tile_key, data_id in connection.execute('SELECT tile_key, data_id FROM tiles').fetchall():
+            if max_level is not None and int(tile_key.split('/')[0]) > max_level:
+                continue
+            if data_id not in data_hashes:
+                data = connection.execute('SELECT data FROM tile_data WHERE id = ?', (data_id,)).fetchone()[0]
+                data_hashes[data_id] = hash_data(data)
+            tile_hashes[tile_key] = data_hashes[data_id]
+    finally:
+        connection.close()
+
+    return tile_hashes
+
+
+def read_archive_tile(archive_file, tile_key, suffix):
+    """
+    Reads a single tile from a layer's archive, by a lookup on its indexed key; only that tile's pages of the archive
+    are read. The archive is opened read-only, so any number of threads may read it at once.
+
+    :param archive_file:    str, required       archive path, from get_archive_file()
+    :param tile_key:        str, required       tile key, e.g. '12/3_4'
+    :param suffix:          str, required       tile file extension requested, e.g. 'png'
+    :return:                bytes               tile file content, or None if not in archive
+    """
+    connection = sqlite3.connect('file:{}?mode=ro'.format(urllib.request.pathname2url(archive_file)), uri=True)
+    try:
+        if connection.execute("SELECT value FROM archive WHERE name = 'suffix'").fetchone()[0] != suffix:
+            return None
+        row = connection.execute('SELECT data FROM tiles JOIN tile_data ON tile_data.id = tiles.data_id '
+                                 'WHERE tile_key = ?', (tile_key,)).fetchone()
+    finally:
+        connection.close()
+
+    return row[0] if row else None
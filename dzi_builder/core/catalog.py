@@ -0,0 +1,197 @@
+import os
+import re
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.constants import (
+    CATALOG_TILE_PATTERN
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count
+)
+
+from dzi_builder.core.toolkit import (
+    read_png_header
+)
+
+
+def add_catalog_entries(catalog, entries, headers=True):
+    """
+    Adds the tiles among entries to a catalog, replacing any entry with the same layer and tile number; entries which
+    aren't named as tiles are skipped.
+
+    :param catalog:         dict, required      tile catalog, from build_tile_catalog()
+    :param entries:         list, required      (file name, size) of each file, e.g. [('base-000.png', 48213), ...]
+    :param headers:         bool, optional      if True, reads the header of every png tile
+    :return:                none
+    """
+    tile_entries = []
+    for file_name, size in entries:
+        tile_match = re.match(CATALOG_TILE_PATTERN, file_name)
+        if tile_match:
+            tile_entry = {'file': file_name, 'size': size, 'width': None, 'height': None, 'bit_depth': None,
+                          'colour_type': None}
+            catalog['layers'].setdefault(tile_match.group(1), {})[int(tile_match.group(2))] = tile_entry
+            if headers and tile_match.group(3) == 'png':
+                tile_entries.append(tile_entry)
+
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        png_headers = pool.map(lambda e: read_png_header(catalog['layer_path'] + e['file']), tile_entries)
+        for tile_entry, png_header in zip(tile_entries, png_headers):
+            tile_entry.update(zip(('width', 'height', 'bit_depth', 'colour_type'), png_header))
+
+
+def build_tile_catalog(layer_path, headers=True):
+    """
+    Lists layer_path once, with os.scandir(), and returns a catalog of the files in it, with every artboard tile (named
+    as generate_tiles() names them, [layer]-[iter].png, or .ai or .svg before conversion) keyed by layer, then by tile
+    number. A tile's number is its position in the artboard grid, i.e. (number % col, number // col):
+
+        {'layer_path': 'C:\\path\\to\\file\\layers\\',
+         'files': ['base-000.png', 'base-001.png', ..., 'base.png', 'build.json'],
+         'layers': {'base': {0: {'file': 'base-000.png', 'size': 48213, 'width': 1000, 'height': 1000,
+                                 'bit_depth': 8, 'colour_type': 6}, ...}, ...}}
+
+    Tiles are matched to layers by their full name, so layers such as 'road' and 'roads' are kept apart. If headers is
+    True, the header of every png tile is read, in a pool of threads, for its dimensions, bit depth and colour type (see
+    read_png_header()); otherwise, and for any other tile, these are None.
+
+    Stages take the catalog in place of listing layer_path again, and those which add, rename or rewrite tiles update
+    it; see update_tile_catalog().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param headers:         bool, optional      if True, reads the header of every png tile
+    :return:                dict                tile catalog
+    """
+    catalog = {'layer_path': layer_path, 'files': [], 'layers': {}}
+    entries = []
+
+    with os.scandir(layer_path) as folder:
+        for dir_entry in folder:
+            if dir_entry.is_file():
+                catalog['files'].append(dir_entry.name)
+                entries.append((dir_entry.name, dir_entry.stat().st_size))
+
+    catalog['files'].sort()
+    add_catalog_entries(catalog, entries, headers)
+
+    return catalog
+
+
+def filter_layer_tiles(tile_list, layer, suffix='png'):
+    """
+    Returns the tiles of a single layer from a list of file names, sorted by tile number, e.g.:
+
+        ['base-000.png', 'base-001.png', ..., 'base-999.png', 'base-1000.png']
+
+    Only files named [layer]-[iter].[suffix] are returned, so neither a combined layer png (e.g. base.png) nor the
+    tiles of another layer sharing its prefix (e.g. roads-000.png, for layer 'road') are picked up.
+
+    :param tile_list:       list, required      list of file names, e.g. from get_catalog_tiles()
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param suffix:          str, optional       tile file extension
+    :return:                list                sorted list of tile file names
+    """
+    layer_tiles = {}
+    for tile in tile_list:
+        tile_match = re.match(CATALOG_TILE_PATTERN, tile)
+        if tile_match and tile_match.group(1) == layer and tile_match.group(3) == suffix:
+            layer_tiles[int(tile_match.group(2))] = tile
+
+    return [layer_tiles[tile_ct] for tile_ct in sorted(layer_tiles)]
+
+
+def get_catalog_entry(catalog, tile):
+    """
+    Returns a tile's entry in a catalog (see build_tile_catalog()), or None if the tile isn't catalogued.
+
+    :param catalog:         dict, required      tile catalog, from build_tile_catalog()
+    :param tile:            str, required       name of tile, e.g. 'base-000.png'
+    :return:                dict                catalog entry of tile
+    """
+    tile_match = re.match(CATALOG_TILE_PATTERN, tile)
+    tile_entry = catalog['layers'].get(tile_match.group(1), {}).get(int(tile_match.group(2))) if tile_match else None
+
+    return tile_entry if tile_entry and tile_entry['file'] == tile else None
+
+
+def get_catalog_layers(catalog):
+    """
+    Returns the names of every layer with tiles in a catalog, e.g. ['base', 'grid'].
+
+    :param catalog:         dict, required      tile catalog, from build_tile_catalog()
+    :return:                list                sorted list of layer names
+    """
+    return sorted(catalog['layers'])
+
+
+def get_catalog_tiles(catalog, layer_list=None):
+    """
+    Returns the tiles in a catalog, layer by layer, each layer's sorted by tile number, e.g.:
+
+        ['base-000.png', 'base-001.png', ..., 'grid-000.png', 'grid-001.png', ...]
+
+    :param catalog:         dict, required      tile catalog, from build_tile_catalog()
+    :param layer_list:      list, optional      list of layer names; if None, every layer in the catalog
+    :return:                list                list of tile file names
+    """
+    layer_list = get_catalog_layers(catalog) if layer_list is None else layer_list
+
+    return [catalog['layers'][layer][tile_ct]['file'] for layer in layer_list if layer in catalog['layers']
+            for tile_ct in sorted(catalog['layers'][layer])]
+
+
+def remove_catalog_tiles(layer_path):
+    """
+    Removes every file in layer_path named as an artboard tile (see build_tile_catalog()), e.g. the tiles of an
+    earlier export, so that a new export starts from an empty grid. Filler positions (see restructure_layer_matrix())
+    are hardlinks, so a new export written in place over them would overwrite the filler tile they share; removing a
+    link leaves the other links untouched.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :return:                list                list of files removed
+    """
+    removed_files = []
+    with os.scandir(layer_path) as folder:
+        for dir_entry in folder:
+            if dir_entry.is_file() and re.match(CATALOG_TILE_PATTERN, dir_entry.name):
+                removed_files.append(dir_entry.name)
+
+    [os.remove(layer_path + f) for f in removed_files]
+
+    return sorted(removed_files)
+
+
+def update_tile_catalog(catalog, file_list, headers=True):
+    """
+    Brings a catalog up to date after a stage adds, removes, renames or rewrites files in its folder: each file named
+    in file_list is looked up again, and added or replaced if it exists, or dropped if not. Only the files named are
+    read, so the folder is never listed again.
+
+    :param catalog:         dict, required      tile catalog, from build_tile_catalog()
+    :param file_list:       list, required      names of files which have changed, e.g. ['base-000.png']
+    :param headers:         bool, optional      if True, reads the header of every png tile
+    :return:                none
+    """
+    files = set(catalog['files'])
+    entries = []
+
+    for file_name in file_list:
+        tile_match = re.match(CATALOG_TILE_PATTERN, file_name)
+        layer_tiles = catalog['layers'].get(tile_match.group(1), {}) if tile_match else {}
+        if tile_match and layer_tiles.get(int(tile_match.group(2)), {}).get('file') == file_name:
+            del layer_tiles[int(tile_match.group(2))]
+
+        if os.path.isfile(catalog['layer_path'] + file_name):
+            files.add(file_name)
+            entries.append((file_name, os.path.getsize(catalog['layer_path'] + file_name)))
+        else:
+            files.discard(file_name)
+
+    catalog['files'] = sorted(files)
+    catalog['layers'] = {layer: layer_tiles for layer, layer_tiles in catalog['layers'].items() if layer_tiles}
+    add_catalog_entries(catalog, entries, headers)
+
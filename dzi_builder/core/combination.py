@@ -0,0 +1,187 @@
+import io
+import os
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.archive import (
+    get_archive_file,
+    read_archive_tile
+)
+
+from dzi_builder.core.constants import (
+    COMBINATION_SEPARATOR,
+    TILE_FORMAT_AUTO,
+    TILE_FORMAT_JPEG,
+    TILE_FORMAT_OPAQUE,
+    TILE_FORMAT_TRANSPARENT,
+    TILE_SUFFIXES
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count,
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    Image,
+    get_empty_runs,
+    get_level_count,
+    get_level_folder,
+    get_level_size,
+    get_tile_count,
+    get_tile_file,
+    read_dzi,
+    remove_pyramid,
+    save_tile,
+    write_dzi
+)
+
+from dzi_builder.core.tile_format import (
+    get_tile_format
+)
+
+from dzi_builder.core.toolkit import (
+    get_layer_meta,
+    update_layer_meta
+)
+
+
+def build_combination_pyramid(dzi_path, layer, tile_format=None, verbose=False):
+    """
+    Builds the pyramid of a layer combination (see get_combination_name()) by compositing the combination's layer
+    pyramids tile by tile, in order, bottom layer first; the layers are never re-stitched. Every layer must have the
+    same size and tiling, so none may be cropped to its content (see get_crop_bounds()). A layer's tiles are read from
+    its layer_files/ folder, or from its archive (see archive_pyramid()); tiles removed by dedupe_pyramid() are read
+    from the tile they duplicate, and tiles removed as empty are skipped. A tile which is empty in every layer isn't
+    written, and is recorded in the combination's metadata, as with skip_empty.
+
+    Coarser levels are composited from the layers' own coarser levels, rather than halved from the composite, so edges
+    may differ very slightly from stacking the layers in the viewer.
+
+    By default (TILE_FORMAT_AUTO), a combination including a layer tiled as JPEG (i.e., an opaque layer, usually the
+    base) is tiled as TILE_FORMAT_OPAQUE, and any other as TILE_FORMAT_TRANSPARENT; see get_tile_format().
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of combination, e.g. 'base__borders__rivers'
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Generating pyramid for {}...'.format(layer)) if verbose else None
+    layer_list = layer.split(COMBINATION_SEPARATOR)
+    layer_dzis = [read_dzi(dzi_path, combined_layer) for combined_layer in layer_list]
+    dzi = layer_dzis[0]
+    if any((d['width'], d['height'], d['tile_size'], d['overlap']) !=
+           (dzi['width'], dzi['height'], dzi['tile_size'], dzi['overlap']) for d in layer_dzis):
+        raise ValueError('{}: every layer of a combination must have the same size and tiling'.format(layer))
+    if any('bounds' in get_layer_meta(dzi_path, combined_layer) for combined_layer in layer_list):
+        raise ValueError('{}: layers of a combination can\'t be cropped to their content'.format(layer))
+
+    opaque = any(d['suffix'] == TILE_SUFFIXES[TILE_FORMAT_JPEG] for d in layer_dzis)
+    if isinstance(tile_format, dict) and 'format' not in tile_format:
+        tile_format = tile_format.get(layer)
+    if tile_format in (None, TILE_FORMAT_AUTO):
+        tile_format = TILE_FORMAT_OPAQUE if opaque else {'format': TILE_FORMAT_TRANSPARENT, 'palette': False}
+    layer_format = get_tile_format(tile_format, layer, [])
+    suffix = TILE_SUFFIXES[layer_format['format']]
+
+    layer_sources = []
+    for combined_layer, layer_dzi in zip(layer_list, layer_dzis):
+        aliases = get_layer_meta(dzi_path, combined_layer).get('aliases', {})
+        kept_keys = {alias_key: kept_key for kept_key, alias_keys in aliases.items() for alias_key in alias_keys}
+        layer_sources.append((combined_layer, layer_dzi['suffix'], kept_keys))
+
+    remove_pyramid(dzi_path, layer)
+
+    def composite_tile(tile_key):
+        tile = None
+        for combined_layer, layer_suffix, kept_keys in layer_sources:
+            layer_tile = read_layer_tile(dzi_path, combined_layer, kept_keys.get(tile_key, tile_key), layer_suffix)
+            if layer_tile is not None:
+                tile = layer_tile if tile is None else Image.alpha_composite(tile, layer_tile)
+        if tile is None:
+            return False
+
+        save_tile(tile, get_tile_file(dzi_path, layer, tile_key, suffix), layer_format)
+        return True
+
+    level_count = get_level_count(dzi['width'], dzi['height'])
+    empty_runs = {}
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        for level in range(level_count):
+            level_width, level_height = get_level_size(dzi['width'], dzi['height'], level, level_count)
+            tile_cols, tile_rows = get_tile_count(level_width, level_height, dzi['tile_size'])
+            os.makedirs(get_level_folder(dzi_path, layer, level), exist_ok=True)
+
+            tile_keys = ['{}/{}_{}'.format(level, c, r) for r in range(tile_rows) for c in range(tile_cols)]
+            written = list(pool.map(composite_tile, tile_keys))
+            empty_tiles = [position for position, tile_written in enumerate(written) if not tile_written]
+            if empty_tiles:
+                empty_runs[str(level)] = get_empty_runs(empty_tiles)
+
+    write_dzi(dzi_path, layer, dzi['width'], dzi['height'], dzi['tile_size'], dzi['overlap'], suffix)
+    update_layer_meta(dzi_path, layer, empty=empty_runs or None, tile_format=layer_format)
+
+
+def build_combination_pyramids(dzi_path, combinations, jobs=1, max_memory=0, tile_format=None, verbose=False):
+    """
+    Runs build_combination_pyramid() for every layer combination provided, once every layer's pyramid has been built.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param combinations:    list, required      lists of layer names, bottom layer first, e.g. [['base', 'rivers']]
+    :param jobs:            int, optional       number of combinations to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                list                list of combination names
+    """
+    if Image is None:
+        raise ImportError('build_combination_pyramids() requires Pillow')
+
+    combination_names = [get_combination_name(combination) for combination in combinations]
+    run_layer_jobs(build_combination_pyramid, combination_names, jobs, max_memory, dzi_path=dzi_path,
+                   tile_format=tile_format, verbose=verbose)
+
+    return combination_names
+
+
+def get_combination_name(combination):
+    """
+    Returns the name a layer combination's pyramid is written under, e.g.:
+
+        ['base', 'borders', 'rivers']       -->     'base__borders__rivers'
+
+    :param combination:     list, required      list of layer names, bottom layer first, e.g. ['base', 'rivers']
+    :return:                str                 name of combination
+    """
+    if len(combination) < 2 or any(COMBINATION_SEPARATOR in layer for layer in combination):
+        raise ValueError('a combination needs at least two layers, whose names don\'t contain "{}": {}'.format(
+            COMBINATION_SEPARATOR, combination))
+
+    return COMBINATION_SEPARATOR.join(combination)
+
+
+def read_layer_tile(dzi_path, layer, tile_key, suffix):
+    """
+    Reads a single tile of a layer's pyramid, from its layer_files/ folder, or else from its archive.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_key:        str, required       tile key, e.g. '12/3_4'
+    :param suffix:          str, required       tile file extension, e.g. 'png'
+    :return:                PIL.Image           RGBA tile, or None if the tile doesn't exist
+    """
+    tile_file = get_tile_file(dzi_path, layer, tile_key, suffix)
+    if os.path.isfile(tile_file):
+        with Image.open(tile_file) as tile:
+            return tile.convert('RGBA')
+
+    archive_file = get_archive_file(dzi_path, layer)
+    tile_data = read_archive_tile(archive_file, tile_key, suffix) if os.path.isfile(archive_file) else None
+    if tile_data is None:
+        return None
+
+    with Image.open(io.BytesIO(tile_data)) as tile:
+        return tile.convert('RGBA')
@@ -0,0 +1,176 @@
+import json
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    get_catalog_layers,
+    get_catalog_tiles
+)
+
+from dzi_builder.core.parallel import (
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    build_pyramid_from_grid,
+    build_tile_grid,
+    get_grid_tile_size
+)
+
+from dzi_builder.core.tile_format import (
+    get_tile_format
+)
+
+
+def build_composed_pyramid(composition, layer, dzi_path, skip_empty=False, tile_format=None, verbose=False):
+    """
+    Runs build_pyramid_from_grid() for a single layer of a composition, over the virtual canvas returned by
+    build_composed_grid(). A layer is only opaque (see get_tile_format()) if the composition covers every position of
+    the composed grid.
+
+    :param composition:     dict, required      composition, from read_composition()
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Generating pyramid for {}...'.format(layer)) if verbose else None
+    tile_grid, col, row = build_composed_grid(composition, layer)
+    layer_format = get_tile_format(tile_format, layer, list(tile_grid.values()) if len(tile_grid) == col * row else [])
+    build_pyramid_from_grid(tile_grid, col, row, dzi_path, layer, skip_empty=skip_empty, tile_format=layer_format,
+                            verbose=verbose)
+
+
+def build_composed_grid(composition, layer):
+    """
+    Merges the artboard tiles of a layer, across every tile set of a composition, into a single tile grid; each tile
+    set's grid is shifted by its origin. Tiles are referenced where they are, rather than copied or renamed, and grid
+    positions not covered by any tile set are left transparent:
+
+        north: layer_path 'C:\\map\\north\\layers\\', col 6, origin (0, 0)
+        south: layer_path 'C:\\map\\south\\layers\\', col 6, origin (0, 5)
+
+        -->     {(0, 0): 'C:\\map\\north\\layers\\base-000.png', ...,
+                 (0, 5): 'C:\\map\\south\\layers\\base-000.png', ...}
+
+    :param composition:     dict, required      composition, from read_composition()
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                dict                tile paths keyed by (column, row)
+                            int                 count of artboard columns in composed grid
+                            int                 count of artboard rows in composed grid
+    """
+    tile_grid = {}
+    tile_sizes = set()
+
+    for tile_set in composition['sources']:
+        set_grid = build_tile_grid(tile_set['layer_path'], layer, tile_set['col'], tile_set['tiles'])
+        if not set_grid:
+            continue
+
+        tile_sizes.add(get_grid_tile_size(set_grid))
+        for (c, r), tile_file in set_grid.items():
+            tile_grid[(c + tile_set['col_origin'], r + tile_set['row_origin'])] = tile_file
+
+    if len(tile_sizes) > 1:
+        raise ValueError('artboard tiles of {} differ in size across tile sets: {}'.format(layer, sorted(tile_sizes)))
+
+    return tile_grid, composition['col'], composition['row']
+
+
+def build_composed_pyramids(composition, dzi_path, jobs=1, max_memory=0, skip_empty=False, tile_format=None,
+                            verbose=False):
+    """
+    Runs build_composed_pyramid() for every layer of a composition; see get_composition_layers().
+
+    :param composition:     dict, required      composition, from read_composition()
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                list                list of layer names
+    """
+    layer_names = get_composition_layers(composition)
+    run_layer_jobs(build_composed_pyramid, layer_names, jobs, max_memory, composition=composition,
+                   dzi_path=dzi_path, skip_empty=skip_empty, tile_format=tile_format, verbose=verbose)
+
+    return layer_names
+
+
+def get_composition_layers(composition):
+    """
+    Returns every layer name found in any tile set of a composition. A layer missing from some tile sets (e.g., a
+    'labels' layer only in the north file) is transparent where those tile sets are placed.
+
+    :param composition:     dict, required      composition, from read_composition()
+    :return:                list                sorted list of layer names
+    """
+    layer_names = set()
+    for tile_set in composition['sources']:
+        layer_names.update(tile_set['layers'])
+
+    return sorted(layer_names)
+
+
+def get_composition_size(composition):
+    """
+    Returns the size of a composition's artboard grid: "col" and "row" from the spec if given, otherwise the extent of
+    every tile set, across all layers, so that every layer's pyramid has the same dimensions.
+
+    :param composition:     dict, required      composition, from read_composition()
+    :return:                int                 count of artboard columns in composed grid
+                            int                 count of artboard rows in composed grid
+    """
+    col, row = composition.get('col', 0), composition.get('row', 0)
+    if col and row:
+        return col, row
+
+    for tile_set in composition['sources']:
+        set_grids = [build_tile_grid(tile_set['layer_path'], layer, tile_set['col'], tile_set['tiles'])
+                     for layer in tile_set['layers']]
+        set_rows = max([max(r for _, r in g) + 1 for g in set_grids if g] or [0])
+        col = max(col, tile_set['col_origin'] + tile_set['col'])
+        row = max(row, tile_set['row_origin'] + set_rows)
+
+    return composition.get('col') or col, composition.get('row') or row
+
+
+def read_composition(spec_path):
+    """
+    Reads a composition spec: a JSON file placing the tiles of several Illustrator files (each run through
+    create_tiles() and, if needed, fill_incomplete()) on one artboard grid, by the column and row of the grid where
+    each file's top-left artboard lands. For instance, a map split into a north and a south file:
+
+        {
+            "sources": [
+                {"layer_path": "north\\\\layers\\\\", "col": 6, "col_origin": 0, "row_origin": 0},
+                {"layer_path": "south\\\\layers\\\\", "col": 6, "col_origin": 0, "row_origin": 5}
+            ]
+        }
+
+    col is the count of artboard columns in that file. layer_path may be relative to the spec file. The size of the
+    composed grid may be given as "col" and "row" at the top level; otherwise it is the extent of the tile sets. Each
+    tile set's folder is listed once, here (see build_tile_catalog()), and its layers and tiles kept in the composition.
+
+    :param spec_path:       str, required       path to composition spec, e.g. 'C:\\path\\to\\map.json'
+    :return:                dict                composition, with absolute layer paths, origins, tiles and grid size
+    """
+    with open(spec_path) as spec_file:
+        composition = json.load(spec_file)
+
+    spec_folder = spec_path[:max(spec_path.rfind('\\'), spec_path.rfind('/')) + 1]
+    for tile_set in composition['sources']:
+        if not (tile_set['layer_path'].startswith(('\\', '/')) or ':' in tile_set['layer_path']):
+            tile_set['layer_path'] = spec_folder + tile_set['layer_path']
+        tile_set.setdefault('col_origin', 0)
+        tile_set.setdefault('row_origin', 0)
+
+        catalog = build_tile_catalog(tile_set['layer_path'], headers=False)
+        tile_set['layers'] = get_catalog_layers(catalog)
+        tile_set['tiles'] = get_catalog_tiles(catalog)
+
+    composition['col'], composition['row'] = get_composition_size(composition)
+
+    return composition
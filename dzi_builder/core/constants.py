@@ -1,13 +1,134 @@
 # openseadragon_html.py
 BASE_LAYER = 'base'
 OPACITY_TOGGLE_DIV = 'toggleButtons'
+OSD_EVICT_SECONDS = 300
 OSD_VIEWER_ID = 'layerMap'
 SITE_NAME = 'viewer'
 
+# service_worker.py
+PRECACHE_MANIFEST = 'precache.json'
+SERVICE_WORKER = 'sw.js'
+SW_PRECACHE_BATCH = 50
+SW_RUNTIME_CACHE_SIZE = 1000
+
 # illustrator.py
 LAYERS_FOLDER = 'layers'
 
+# toolkit.py
+LAYER_META = '{}.json'
+PNG_RGBA = 6
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# archive.py
+ARCHIVE_FILE = '{}.sqlite'
+ARCHIVE_SCHEMA = """
+CREATE TABLE archive (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE tile_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE tiles (tile_key TEXT PRIMARY KEY, data_id INTEGER NOT NULL) WITHOUT ROWID;
+"""
+
+# catalog.py
+CATALOG_TILE_PATTERN = r'^(.+)-(\d+)\.(ai|png|svg)$'
+
+# combination.py
+COMBINATION_SEPARATOR = '__'
+
 # vips.py
 ARRAYJOIN = 'vips arrayjoin {} {} --across {}'
 COMPOSITE = 'vips composite {} {} 0'
-DZSAVE = 'vips dzsave {}{} {}{} --suffix .png'
+CROP = 'vips crop {}{} {}{} {} {} {} {}'
+DZSAVE = 'vips dzsave {}{} {}{} --suffix "{}"'
+
+# dedup.py
+DEDUP_HARDLINK = 'hardlink'
+DEDUP_MANIFEST = 'manifest'
+
+# engine.py
+ENGINE_GRID = 'grid'
+ENGINE_NUMPY = 'numpy'
+ENGINE_PYVIPS = 'pyvips'
+ENGINE_SUBPROCESS = 'subprocess'
+
+# pyramid.py
+DZI_OVERLAP = 1
+DZI_SUFFIX = 'png'
+DZI_TILE_SIZE = 254
+DZI_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008"
+  Format="{0}"
+  Overlap="{1}"
+  TileSize="{2}"
+  >
+  <Size 
+    Height="{3}"
+    Width="{4}"
+  />
+</Image>
+"""
+
+# tile_format.py
+PALETTE_MAX_COLOURS = 256
+PALETTE_SCAN_COLOURS = 4096                                     # distinct colours counted per tile before giving up
+PALETTE_TRANSPARENT = (0, 0, 0, 0)                              # every fully transparent pixel maps to this entry
+TILE_FORMAT_AUTO = 'auto'
+TILE_FORMAT_JPEG = 'jpeg'
+TILE_FORMAT_PNG = 'png'
+TILE_FORMAT_WEBP = 'webp'
+TILE_FORMAT_DEFAULTS = {
+    TILE_FORMAT_JPEG: {'quality': 85, 'effort': 1},
+    TILE_FORMAT_PNG: {'quality': 100, 'effort': 6, 'palette': TILE_FORMAT_AUTO, 'colours': PALETTE_MAX_COLOURS,
+                      'tolerance': 0},
+    TILE_FORMAT_WEBP: {'quality': 80, 'effort': 4}
+}
+TILE_FORMAT_OPAQUE = TILE_FORMAT_JPEG
+TILE_FORMAT_TRANSPARENT = TILE_FORMAT_PNG
+TILE_SUFFIXES = {TILE_FORMAT_JPEG: 'jpg', TILE_FORMAT_PNG: 'png', TILE_FORMAT_WEBP: 'webp'}
+
+# optimize.py
+PNG_KEEP_CHUNKS = (b'IHDR', b'PLTE', b'tRNS')                   # IDAT and IEND are rewritten
+PNG_ZLIB_STRATEGIES = (0, 1, 3)                                 # zlib default, filtered and run-length strategies
+
+# numpy_engine.py
+CANVAS_CHUNK_BYTES = 160                                        # bytes held per output pixel while halving a chunk
+CANVAS_CHUNK_ROWS = 256                                         # most output rows halved at once
+CANVAS_CHUNK_SHARE = 4                                          # a chunk uses at most 1/N of the memory budget
+
+# manifest.py
+BUILD_MANIFEST = 'build.json'
+SOURCE_TILE_PATTERN = r'^{}-\d+\.(png|svg)$'
+
+# scheduler.py
+TASK_WEIGHTS = {'normalize': 1, 'join': 2, 'pyramid': 4, 'remove_empty': 1, 'dedupe': 1, 'optimize': 2, 'archive': 1}
+
+# watcher.py
+PNG_END = b'IEND\xaeB`\x82'
+WATCH_POLL_INTERVAL = 1.0
+WATCH_TILE_PATTERN = r'^(.+)-(\d+)\.png$'
+
+# tile_filler.py
+FILLER_MASK_IMAGE = ('.bmp', '.gif', '.png')
+FILLER_MASK_ROW_SEPARATOR = '/'
+FILLER_MASK_TILE = '#'
+FILLER_MASK_TILE_VALUE = 255                                    # mask image pixel value of a grid position with a tile
+
+# events.py
+EVENT_LOG_VAR = 'DZI_BUILDER_EVENT_LOG'
+EVENT_STDERR_LIMIT = 4000
+
+# benchmark/fixtures.py
+BENCH_LAYER_NAMES = ['base', 'roads', 'labels', 'rivers', 'borders', 'grid', 'forests', 'cities']
+
+# benchmark/run.py
+BENCH_RESULTS = 'benchmark.json'
+
+# deploy.py
+DEPLOY_INDEX = 'deploy.json'
+DEPLOY_LEVEL_PATTERN = r'_files/\d+$'
+DEPLOY_PUSH_LIST = 'deploy-push.txt'
+DEPLOY_REMOVE_LIST = 'deploy-remove.txt'
+DEPLOY_TARBALL = 'deploy.tar.gz'
+
+# server/tile_server.py
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+SERVER_TILE_PATTERN = r'^/dzi/(.+)_files/(\d+)/(\d+_\d+)\.(\w+)$'
@@ -0,0 +1,97 @@
+import os
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.constants import (
+    DEDUP_HARDLINK,
+    DEDUP_MANIFEST
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count,
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    get_pyramid_tiles
+)
+
+from dzi_builder.core.toolkit import (
+    get_layer_meta,
+    hash_file,
+    update_layer_meta
+)
+
+
+def dedupe_pyramid(dzi_path, layer, mode=DEDUP_HARDLINK, verbose=False):
+    """
+    Finds byte-identical tiles in a layer's pyramid (e.g., filler ocean, or empty tiles of a transparent layer), and
+    stores each unique tile once. Every tile is hashed, and the first tile with a given hash is kept; duplicates are
+    then handled by mode:
+
+        DEDUP_HARDLINK      each duplicate is replaced with a hardlink to the kept tile; the folder layout is unchanged,
+                            so the viewer needs nothing further, but duplicates still count as files on upload
+        DEDUP_MANIFEST      each duplicate is removed, and recorded as an alias of the kept tile in the layer's
+                            metadata; make_openseadragon_html() then generates a tile source which requests the kept
+                            tile in its place
+
+    If a hardlink can't be created (e.g., the file system doesn't support them), the duplicate is left in place.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param mode:            str, optional       DEDUP_HARDLINK or DEDUP_MANIFEST
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                dict                count of tiles, unique tiles, and bytes saved
+    """
+    pyramid_tiles = get_pyramid_tiles(dzi_path, layer)
+
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        tile_hashes = dict(zip(pyramid_tiles, pool.map(hash_file, pyramid_tiles.values())))
+
+    kept_tiles = {}
+    aliases = get_layer_meta(dzi_path, layer).get('aliases', {})     # aliases removed by an earlier run still apply
+    bytes_saved = 0
+
+    for tile_key, tile_file in pyramid_tiles.items():
+        kept_key = kept_tiles.setdefault(tile_hashes[tile_key], tile_key)
+        if kept_key == tile_key:
+            continue
+
+        kept_file = pyramid_tiles[kept_key]
+        tile_size = os.path.getsize(tile_file)
+        if mode == DEDUP_MANIFEST:
+            os.remove(tile_file)
+            aliases.setdefault(kept_key, []).append(tile_key)
+            bytes_saved += tile_size
+        elif not os.path.samefile(kept_file, tile_file):          # skips tiles linked by an earlier run
+            try:
+                os.link(kept_file, tile_file + '.tmp')
+                os.replace(tile_file + '.tmp', tile_file)
+                bytes_saved += tile_size
+            except OSError:
+                pass
+
+    if mode == DEDUP_MANIFEST:
+        update_layer_meta(dzi_path, layer, aliases=aliases or None)
+
+    print('{}: {} tiles, {} unique, {} bytes saved'.format(
+        layer, len(pyramid_tiles), len(kept_tiles), bytes_saved)) if verbose else None
+
+    return {'tiles': len(pyramid_tiles), 'unique': len(kept_tiles), 'bytes_saved': bytes_saved}
+
+
+def dedupe_pyramids(dzi_path, layer_list, mode=DEDUP_HARDLINK, jobs=1, max_memory=0, verbose=False):
+    """
+    Runs dedupe_pyramid() for every layer name provided.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param mode:            str, optional       DEDUP_HARDLINK or DEDUP_MANIFEST
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    run_layer_jobs(dedupe_pyramid, layer_list, jobs, max_memory, dzi_path=dzi_path, mode=mode, verbose=verbose)
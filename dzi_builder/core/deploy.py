@@ -0,0 +1,171 @@
+import json
+import os
+import re
+import tarfile
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.constants import (
+    DEPLOY_INDEX,
+    DEPLOY_LEVEL_PATTERN,
+    DEPLOY_PUSH_LIST,
+    DEPLOY_REMOVE_LIST,
+    DEPLOY_TARBALL
+)
+
+from dzi_builder.core.events import (
+    emit_event
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count
+)
+
+from dzi_builder.core.toolkit import (
+    create_file,
+    hash_file
+)
+
+
+def build_hash_index(html_path, previous=None):
+    """
+    Returns a content hash of every file in a generated site, keyed by its path relative to html_path, with the size
+    and modification time it was hashed at; the modification time of every folder is kept too:
+
+        {'files': {'dzi/base_files/12/3_4.jpg': [size, mtime_ns, hash], ...}, 'dirs': {'dzi/base_files/12': mtime_ns}}
+
+    Given the previous index, files are only hashed if new, or if their size or modification time has changed.
+    Pyramid tiles are only ever written by replacing or linking the file, which touches its level folder, so a level
+    folder whose modification time hasn't changed is skipped without reading its tiles at all. Files to hash are
+    hashed in a pool of threads.
+
+    :param html_path:       str, required       html folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\'
+    :param previous:        dict, optional      index of the previous build, from read_hash_index()
+    :return:                dict                hash index
+    """
+    previous = previous or {'files': {}, 'dirs': {}}
+    previous_files = {}
+    for path, entry in previous['files'].items():
+        previous_files.setdefault(os.path.dirname(path), {})[path] = entry
+
+    index = {'files': {}, 'dirs': {}}
+    to_hash = {}
+    for folder, folders, files in os.walk(html_path):
+        folders.sort()
+        rel_folder = os.path.relpath(folder, html_path).replace(os.sep, '/')
+        rel_folder = '' if rel_folder == '.' else rel_folder
+        index['dirs'][rel_folder] = os.stat(folder).st_mtime_ns
+
+        unchanged = previous['dirs'].get(rel_folder) == index['dirs'][rel_folder]
+        if unchanged and re.search(DEPLOY_LEVEL_PATTERN, rel_folder):
+            index['files'].update(previous_files.get(rel_folder, {}))
+            continue
+
+        for file_name in files:
+            path = (rel_folder + '/' + file_name).lstrip('/')
+            file_stat = os.stat(os.path.join(folder, file_name))
+            entry = previous['files'].get(path)
+            if entry and entry[:2] == [file_stat.st_size, file_stat.st_mtime_ns]:
+                index['files'][path] = entry
+            else:
+                index['files'][path] = [file_stat.st_size, file_stat.st_mtime_ns, None]
+                to_hash[path] = os.path.join(folder, file_name)
+
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        for path, file_hash in zip(to_hash, pool.map(hash_file, to_hash.values())):
+            index['files'][path][2] = file_hash
+
+    return index
+
+
+def diff_hash_index(previous, current):
+    """
+    Compares two hash indexes, from build_hash_index(), and returns the files added, changed and removed between them,
+    as sorted paths relative to the html folder.
+
+    :param previous:        dict, required      index of the previous build
+    :param current:         dict, required      index of the current build
+    :return:                dict                'added', 'changed' and 'removed' lists of paths
+    """
+    previous_files, current_files = previous['files'], current['files']
+
+    return {
+        'added': sorted(p for p in current_files if p not in previous_files),
+        'changed': sorted(p for p in current_files if p in previous_files and
+                          previous_files[p][2] != current_files[p][2]),
+        'removed': sorted(p for p in previous_files if p not in current_files)
+    }
+
+
+def make_deploy(layer_path, tarball=False, dry_run=False, verbose=False):
+    """
+    Works out what needs publishing after a rebuild: compares the site in layer_path's html/ folder against the hash
+    index of the previous build (see build_hash_index()), and writes the files to push, and to remove, as lists of
+    paths relative to html/:
+
+        layers/deploy-push.txt      files added or changed since the previous build
+        layers/deploy-remove.txt    files removed since the previous build
+
+    If tarball is True, the files to push are also packed into layers/deploy.tar.gz, laid out as in html/. Unless
+    dry_run is True, the new index is then stored in layers/deploy.json, for the next build to compare against. With
+    no previous index, every file is added.
+
+    Hashing scales with the files that changed, not the size of the site, and publishing with the length of the push
+    list; everything else is byte-identical to what was published last.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param tarball:         bool, optional      if True, packs the files to push into a tarball
+    :param dry_run:         bool, optional      if True, doesn't store the new index
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                dict                'added', 'changed' and 'removed' lists of paths
+    """
+    html_path = layer_path + 'html\\'
+    previous = read_hash_index(layer_path)
+    current = build_hash_index(html_path, previous)
+    changes = diff_hash_index(previous, current)
+    push_files = changes['added'] + changes['changed']
+
+    create_file(layer_path, DEPLOY_PUSH_LIST, ''.join(p + '\n' for p in push_files))
+    create_file(layer_path, DEPLOY_REMOVE_LIST, ''.join(p + '\n' for p in changes['removed']))
+    if tarball:
+        with tarfile.open(layer_path + DEPLOY_TARBALL, 'w:gz') as tar:
+            for path in push_files:
+                tar.add(os.path.join(html_path, *path.split('/')), arcname=path)
+    if not dry_run:
+        write_hash_index(layer_path, current)
+
+    emit_event('deploy', added=len(changes['added']), changed=len(changes['changed']),
+               removed=len(changes['removed']), files=len(current['files']))
+    print('{} added, {} changed, {} removed, of {} files'.format(
+        len(changes['added']), len(changes['changed']), len(changes['removed']), len(current['files'])
+    )) if verbose else None
+
+    return changes
+
+
+def read_hash_index(layer_path):
+    """
+    Returns the hash index stored by write_hash_index(), or an empty index if there isn't one.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :return:                dict                hash index, as of the previous build
+    """
+    try:
+        with open(layer_path + DEPLOY_INDEX) as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {'files': {}, 'dirs': {}}
+
+
+def write_hash_index(layer_path, index):
+    """
+    Stores a hash index, from build_hash_index(), for make_deploy() to compare the next build against. The index is
+    kept in layer_path, outside of html/, so it's never published.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param index:           dict, required      hash index
+    :return:                none
+    """
+    create_file(layer_path, DEPLOY_INDEX, json.dumps(index, separators=(',', ':'), sort_keys=True))
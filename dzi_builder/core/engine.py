@@ -0,0 +1,49 @@
+from dzi_builder.core.constants import (
+    ENGINE_GRID,
+    ENGINE_NUMPY,
+    ENGINE_PYVIPS,
+    ENGINE_SUBPROCESS
+)
+
+from dzi_builder.core.numpy_engine import (
+    np
+)
+
+from dzi_builder.core.pyramid import (
+    Image
+)
+
+from dzi_builder.core.pyvips_engine import (
+    pyvips
+)
+
+
+def resolve_engine(engine, verbose=False):
+    """
+    Given a requested engine, returns the engine that will actually be used:
+
+        ENGINE_SUBPROCESS   runs vips.exe from vips_path; always available
+        ENGINE_PYVIPS       runs libvips in-process; requires pyvips
+        ENGINE_GRID         builds the pyramid straight from the artboard tile grid; requires Pillow
+        ENGINE_NUMPY        builds the pyramid from a memory-mapped canvas on disk; requires NumPy and Pillow
+
+    If the requested engine's library can't be imported (see the pyvips issues listed in combine_transparent_layer()),
+    falls back to ENGINE_SUBPROCESS.
+
+    :param engine:          str, required       ENGINE_SUBPROCESS, ENGINE_PYVIPS, ENGINE_GRID or ENGINE_NUMPY
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                str                 engine to be used
+    """
+    if engine == ENGINE_PYVIPS and pyvips is None:
+        print('pyvips could not be imported; falling back to vips subprocess.') if verbose else None
+        return ENGINE_SUBPROCESS
+
+    if engine == ENGINE_GRID and Image is None:
+        print('Pillow could not be imported; falling back to vips subprocess.') if verbose else None
+        return ENGINE_SUBPROCESS
+
+    if engine == ENGINE_NUMPY and (np is None or Image is None):
+        print('NumPy or Pillow could not be imported; falling back to vips subprocess.') if verbose else None
+        return ENGINE_SUBPROCESS
+
+    return engine
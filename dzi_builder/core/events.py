@@ -0,0 +1,227 @@
+import json
+import os
+import platform
+import subprocess
+import time
+
+from contextlib import (
+    contextmanager
+)
+
+try:
+    import resource
+except ImportError:                                             # not available on Windows
+    resource = None
+
+from dzi_builder.core.constants import (
+    EVENT_LOG_VAR,
+    EVENT_STDERR_LIMIT
+)
+
+event_hooks = []
+open_stages = {}                                                # running peak RSS of each stage being tracked
+
+
+def add_event_hook(hook):
+    """
+    Registers a function to be called with every event emitted by emit_event(), as a dict, e.g.:
+
+        {'event': 'stage_end', 'stage': 'make_image_pyramid', 'seconds': 512.3, 'peak_rss_mb': 210.5, ...}
+
+    Events emitted in layer job worker processes are passed to hooks once each layer has finished; see
+    run_layer_jobs().
+
+    :param hook:            function, required  function taking a single event dict
+    :return:                none
+    """
+    event_hooks.append(hook)
+
+
+def dispatch_event(event):
+    """
+    Calls every registered hook with an event; see add_event_hook().
+
+    :param event:           dict, required      event, as built by emit_event()
+    :return:                none
+    """
+    for hook in list(event_hooks):
+        hook(event)
+
+
+def emit_event(event_type, **fields):
+    """
+    Emits an event: appends it, as a line of JSON, to the event log if one is set (see set_event_log()), and passes it
+    to every registered hook. Every event records its type, time, and the id of the process it was emitted in.
+
+    :param event_type:      str, required       type of event, e.g. 'stage_start', 'stage_end' or 'command'
+    :param fields:          optional            fields of event, e.g. stage='make_image_pyramid', layer='base'
+    :return:                dict                event
+    """
+    event = dict(event=event_type, time=round(time.time(), 3), pid=os.getpid(), **fields)
+
+    log_path = os.environ.get(EVENT_LOG_VAR)
+    if log_path:
+        with open(log_path, 'a') as event_log:
+            event_log.write(json.dumps(event) + '\n')
+
+    dispatch_event(event)
+
+    return event
+
+
+def events_enabled():
+    """
+    Returns True if any event would be recorded, i.e. an event log is set or a hook is registered; stage tracking skips
+    measuring byte counts and memory otherwise.
+
+    :return:                bool                True if events are recorded
+    """
+    return bool(event_hooks) or bool(os.environ.get(EVENT_LOG_VAR))
+
+
+def get_path_size(paths):
+    """
+    Returns the total size in bytes of the given files and folders, including subfolders; missing paths count as 0.
+
+    :param paths:           list, required      file or folder paths
+    :return:                int                 total bytes
+    """
+    total_bytes = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total_bytes += os.path.getsize(path)
+        for folder, _, files in os.walk(path):
+            total_bytes += sum(os.path.getsize(os.path.join(folder, f)) for f in files)
+
+    return total_bytes
+
+
+def get_peak_memory():
+    """
+    Returns the peak resident set size, in MB, of this process (since the last reset_peak_memory()), and of the largest
+    finished child process (vips, ImageMagick, or a layer job worker). Returns 0 for both where resource isn't
+    available.
+
+    :return:                float               peak RSS of this process, in MB
+                            float               peak RSS of the largest child process, in MB
+    """
+    if resource is None:
+        return 0.0, 0.0
+
+    divisor = 1024 * 1024 if platform.system() == 'Darwin' else 1024       # ru_maxrss is bytes on macOS, KB elsewhere
+
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    )
+
+
+def remove_event_hook(hook):
+    """
+    Unregisters a function registered with add_event_hook(); does nothing if it isn't registered.
+
+    :param hook:            function, required  function taking a single event dict
+    :return:                none
+    """
+    if hook in event_hooks:
+        event_hooks.remove(hook)
+
+
+def reset_peak_memory():
+    """
+    Resets the peak RSS of this process, so the next stage is measured on its own; only possible on Linux. The peak
+    of child processes can't be reset, so it is the largest child so far.
+
+    :return:                none
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def run_command(command, cwd=None, shell=False, layer=None, verbose=False):
+    """
+    Runs a vips or ImageMagick command, capturing its output, and emits a 'command' event with its exit code, duration
+    and stderr (truncated to EVENT_STDERR_LIMIT characters). If verbose, prints its stdout, and its stderr if it fails.
+
+    :param command:         str, required       command to run, e.g. 'vips dzsave ...'
+    :param cwd:             str, optional       folder to run command in, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param shell:           bool, optional      if True, runs command through the shell
+    :param layer:           str, optional       name of layer command is run for, e.g. 'base'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                CompletedProcess    result of command
+    """
+    start = time.perf_counter()
+    sp_out = subprocess.run(command, cwd=cwd, shell=shell, capture_output=True, text=True)
+
+    emit_event('command', command=command, layer=layer, exit_code=sp_out.returncode,
+               seconds=round(time.perf_counter() - start, 3), stderr=(sp_out.stderr or '')[-EVENT_STDERR_LIMIT:])
+
+    print(sp_out.stdout) if verbose and sp_out.stdout else None
+    print(sp_out.stderr) if verbose and sp_out.returncode else None
+
+    return sp_out
+
+
+def set_event_log(log_path):
+    """
+    Sets the JSON-lines file events are appended to, e.g. 'C:\\path\\to\\build.jsonl'; if None, stops logging. The
+    path is kept in an environment variable, so layer job worker processes log to the same file.
+
+    :param log_path:        str, required       path to event log, or None
+    :return:                none
+    """
+    if log_path:
+        os.environ[EVENT_LOG_VAR] = log_path
+    else:
+        os.environ.pop(EVENT_LOG_VAR, None)
+
+
+@contextmanager
+def track_stage(stage, layer=None, inputs=None, outputs=None):
+    """
+    Context manager emitting a 'stage_start' event on entry, and a 'stage_end' event on exit, with the stage's duration,
+    peak memory (see get_peak_memory()), byte counts of its inputs and outputs, and the exception raised, if any:
+
+        with track_stage('make_image_pyramid', inputs=[layer_path + 'base.png'], outputs=[dzi_path + 'base_files']):
+            ...
+
+    Stages may be nested (e.g. 'build_pyramids' around each layer's job) or run in several threads at once: the peak
+    RSS of this process is reset as each stage starts, but only once every stage still open has been credited with
+    the peak so far, so an enclosing stage reports the peak over its whole run.
+
+    Does nothing if no event would be recorded; see events_enabled().
+
+    :param stage:           str, required       name of stage, e.g. 'make_image_pyramid'
+    :param layer:           str, optional       name of layer, if stage is for a single layer
+    :param inputs:          list, optional      files or folders read by stage, measured on entry
+    :param outputs:         list, optional      files or folders written by stage, measured on exit
+    :return:                none
+    """
+    if not events_enabled():
+        yield
+        return
+
+    emit_event('stage_start', stage=stage, layer=layer, bytes_in=get_path_size(inputs or []))
+    peak_rss = get_peak_memory()[0]
+    for open_key in list(open_stages):                          # credits enclosing stages before the peak is reset
+        open_stages[open_key] = max(open_stages[open_key], peak_rss)
+    reset_peak_memory()
+    stage_key = object()
+    open_stages[stage_key] = 0.0
+    start = time.perf_counter()
+    error = None
+
+    try:
+        yield
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        peak_rss, peak_rss_children = get_peak_memory()
+        peak_rss = max(open_stages.pop(stage_key), peak_rss)
+        emit_event('stage_end', stage=stage, layer=layer, seconds=round(time.perf_counter() - start, 3),
+                   peak_rss_mb=round(peak_rss, 1), peak_rss_children_mb=round(peak_rss_children, 1),
+                   bytes_out=get_path_size(outputs or []), error=error)
@@ -2,6 +2,13 @@ from win32com.client import Dispatch, GetActiveObject, pywintypes
 import os
 import time
 
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    get_catalog_tiles,
+    remove_catalog_tiles,
+    update_tile_catalog
+)
+
 from dzi_builder.core.constants import (
     LAYERS_FOLDER
 )
@@ -14,8 +21,6 @@ from dzi_builder.javascript.illustrator_js import (
 from dzi_builder.core.toolkit import (
     create_folder,
     convert_path_to_js,
-    get_file_list,
-    get_layer_list,
     prefix_path_to_list
 )
 
@@ -80,22 +85,23 @@ def create_artboards(app, doc, file_path, width, height=0.0, transparent_png=Tru
     doc.Close()
 
 
-def ai_to_svg(app, file_path, verbose=False):
+def ai_to_svg(app, file_path, catalog=None, verbose=False):
     """
-    Given a path to a folder, converts all files with the .ai extension into SVG files.
+    Given a path to a folder, converts all files with the .ai extension into SVG files, and updates catalog to match.
 
     :param app:             COM obj, required   reference to Illustrator (type win32com.client.CDispatch)
     :param file_path:       str, required       path to Illustrator file, e.g. 'C:\\path\\to\\file.ai'
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, file_path is listed
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                none
     """
     print('Creating tile conversion prep list...') if verbose else None
-    output_list = get_file_list(file_path)
-    rem_list_pre = [l for l in output_list if l.find('-') == -1]
+    catalog = build_tile_catalog(file_path, headers=False) if catalog is None else catalog
+    rem_list_pre = [l for l in catalog['files'] if l.find('-') == -1]
+    tile_list_pre = [t for t in get_catalog_tiles(catalog) if t.endswith('.ai')]
 
     rem_list = prefix_path_to_list(file_path, rem_list_pre)
-    tile_list_pre = prefix_path_to_list(file_path, output_list)
-    tile_list = [f for f in tile_list_pre if f not in rem_list]
+    tile_list = prefix_path_to_list(file_path, tile_list_pre)
 
     [os.remove(r) for r in rem_list]                            # unsure why illustrator creates these, but, unneeded
 
@@ -111,6 +117,9 @@ def ai_to_svg(app, file_path, verbose=False):
         os.remove(t)
         time.sleep(2)                                           # prevents illustrator overloading memory on large files
 
+    svg_list = [os.path.splitext(t)[0] + '.svg' for t in tile_list_pre]
+    update_tile_catalog(catalog, rem_list_pre + tile_list_pre + svg_list, headers=False)
+
 
 def generate_tiles(file_path, tile_width, transparency, verbose=False):
     """
@@ -118,24 +127,25 @@ def generate_tiles(file_path, tile_width, transparency, verbose=False):
 
     Where the target Illustrator file lives, a folder 'layers' (or whatever you set LAYERS_FOLDER constant
     to) will be created, if it does not exist, to house the output tile images. All further image manipulation
-    will be done in this folder.
+    will be done in this folder. Tiles left there by an earlier run are removed first; see remove_catalog_tiles().
 
     :param file_path:       str, required       path to Illustrator file, e.g. 'C:\\path\\to\\file.ai'
     :param tile_width:      float, required     width of output tiles
     :param transparency:    bool, required      if True, tiles are generated with transparency in negative space
     :param verbose:         bool, optional      if True, prints out details of task
-    :return:                list                list of layer names
+    :return:                dict                tile catalog of the tiles generated; see build_tile_catalog()
     """
     tile_path = create_folder(file_path, LAYERS_FOLDER)
+    remove_catalog_tiles(tile_path)
 
     app = get_illustrator()
     doc = open_illustrator_file(app, file_path)
     create_artboards(app=app, doc=doc, file_path=tile_path, width=tile_width, transparent_png=transparency)
-    layer_name_list = get_layer_list(tile_path)
+    catalog = build_tile_catalog(tile_path)
 
     if not transparency:
-        ai_to_svg(app, tile_path, verbose=verbose)
+        ai_to_svg(app, tile_path, catalog, verbose=verbose)
 
     app.Quit()
 
-    return layer_name_list
+    return catalog
@@ -1,4 +1,10 @@
-import subprocess
+from dzi_builder.core.events import (
+    run_command
+)
+
+from dzi_builder.core.parallel import (
+    run_layer_jobs
+)
 
 
 def convert_tiles(layer_path, width, height=0, verbose=False):
@@ -23,16 +29,15 @@ def convert_tiles(layer_path, width, height=0, verbose=False):
     h = width if height == 0 else height
 
     mogrify = 'mogrify -format png -size {}x{} {}*.svg -verbose'.format(width, h, layer_path)
-    sp_out = subprocess.run(mogrify, capture_output=verbose, text=verbose)
-    print(sp_out.stdout) if verbose else None
+    run_command(mogrify, verbose=verbose)
 
 
-def combine_tiles(layer_path, layers, width, columns, height=0, verbose=False):
+def combine_layer_tiles(layer_path, layer, width, columns, height=0, verbose=False):
     """
-    Combine all individual png layer tiles into a master png file named after the layer.
+    Runs montage for a single layer; see combine_tiles().
 
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
-    :param layers:          list, required      list of layer names generated by generate_tiles()
+    :param layer:           str, required       name of layer, e.g. 'base'
     :param width:           int, required       width of output tile
     :param columns:         int, required       number of columns in tile grid to montage
     :param height:          int, optional       height of output tile; if 0, height is equal to length
@@ -40,12 +45,28 @@ def combine_tiles(layer_path, layers, width, columns, height=0, verbose=False):
     :return:                none
     """
     h = width if height == 0 else height
-    for layer in layers:
-        print('Begin combining {}.'.format(layer)) if verbose else None
+    print('Begin combining {}.'.format(layer)) if verbose else None
+
+    montage = 'montage -density 300 -tile {0}x0 -size {1}x{2} -geometry +0+0 -border 0 {3}{4}-*.png {3}{4}.png'\
+        .format(columns, width, h, layer_path, layer)
+    run_command(montage, layer=layer, verbose=verbose)
 
-        montage = 'montage -density 300 -tile {0}x0 -size {1}x{2} -geometry +0+0 -border 0 {3}{4}*.png {3}{4}.png'\
-            .format(columns, width, h, layer_path, layer)
-        sp_out = subprocess.run(montage, capture_output=verbose, text=verbose)
-        print(sp_out.stdout) if verbose else None
+    print('Complete combining {}.'.format(layer)) if verbose else None
+
+
+def combine_tiles(layer_path, layers, width, columns, height=0, jobs=1, max_memory=0, verbose=False):
+    """
+    Combine all individual png layer tiles into a master png file named after the layer.
 
-        print('Complete combining {}.'.format(layer)) if verbose else None
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layers:          list, required      list of layer names generated by generate_tiles()
+    :param width:           int, required       width of output tile
+    :param columns:         int, required       number of columns in tile grid to montage
+    :param height:          int, optional       height of output tile; if 0, height is equal to length
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param verbose:         bool, optional      if True, prints out any montage errors
+    :return:                none
+    """
+    run_layer_jobs(combine_layer_tiles, layers, jobs, max_memory, layer_path=layer_path, width=width,
+                   columns=columns, height=height, verbose=verbose)
@@ -0,0 +1,141 @@
+import json
+import os
+import re
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.catalog import (
+    filter_layer_tiles
+)
+
+from dzi_builder.core.constants import (
+    BUILD_MANIFEST,
+    SOURCE_TILE_PATTERN
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count
+)
+
+from dzi_builder.core.toolkit import (
+    create_file,
+    get_file_list,
+    hash_file
+)
+
+
+def get_changed_layers(layer_path, dzi_path, layer_inputs, verbose=False):
+    """
+    Compares the inputs of each layer against the build manifest of the previous run, and returns the layers which need
+    to be rebuilt; that is, any layer whose source tiles or build parameters have changed, which wasn't built before,
+    or whose .dzi file is missing. Every other layer's pyramid is left alone.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_inputs:    dict, required      inputs of each layer, as returned by get_layer_inputs()
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                list                list of layer names to rebuild
+    """
+    built_inputs = read_build_manifest(layer_path)
+    changed_layers = []
+
+    for layer, inputs in layer_inputs.items():
+        if built_inputs.get(layer) != inputs or not os.path.isfile(dzi_path + layer + '.dzi'):
+            changed_layers.append(layer)
+        else:
+            print('{} unchanged; skipping'.format(layer)) if verbose else None
+
+    return changed_layers
+
+
+def get_changed_tiles(layer_path, dzi_path, layer_inputs, layer_list):
+    """
+    Of the given (changed) layers, returns those which can be patched in place with patch_layer_pyramid(), rather
+    than rebuilt, along with the indices of their changed artboard tiles; that is, layers whose pyramid exists, and
+    whose build parameters and set of tiles are unchanged since the last build:
+
+        {'base': [4, 11], ...}
+
+    Indices are positions in the artboard grid, with tiles in tile number order (see filter_layer_tiles()), so
+    base-1000.png follows base-999.png, as in build_tile_grid().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_inputs:    dict, required      inputs of each layer, as returned by get_layer_inputs()
+    :param layer_list:      list, required      list of changed layer names, from get_changed_layers()
+    :return:                dict                indices of changed artboard tiles keyed by layer
+    """
+    built_inputs = read_build_manifest(layer_path)
+    layer_changes = {}
+
+    for layer in layer_list:
+        inputs, built = layer_inputs[layer], built_inputs.get(layer)
+        if not built or built['params'] != inputs['params'] or sorted(built['tiles']) != sorted(inputs['tiles']):
+            continue
+        if not os.path.isfile(dzi_path + layer + '.dzi'):
+            continue
+
+        suffix = os.path.splitext(min(inputs['tiles']))[1][1:] if inputs['tiles'] else 'png'
+        tile_names = filter_layer_tiles(list(inputs['tiles']), layer, suffix)     # in grid order, as build_tile_grid()
+        layer_changes[layer] = [i for i, t in enumerate(tile_names) if built['tiles'][t] != inputs['tiles'][t]]
+
+    return layer_changes
+
+
+def get_layer_inputs(layer_path, layer_list, build_params, catalog=None):
+    """
+    Returns everything a layer's pyramid depends on: the content hash of each of its source tiles, and the build
+    parameters (e.g. col, row, offset_right, transparency) the pyramid is generated with:
+
+        {'base': {'params': {'col': 3, ...}, 'tiles': {'base-000.png': '9f86d0...', ...}}, ...}
+
+    Filler tiles are links to, or copies of, real tiles, so a change of filler is picked up by the tile hashes.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param build_params:    dict, required      build parameters shared by every layer
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :return:                dict                inputs of each layer
+    """
+    tile_list = catalog['files'] if catalog else get_file_list(layer_path)
+    layer_tiles = {
+        layer: sorted([t for t in tile_list if re.match(SOURCE_TILE_PATTERN.format(re.escape(layer)), t)])
+        for layer in layer_list
+    }
+    source_tiles = [t for tiles in layer_tiles.values() for t in tiles]
+
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        tile_hashes = dict(zip(source_tiles, pool.map(hash_file, [layer_path + t for t in source_tiles])))
+
+    return {
+        layer: {'params': build_params, 'tiles': {t: tile_hashes[t] for t in tiles}}
+        for layer, tiles in layer_tiles.items()
+    }
+
+
+def read_build_manifest(layer_path):
+    """
+    Returns the build manifest written by write_build_manifest(), or an empty dict if there isn't one.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :return:                dict                inputs of each layer, as of the last build
+    """
+    try:
+        with open(layer_path + BUILD_MANIFEST) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_build_manifest(layer_path, layer_inputs):
+    """
+    Records the inputs of each layer once its pyramid has been built, for get_changed_layers() to compare against on
+    the next run. Layers which no longer exist are dropped from the manifest.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_inputs:    dict, required      inputs of each layer, as returned by get_layer_inputs()
+    :return:                none
+    """
+    create_file(layer_path, BUILD_MANIFEST, json.dumps(layer_inputs, indent=4, sort_keys=True))
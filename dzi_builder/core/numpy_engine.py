@@ -0,0 +1,250 @@
+import os
+import shutil
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from dzi_builder.core.constants import (
+    CANVAS_CHUNK_BYTES,
+    CANVAS_CHUNK_ROWS,
+    CANVAS_CHUNK_SHARE,
+    DZI_OVERLAP,
+    DZI_TILE_SIZE,
+    TILE_SUFFIXES
+)
+
+from dzi_builder.core.catalog import (
+    get_catalog_tiles
+)
+
+from dzi_builder.core.parallel import (
+    get_memory_budget,
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    Image,
+    build_tile_grid,
+    get_crop_bounds,
+    get_empty_runs,
+    get_grid_tile_size,
+    get_level_count,
+    get_level_folder,
+    get_level_size,
+    remove_pyramid,
+    write_dzi,
+    write_level
+)
+
+from dzi_builder.core.tile_format import (
+    get_tile_format
+)
+
+from dzi_builder.core.toolkit import (
+    get_file_list,
+    update_layer_meta
+)
+
+
+def build_layer_pyramid_numpy(layer_path, layer, tile_list, col, row, dzi_path, skip_empty=False, tile_format=None,
+                              crop=False, verbose=False):
+    """
+    Generates a Deep Zoom Image for a single layer with NumPy and Pillow. The layer's artboard tiles are stitched into
+    a memory-mapped RGBA canvas on disk, which is tiled in place; each coarser level is then downsampled into a new,
+    half-size canvas (see halve_canvas()), and the level before it is discarded. Only the canvas being read and the one
+    being written are on disk at once, and only a chunk of rows of either is in memory, sized to the job's memory
+    budget; see get_chunk_rows().
+
+    Output matches the folder layout and .dzi descriptor written by dzsave. In a lossless tile format (png, or WebP at
+    quality 100), tiles also match those written by build_pyramid_from_grid(), pixel for pixel; in a lossy format
+    (e.g. JPEG, the default for opaque layers), they differ within the codec's error, as build_pyramid_from_grid()
+    halves each level from the decoded tiles of the level below, and this engine from the exact canvas. A layer
+    cropped to its content (see get_crop_bounds()) is stitched only over its content.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of files in layer_path
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list including layer, crops layer to its content
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Generating pyramid for {}...'.format(layer)) if verbose else None
+    tile_grid = build_tile_grid(layer_path, layer, col, tile_list)
+    layer_format = get_tile_format(tile_format, layer, list(tile_grid.values()))
+    suffix = TILE_SUFFIXES[layer_format['format']]
+    tile_width, tile_height = get_grid_tile_size(tile_grid)
+    bounds = get_crop_bounds(tile_grid, layer, crop, col, row)
+    left, top, right, bottom = bounds or (0, 0, col * tile_width, row * tile_height)
+    width, height = right - left, bottom - top
+    level_count = get_level_count(width, height)
+    empty_runs = {}
+
+    remove_pyramid(dzi_path, layer)
+    canvas_folder = tempfile.mkdtemp(prefix=layer + '-', dir=layer_path)
+
+    try:
+        canvas = stitch_canvas(tile_grid, tile_width, tile_height, width, height, canvas_folder, bounds)
+
+        for level in range(level_count - 1, -1, -1):
+            print('...{} level {}'.format(layer, level)) if verbose else None
+            level_width, level_height = get_level_size(width, height, level, level_count)
+
+            empty_tiles = write_level(make_canvas_strip_reader(canvas), get_level_folder(dzi_path, layer, level),
+                                      level_width, level_height, DZI_TILE_SIZE, DZI_OVERLAP, suffix, skip_empty,
+                                      layer_format)
+            if empty_tiles:
+                empty_runs[str(level)] = get_empty_runs(empty_tiles)
+
+            if level:
+                canvas_file = canvas.filename
+                canvas = halve_canvas(canvas, canvas_folder, level - 1)     # unmaps the level above, so it can go
+                os.remove(canvas_file)
+
+        canvas = None
+
+    finally:
+        shutil.rmtree(canvas_folder, ignore_errors=True)
+
+    write_dzi(dzi_path, layer, width, height, suffix=suffix)
+    update_layer_meta(dzi_path, layer, empty=empty_runs or None, tile_format=layer_format,
+                      bounds=list(bounds) if bounds else None,
+                      canvas=[col * tile_width, row * tile_height] if bounds else None)
+
+
+def build_pyramids_numpy(layer_path, layer_list, col, row, dzi_path, jobs=1, max_memory=0, skip_empty=False,
+                         tile_format=None, crop=False, catalog=None, verbose=False):
+    """
+    Runs build_layer_pyramid_numpy() for every layer name provided, in place of combine_transparent_layer() and
+    make_image_pyramid(); no vips or ImageMagick install is needed.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list of layer names, crops layers to their content
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tile_list = get_catalog_tiles(catalog, layer_list) if catalog else get_file_list(layer_path)
+    run_layer_jobs(build_layer_pyramid_numpy, layer_list, jobs, max_memory, layer_path=layer_path,
+                   tile_list=tile_list, col=col, row=row, dzi_path=dzi_path, skip_empty=skip_empty,
+                   tile_format=tile_format, crop=crop, verbose=verbose)
+
+
+def get_chunk_rows(width, memory=None):
+    """
+    Returns how many output rows of a canvas halve_canvas() processes at once: as many as fit in 1/CANVAS_CHUNK_SHARE
+    of the memory budget, at CANVAS_CHUNK_BYTES per output pixel (two input rows, widened to 32 bits per channel for
+    the filter, and its temporaries), up to CANVAS_CHUNK_ROWS. e.g., halving to an 18,000 pixel wide canvas:
+
+        8000 MB budget      -->     256 rows, ~700 MB
+        1000 MB budget      -->     91 rows, ~250 MB
+
+    :param width:           int, required       width of the halved canvas
+    :param memory:          int, optional       memory budget in MB; if None, the job's budget (see get_memory_budget())
+    :return:                int                 count of rows
+    """
+    memory = get_memory_budget() if memory is None else memory
+    if not memory:
+        return CANVAS_CHUNK_ROWS
+
+    return max(1, min(CANVAS_CHUNK_ROWS, memory * 1024 * 1024 // CANVAS_CHUNK_SHARE // (width * CANVAS_CHUNK_BYTES)))
+
+
+def halve_canvas(canvas, canvas_folder, level, chunk_rows=None):
+    """
+    Downsamples a canvas to half its size (rounded up) with a vectorized 2x2 box filter, into a new memory-mapped
+    canvas, chunk_rows output rows at a time. As with Pillow's Image.reduce(2), colour is averaged premultiplied by
+    alpha, so transparent pixels don't darken the edges of what they surround; at an odd right or bottom edge, the last
+    column or row is repeated, so the edge block is the mean of the pixels it has.
+
+    :param canvas:          numpy.memmap, required  RGBA canvas, of shape (height, width, 4)
+    :param canvas_folder:   str, required       folder for canvas files
+    :param level:           int, required       pyramid level of the halved canvas, used to name its file
+    :param chunk_rows:      int, optional       output rows processed at once; if None, see get_chunk_rows()
+    :return:                numpy.memmap        halved RGBA canvas
+    """
+    height, width = canvas.shape[:2]
+    halved_height, halved_width = (height + 1) // 2, (width + 1) // 2
+    chunk_rows = get_chunk_rows(halved_width) if chunk_rows is None else chunk_rows
+    halved = np.memmap(os.path.join(canvas_folder, '{}.rgba'.format(level)), dtype=np.uint8, mode='w+',
+                       shape=(halved_height, halved_width, 4))
+
+    for top in range(0, halved_height, chunk_rows):
+        bottom = min(top + chunk_rows, halved_height)
+        block = canvas[top * 2:bottom * 2].astype(np.uint32)
+        alpha = block[..., 3:]
+        block[..., :3] = block[..., :3] * alpha + 128                   # premultiply, rounded as Pillow does
+        block[..., :3] = ((block[..., :3] >> 8) + block[..., :3]) >> 8
+
+        if block.shape[0] % 2:
+            block = np.concatenate([block, block[-1:]], axis=0)
+        if block.shape[1] % 2:
+            block = np.concatenate([block, block[:, -1:]], axis=1)
+
+        block = (block[0::2, 0::2] + block[0::2, 1::2] + block[1::2, 0::2] + block[1::2, 1::2] + 2) >> 2
+        alpha = block[..., 3:]
+        colour = np.minimum(block[..., :3] * 255 // np.maximum(alpha, 1), 255)
+        block[..., :3] = np.where((alpha == 0) | (alpha == 255), block[..., :3], colour)
+        halved[top:bottom] = block.astype(np.uint8)
+
+    return halved
+
+
+def make_canvas_strip_reader(canvas):
+    """
+    Returns a read_strip function for write_level() which reads full-width strips of a canvas.
+
+    :param canvas:          numpy.memmap, required  RGBA canvas, of shape (height, width, 4)
+    :return:                function            read_strip(top, bottom) for the canvas
+    """
+    def read_canvas_strip(top, bottom):
+        return Image.fromarray(np.ascontiguousarray(canvas[top:bottom]), 'RGBA')
+
+    return read_canvas_strip
+
+
+def stitch_canvas(tile_grid, tile_width, tile_height, width, height, canvas_folder, bounds=None):
+    """
+    Stitches a grid of artboard tiles into a memory-mapped RGBA canvas on disk; one tile is decoded at a time, and
+    missing grid positions are left transparent. If bounds are given, only that region of the layer is stitched, and
+    tiles outside it are never decoded.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :param tile_width:      int, required       width of artboard tile
+    :param tile_height:     int, required       height of artboard tile
+    :param width:           int, required       width of canvas
+    :param height:          int, required       height of canvas
+    :param canvas_folder:   str, required       folder for canvas files
+    :param bounds:          tuple, optional     (left, top, right, bottom) region of layer to stitch
+    :return:                numpy.memmap        RGBA canvas, of shape (height, width, 4)
+    """
+    left, top, right, bottom = bounds or (0, 0, width, height)
+    canvas = np.memmap(os.path.join(canvas_folder, 'canvas.rgba'), dtype=np.uint8, mode='w+', shape=(height, width, 4))
+
+    for (c, r), tile_file in tile_grid.items():
+        tile_left, tile_top = c * tile_width, r * tile_height
+        if tile_left >= right or tile_top >= bottom or tile_left + tile_width <= left or tile_top + tile_height <= top:
+            continue
+        with Image.open(tile_file) as tile:
+            tile_array = np.asarray(tile.convert('RGBA'))
+        canvas[max(tile_top - top, 0):min(tile_top + tile_height, bottom) - top,
+               max(tile_left - left, 0):min(tile_left + tile_width, right) - left] = \
+            tile_array[max(top - tile_top, 0):min(bottom - tile_top, tile_height),
+                       max(left - tile_left, 0):min(right - tile_left, tile_width)]
+
+    return canvas
@@ -0,0 +1,202 @@
+import io
+import os
+import struct
+import zlib
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.constants import (
+    PNG_KEEP_CHUNKS,
+    PNG_SIGNATURE,
+    PNG_ZLIB_STRATEGIES
+)
+
+from dzi_builder.core.events import (
+    emit_event
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count,
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    Image,
+    get_pyramid_tiles
+)
+
+from dzi_builder.core.toolkit import (
+    get_layer_meta,
+    update_layer_meta
+)
+
+
+def encode_png_pillow(png_data):
+    """
+    Re-encodes a png with Pillow, with adaptive filtering at zlib level 9, once per zlib strategy in
+    PNG_ZLIB_STRATEGIES; an RGBA image with no transparent pixels is written as RGB. Only RGB(A) and greyscale images
+    are re-encoded (and only 8 bit images should be given, as Pillow reads 16 bit RGB as 8 bit); for any other image,
+    nothing is returned.
+
+    :param png_data:        bytes, required     png file content
+    :return:                list                candidate png file contents
+    """
+    with Image.open(io.BytesIO(png_data)) as tile:
+        if tile.mode not in ('RGB', 'RGBA', 'L', 'LA') or 'transparency' in tile.info:
+            return []
+        tile.load()
+        if tile.mode == 'RGBA' and tile.getchannel('A').getextrema()[0] == 255:
+            tile = tile.convert('RGB')
+
+        candidates = []
+        for strategy in PNG_ZLIB_STRATEGIES:
+            buffer = io.BytesIO()
+            tile.save(buffer, format='PNG', optimize=True, compress_type=strategy)
+            candidates.append(buffer.getvalue())
+
+    return candidates
+
+
+def optimize_png(png_data):
+    """
+    Losslessly recompresses a png, returning the smallest of several encodings, or None if none is smaller than the
+    original:
+
+        the original filtered scanlines, deflated again at zlib level 9 with each strategy in PNG_ZLIB_STRATEGIES
+        a re-encode with Pillow's adaptive filtering, if Pillow can be imported; see encode_png_pillow()
+
+    Ancillary chunks other than tRNS (e.g. text, timestamps, physical size) are dropped from every encoding.
+
+    :param png_data:        bytes, required     png file content
+    :return:                bytes               smallest png file content, or None
+    """
+    chunks = read_png_chunks(png_data)
+    header = [(chunk_type, body) for chunk_type, body in chunks if chunk_type in PNG_KEEP_CHUNKS]
+    bit_depth = header[0][1][8]
+    scanlines = zlib.decompress(b''.join(body for chunk_type, body in chunks if chunk_type == b'IDAT'))
+
+    candidates = []
+    for strategy in PNG_ZLIB_STRATEGIES:
+        deflate = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidates.append(write_png_chunks(header + [(b'IDAT', deflate.compress(scanlines) + deflate.flush())]))
+    if Image is not None and bit_depth == 8:
+        candidates.extend(encode_png_pillow(png_data))
+
+    smallest = min(candidates, key=len)
+
+    return smallest if len(smallest) < len(png_data) else None
+
+
+def optimize_pyramid(dzi_path, layer, verbose=False):
+    """
+    Losslessly recompresses every png tile of a layer's pyramid (see optimize_png()) in a pool of threads, replacing a
+    tile only if the result is smaller. Tiles hardlinked to one another by dedupe_pyramid() are optimized once, and
+    stay linked.
+
+    Each tile's size and modification time after optimization are recorded in the layer's metadata; a tile whose size
+    and modification time both still match is skipped by later runs, so re-running after an incremental build or a
+    patch only optimizes tiles which have been rewritten, even if a rewritten tile happens to be the same size. Bytes
+    saved are reported per level, and emitted as an 'optimize' event; see emit_event().
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                dict                bytes saved keyed by level
+    """
+    optimized = get_layer_meta(dzi_path, layer).get('optimized', {})
+    linked_tiles = {}
+    for tile_key, tile_file in get_pyramid_tiles(dzi_path, layer).items():
+        if not tile_file.endswith('.png'):
+            continue
+        tile_stat = os.stat(tile_file)
+        if optimized.get(tile_key) != [tile_stat.st_size, tile_stat.st_mtime_ns]:
+            linked_tiles.setdefault((tile_stat.st_dev, tile_stat.st_ino), []).append((tile_key, tile_file))
+
+    def optimize_tile(tile_links):
+        tile_file = tile_links[0][1]
+        with open(tile_file, 'rb') as f:
+            png_data = f.read()
+        smallest = optimize_png(png_data)
+        if smallest is None:
+            return len(png_data), os.stat(tile_file)
+
+        with open(tile_file + '.tmp', 'wb') as f:
+            f.write(smallest)
+        os.replace(tile_file + '.tmp', tile_file)
+        for _, link_file in tile_links[1:]:                     # relinks duplicates to the optimized tile
+            os.link(tile_file, link_file + '.tmp')
+            os.replace(link_file + '.tmp', link_file)
+
+        return len(png_data), os.stat(tile_file)
+
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        results = list(pool.map(optimize_tile, linked_tiles.values()))
+
+    level_saved = {}
+    for tile_links, (size_before, tile_stat) in zip(linked_tiles.values(), results):
+        for tile_key, _ in tile_links:
+            level = tile_key.split('/')[0]
+            level_saved[level] = level_saved.get(level, 0) + size_before - tile_stat.st_size
+            optimized[tile_key] = [tile_stat.st_size, tile_stat.st_mtime_ns]
+
+    update_layer_meta(dzi_path, layer, optimized=optimized or None)
+    emit_event('optimize', layer=layer, tiles=sum(len(t) for t in linked_tiles.values()), bytes_saved=level_saved)
+
+    if verbose:
+        for level in sorted(level_saved, key=int):
+            print('{} level {}: {} bytes saved'.format(layer, level, level_saved[level]))
+
+    return level_saved
+
+
+def optimize_pyramids(dzi_path, layer_list, jobs=1, max_memory=0, verbose=False):
+    """
+    Runs optimize_pyramid() for every layer name provided.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    run_layer_jobs(optimize_pyramid, layer_list, jobs, max_memory, dzi_path=dzi_path, verbose=verbose)
+
+
+def read_png_chunks(png_data):
+    """
+    Splits a png file into its chunks, without decoding any pixels.
+
+    :param png_data:        bytes, required     png file content
+    :return:                list                (chunk type, chunk body) pairs, e.g. [(b'IHDR', b'...'), ...]
+    """
+    if png_data[:8] != PNG_SIGNATURE:
+        raise ValueError('not a png file')
+
+    chunks = []
+    position = 8
+    while position + 8 <= len(png_data):
+        length, chunk_type = struct.unpack('>I4s', png_data[position:position + 8])
+        chunks.append((chunk_type, png_data[position + 8:position + 8 + length]))
+        position += length + 12
+        if chunk_type == b'IEND':
+            break
+
+    return chunks
+
+
+def write_png_chunks(chunks):
+    """
+    Assembles a png file from its chunks, as returned by read_png_chunks(), computing each chunk's CRC; IEND is added.
+
+    :param chunks:          list, required      (chunk type, chunk body) pairs, IEND excluded
+    :return:                bytes               png file content
+    """
+    png_data = [PNG_SIGNATURE]
+    for chunk_type, body in chunks + [(b'IEND', b'')]:
+        png_data.append(struct.pack('>I', len(body)) + chunk_type + body)
+        png_data.append(struct.pack('>I', zlib.crc32(chunk_type + body) & 0xffffffff))
+
+    return b''.join(png_data)
@@ -0,0 +1,155 @@
+import os
+
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed
+)
+
+try:
+    import pyvips
+except (ImportError, OSError):                                  # OSError is raised when _libvips can't be located
+    pyvips = None
+
+from dzi_builder.core.events import (
+    dispatch_event,
+    event_hooks,
+    track_stage
+)
+
+
+def get_job_budget(jobs, layer_count, max_memory=0):
+    """
+    Splits the machine between concurrent layer jobs, so that running several libvips pipelines at once doesn't
+    oversubscribe the CPU or memory. Each job gets an equal share of the CPU threads and of the memory budget:
+
+        32 cores, 64000 MB, jobs=8      -->     8 workers, 4 threads each, 8000 MB each
+
+    :param jobs:            int, required       number of layers to process at once
+    :param layer_count:     int, required       number of layers to process
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :return:                int                 number of worker processes
+                            int                 libvips threads per worker
+                            int                 memory budget per worker, in MB (0 if unknown)
+    """
+    workers = max(1, min(jobs, layer_count))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    memory = max_memory if max_memory else get_system_memory()
+
+    return workers, threads, memory // workers
+
+
+def get_memory_budget():
+    """
+    Returns the memory budget in MB of the current process: a job worker's share, as set by init_job_worker(), or else
+    the budget of the whole machine; see get_system_memory().
+
+    :return:                int                 memory budget in MB (0 if unknown)
+    """
+    disc_threshold = os.environ.get('VIPS_DISC_THRESHOLD', '')
+
+    return int(disc_threshold[:-1]) if disc_threshold[:-1].isdigit() and disc_threshold.endswith('m') else \
+        get_system_memory()
+
+
+def get_system_memory():
+    """
+    Returns three quarters of physical memory in MB, leaving headroom for the OS and for Illustrator; returns 0 where
+    physical memory can't be read (e.g., Windows, where os.sysconf isn't available).
+
+    :return:                int                 memory budget in MB
+    """
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.75) // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def get_thread_count():
+    """
+    Returns the number of threads a stage may use within the current process: a job worker's share of the CPU, as set
+    by init_job_worker(), or every CPU when layers aren't being processed concurrently.
+
+    :return:                int                 thread count
+    """
+    return int(os.environ.get('VIPS_CONCURRENCY', 0)) or os.cpu_count() or 1
+
+
+def init_job_worker(threads, memory):
+    """
+    Process pool initializer; applies a worker's share of the job budget. vips.exe and ImageMagick subprocesses pick up
+    the environment variables. In-process pyvips reads them only once, as libvips starts, which may already have
+    happened by the time a worker runs this (e.g. in a forked worker), so its thread count and operation cache are set
+    directly too:
+
+        VIPS_CONCURRENCY        threads libvips uses per pipeline
+        VIPS_DISC_THRESHOLD     images larger than this are decoded to a temp file rather than held in memory
+        MAGICK_THREAD_LIMIT     threads ImageMagick uses per montage
+        MAGICK_MEMORY_LIMIT     memory ImageMagick uses before caching pixels to disk
+
+    :param threads:         int, required       libvips threads for this worker
+    :param memory:          int, required       memory budget for this worker in MB; if 0, left at libvips default
+    :return:                none
+    """
+    os.environ['VIPS_CONCURRENCY'] = str(threads)
+    os.environ['MAGICK_THREAD_LIMIT'] = str(threads)
+    if memory:
+        os.environ['VIPS_DISC_THRESHOLD'] = '{}m'.format(memory)
+        os.environ['MAGICK_MEMORY_LIMIT'] = '{}MiB'.format(memory)
+
+    if pyvips is not None:
+        pyvips.concurrency_set(threads)
+        if memory:
+            pyvips.cache_set_max_mem(memory * 1024 * 1024 // 4)     # operation cache is one part of the budget
+
+
+def run_layer_job(layer_fn, layer, kwargs, relay=False):
+    """
+    Calls layer_fn(layer=layer, **kwargs) as a tracked stage, named for layer_fn; see track_stage(). In a worker
+    process, hooks registered in the parent process aren't available; if relay is True, the worker's events are
+    collected instead, and returned for run_layer_jobs() to pass to the parent's hooks.
+
+    :param layer_fn:        function, required  function processing a single layer, taking a layer keyword argument
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param kwargs:          dict, required      arguments passed to layer_fn
+    :param relay:           bool, optional      if True, collects and returns events emitted by layer_fn
+    :return:                list                events emitted, if relay is True
+    """
+    relayed_events = []
+    if relay:
+        event_hooks[:] = [relayed_events.append]
+
+    with track_stage(layer_fn.__name__, layer=layer):
+        layer_fn(layer=layer, **kwargs)
+
+    return relayed_events
+
+
+def run_layer_jobs(layer_fn, layer_list, jobs=1, max_memory=0, **kwargs):
+    """
+    Calls layer_fn(layer=layer, **kwargs) for every layer name provided. If jobs is 1, layers are processed one at a
+    time, in order; otherwise, layers are processed concurrently in a pool of worker processes, each initialized with
+    its share of CPU threads and memory (see get_job_budget()). layer_fn must be a module-level function, so it can be
+    sent to worker processes.
+
+    Any exception raised by a layer is raised here once all running layers have finished. Each layer is tracked as a
+    stage; see run_layer_job().
+
+    :param layer_fn:        function, required  function processing a single layer, taking a layer keyword argument
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param kwargs:          optional            arguments passed to layer_fn for every layer
+    :return:                none
+    """
+    if jobs <= 1 or len(layer_list) <= 1:
+        for layer in layer_list:
+            run_layer_job(layer_fn, layer, kwargs)
+        return
+
+    workers, threads, memory = get_job_budget(jobs, len(layer_list), max_memory)
+    relay = bool(event_hooks)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_job_worker, initargs=(threads, memory)) as pool:
+        futures = [pool.submit(run_layer_job, layer_fn, layer, kwargs, relay) for layer in layer_list]
+        for future in as_completed(futures):
+            [dispatch_event(event) for event in future.result()]
@@ -0,0 +1,954 @@
+import math
+import os
+import shutil
+import xml.etree.ElementTree as ElementTree
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from dzi_builder.core.constants import (
+    ARCHIVE_FILE,
+    DZI_OVERLAP,
+    DZI_SUFFIX,
+    DZI_TILE_SIZE,
+    DZI_XML,
+    LAYER_META,
+    TILE_FORMAT_AUTO,
+    TILE_FORMAT_PNG,
+    TILE_SUFFIXES
+)
+
+from dzi_builder.core.catalog import (
+    filter_layer_tiles,
+    get_catalog_tiles
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count,
+    run_layer_jobs
+)
+
+from dzi_builder.core.tile_format import (
+    get_pillow_save_options,
+    get_tile_format,
+    quantize_tile
+)
+
+from dzi_builder.core.toolkit import (
+    create_file,
+    get_file_list,
+    get_layer_meta,
+    update_layer_meta
+)
+
+
+def build_layer_pyramid_grid(layer_path, layer, tile_list, col, row, dzi_path, skip_empty=False, tile_format=None,
+                             crop=False, verbose=False):
+    """
+    Runs build_pyramid_from_grid() for a single layer of layer_path, cropped to its content if crop applies to it;
+    see get_crop_bounds().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of files in layer_path
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list including layer, crops layer to its content
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Generating pyramid for {}...'.format(layer)) if verbose else None
+    tile_grid = build_tile_grid(layer_path, layer, col, tile_list)
+    layer_format = get_tile_format(tile_format, layer, list(tile_grid.values()))
+    build_pyramid_from_grid(tile_grid, col, row, dzi_path, layer, skip_empty=skip_empty, tile_format=layer_format,
+                            bounds=get_crop_bounds(tile_grid, layer, crop, col, row), verbose=verbose)
+
+
+def build_pyramid_from_grid(tile_grid, col, row, dzi_path, layer, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP,
+                            suffix=DZI_SUFFIX, skip_empty=False, tile_format=None, bounds=None, verbose=False):
+    """
+    Generates a Deep Zoom Image straight from a grid of artboard tiles, without combining the tiles into a single layer
+    png first. The deepest (full-size) level is written a row of tiles at a time from the artboard tiles each row
+    overlaps; every coarser level is then built by halving the level below it, read back from its tiles. Peak memory
+    scales with one row of artboards, rather than with the full layer.
+
+    Output matches the folder layout and .dzi descriptor written by dzsave:
+
+        dzi/
+            layer.dzi
+
+        dzi/layer_files/
+                0/
+                1/
+                2/
+                ...
+
+    If skip_empty is True, fully transparent tiles aren't written, and are recorded in the layer's metadata instead;
+    see get_empty_runs().
+
+    If tile_format is given (see get_tile_format()), tiles are saved in that format, and suffix is taken from it; the
+    format is recorded in the layer's metadata, so patched tiles are saved alike. Coarser levels are read back from
+    the level below, so lossy formats lose a little more detail at each level than with dzsave.
+
+    If the tile format has a palette (a low-colour layer), artboard tiles are held as 8 bit palette images, a quarter
+    the memory of RGBA, and the deepest level is written from palette strips; coarser levels are halved in RGBA, then
+    paletted again as their tiles are saved. See save_tile().
+
+    If bounds are given (see get_crop_bounds()), the pyramid covers only that region of the layer, and the region is
+    recorded in the layer's metadata, with the size of the full layer, so the viewer can place it.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     dict, optional      resolved tile format, from get_tile_format()
+    :param bounds:          tuple, optional     (left, top, right, bottom) region of layer to build
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    suffix = TILE_SUFFIXES[tile_format['format']] if tile_format else suffix
+    tile_width, tile_height = get_grid_tile_size(tile_grid)
+    left, top, right, bottom = bounds or (0, 0, col * tile_width, row * tile_height)
+    width, height = right - left, bottom - top
+    level_count = get_level_count(width, height)
+    row_cache = {}
+    empty_runs = {}
+
+    remove_pyramid(dzi_path, layer)
+
+    palette = tile_format.get('palette') if tile_format else None
+    tolerance = tile_format.get('tolerance', 0) if tile_format else 0
+
+    def read_deepest_strip(strip_top, strip_bottom):
+        strip = read_grid_strip(tile_grid, tile_width, tile_height, right, top + strip_top, top + strip_bottom,
+                                row_cache, palette, tolerance)
+        return strip.crop((left, 0, right, strip_bottom - strip_top)) if left else strip
+
+    read_strip = read_deepest_strip
+    for level in range(level_count - 1, -1, -1):
+        print('...{} level {}'.format(layer, level)) if verbose else None
+        level_width, level_height = get_level_size(width, height, level, level_count)
+        level_folder = get_level_folder(dzi_path, layer, level)
+        empty_tiles = write_level(read_strip, level_folder, level_width, level_height, tile_size, overlap, suffix,
+                                  skip_empty, tile_format)
+        if empty_tiles:
+            empty_runs[str(level)] = get_empty_runs(empty_tiles)
+        row_cache.clear()
+
+        read_strip = make_halved_strip_reader(level_folder, level_width, level_height, tile_size, overlap, suffix)
+
+    write_dzi(dzi_path, layer, width, height, tile_size, overlap, suffix)
+    if empty_runs or tile_format or bounds:
+        update_layer_meta(dzi_path, layer, empty=empty_runs or None, tile_format=tile_format,
+                          bounds=list(bounds) if bounds else None,
+                          canvas=[col * tile_width, row * tile_height] if bounds else None)
+
+
+def build_pyramids_grid(layer_path, layer_list, col, row, dzi_path, jobs=1, max_memory=0, skip_empty=False,
+                        tile_format=None, crop=False, catalog=None, verbose=False):
+    """
+    Runs build_pyramid_from_grid() for every layer name provided, in place of combine_transparent_layer() and
+    make_image_pyramid().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list of layer names, crops layers to their content
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tile_list = get_catalog_tiles(catalog, layer_list) if catalog else get_file_list(layer_path)
+    run_layer_jobs(build_layer_pyramid_grid, layer_list, jobs, max_memory, layer_path=layer_path,
+                   tile_list=tile_list, col=col, row=row, dzi_path=dzi_path, skip_empty=skip_empty,
+                   tile_format=tile_format, crop=crop, verbose=verbose)
+
+
+def build_tile_grid(layer_path, layer, col, tile_list=None):
+    """
+    Given a layer, returns the artboard tiles for that layer, keyed by (column, row) position in the artboard grid:
+
+        {(0, 0): 'C:\\path\\layers\\base-000.png', (1, 0): 'C:\\path\\layers\\base-001.png', ...}
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param tile_list:       list, optional      list of files in layer_path; if None, layer_path is listed
+    :return:                dict                tile paths keyed by (column, row)
+    """
+    tile_list = get_file_list(layer_path) if tile_list is None else tile_list
+    layer_tiles = filter_layer_tiles(tile_list, layer)
+
+    return {(i % col, i // col): layer_path + t for i, t in enumerate(layer_tiles)}
+
+
+def get_crop_bounds(tile_grid, layer, crop, col, row):
+    """
+    Returns the region a layer's pyramid is cropped to, if crop applies to the layer: the bounding box of its content
+    (see get_grid_bounds()). A layer with no content, or content reaching every edge, isn't cropped.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :param layer:           str, required       name of layer, e.g. 'rivers'
+    :param crop:            bool/list, required if True, or a list including layer, crops layer to its content
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :return:                tuple               (left, top, right, bottom) region of layer, or None if not cropped
+    """
+    if not crop or (crop is not True and layer not in crop):
+        return None
+
+    tile_width, tile_height = get_grid_tile_size(tile_grid)
+    bounds = get_grid_bounds(tile_grid, tile_width, tile_height, col * tile_width, row * tile_height)
+
+    return bounds if bounds and bounds != (0, 0, col * tile_width, row * tile_height) else None
+
+
+def get_dirty_tiles(dirty_boxes, level_width, level_height, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP):
+    """
+    Given the areas of a pyramid level whose pixels have changed, returns the tiles of that level which include any
+    changed pixel, overlap included.
+
+    :param dirty_boxes:     list, required      (left, top, right, bottom) areas of level which have changed
+    :param level_width:     int, required       width of level
+    :param level_height:    int, required       height of level
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :return:                list                sorted (column, row) positions of tiles to re-render
+    """
+    tile_cols, tile_rows = get_tile_count(level_width, level_height, tile_size)
+    dirty_tiles = set()
+
+    for left, top, right, bottom in dirty_boxes:
+        for tile_row in range(max((top - overlap) // tile_size, 0), min((bottom + overlap - 1) // tile_size + 1,
+                                                                         tile_rows)):
+            for tile_col in range(max((left - overlap) // tile_size, 0), min((right + overlap - 1) // tile_size + 1,
+                                                                              tile_cols)):
+                dirty_tiles.add((tile_col, tile_row))
+
+    return sorted(dirty_tiles)
+
+
+def get_empty_runs(empty_tiles):
+    """
+    Compresses the positions of a level's empty tiles (row * tile columns + column) into runs of consecutive
+    positions, as [start, length] pairs; e.g. [0, 1, 2, 3, 7, 8] becomes [[0, 4], [7, 2]]. Sparse overlay layers have
+    long runs of empty tiles, so the index recorded in layer metadata stays small.
+
+    :param empty_tiles:     list, required      positions of empty tiles in a level
+    :return:                list                [start, length] runs
+    """
+    empty_runs = []
+    for position in sorted(set(empty_tiles)):
+        if empty_runs and empty_runs[-1][0] + empty_runs[-1][1] == position:
+            empty_runs[-1][1] += 1
+        else:
+            empty_runs.append([position, 1])
+
+    return empty_runs
+
+
+def get_grid_bounds(tile_grid, tile_width, tile_height, width, height):
+    """
+    Returns the bounding box of a layer's non-transparent pixels, across every artboard tile in a tile grid; tiles
+    without an alpha channel count as fully opaque. Stops reading tiles once the box covers the whole layer.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :param tile_width:      int, required       width of artboard tile
+    :param tile_height:     int, required       height of artboard tile
+    :param width:           int, required       width of full layer
+    :param height:          int, required       height of full layer
+    :return:                tuple               (left, top, right, bottom) of content, or None if layer is empty
+    """
+    bounds = None
+    for (c, r), tile_file in sorted(tile_grid.items(), key=lambda item: (item[0][1], item[0][0])):
+        with Image.open(tile_file) as tile:
+            opaque = 'A' not in tile.getbands() and 'transparency' not in tile.info
+            tile_bounds = (0, 0) + tile.size if opaque else tile.convert('RGBA').getchannel('A').getbbox()
+        if tile_bounds is None:
+            continue
+
+        tile_bounds = (c * tile_width + tile_bounds[0], r * tile_height + tile_bounds[1],
+                       c * tile_width + tile_bounds[2], r * tile_height + tile_bounds[3])
+        bounds = tile_bounds if bounds is None else (min(bounds[0], tile_bounds[0]), min(bounds[1], tile_bounds[1]),
+                                                     max(bounds[2], tile_bounds[2]), max(bounds[3], tile_bounds[3]))
+        if bounds == (0, 0, width, height):
+            break
+
+    return bounds
+
+
+def get_grid_tile_size(tile_grid):
+    """
+    Returns the pixel dimensions of the artboard tiles in a tile grid; only the png header of one tile is read.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :return:                int                 width of artboard tile
+                            int                 height of artboard tile
+    """
+    with Image.open(next(iter(tile_grid.values()))) as tile:
+        return tile.size
+
+
+def get_level_count(width, height):
+    """
+    Given the dimensions of a full-size image, returns the number of levels in its Deep Zoom pyramid, from the full-size
+    image down to a 1x1 pixel image; e.g., a 3000x3000 image has 13 levels, 0 (1x1) through 12 (3000x3000).
+
+    :param width:           int, required       width of full-size image
+    :param height:          int, required       height of full-size image
+    :return:                int                 number of pyramid levels
+    """
+    return int(math.ceil(math.log2(max(width, height, 1)))) + 1
+
+
+def get_level_folder(dzi_path, layer, level):
+    """
+    Given a dzi folder, layer name and level, returns the folder path of that level's tiles, e.g.:
+
+        C:\\path\\to\\layers\\html\\dzi\\base_files\\12
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param level:           int, required       pyramid level
+    :return:                str                 level folder path
+    """
+    return os.path.join(dzi_path + layer + '_files', str(level))
+
+
+def get_level_size(width, height, level, level_count):
+    """
+    Given the dimensions of a full-size image, returns the dimensions of a pyramid level; each level is half the size
+    of the level above it, rounded up, as with dzsave.
+
+    :param width:           int, required       width of full-size image
+    :param height:          int, required       height of full-size image
+    :param level:           int, required       pyramid level, where 0 is 1x1 and level_count - 1 is full size
+    :param level_count:     int, required       number of pyramid levels, from get_level_count()
+    :return:                int                 width of level
+                            int                 height of level
+    """
+    scale = 2 ** (level_count - 1 - level)
+
+    return int(math.ceil(width / scale)), int(math.ceil(height / scale))
+
+
+def get_pyramid_tiles(dzi_path, layer):
+    """
+    Returns every tile file in a layer's pyramid, keyed by level and position, in level order:
+
+        {'0/0_0': 'C:\\path\\layers\\html\\dzi\\base_files\\0\\0_0.png', '1/0_0': ..., ...}
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                dict                tile file paths keyed by 'level/col_row'
+    """
+    pyramid_tiles = {}
+    files_folder = dzi_path + layer + '_files'
+    levels = sorted([int(d) for d in os.listdir(files_folder) if d.isdigit()]) if os.path.isdir(files_folder) else []
+
+    for level in levels:
+        level_folder = os.path.join(files_folder, str(level))
+        for tile in sorted(os.listdir(level_folder)):
+            if os.path.isfile(os.path.join(level_folder, tile)):
+                pyramid_tiles['{}/{}'.format(level, os.path.splitext(tile)[0])] = os.path.join(level_folder, tile)
+
+    return pyramid_tiles
+
+
+def get_tile_bounds(tile_col, tile_row, level_width, level_height, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP):
+    """
+    Given a tile's position in a pyramid level, returns the pixel area the tile covers in that level, including overlap
+    into neighbouring tiles.
+
+    :param tile_col:        int, required       column of tile in level
+    :param tile_row:        int, required       row of tile in level
+    :param level_width:     int, required       width of level
+    :param level_height:    int, required       height of level
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :return:                tuple               (left, top, right, bottom)
+    """
+    return (
+        max(tile_col * tile_size - overlap, 0),
+        max(tile_row * tile_size - overlap, 0),
+        min((tile_col + 1) * tile_size + overlap, level_width),
+        min((tile_row + 1) * tile_size + overlap, level_height)
+    )
+
+
+def get_tile_count(level_width, level_height, tile_size=DZI_TILE_SIZE):
+    """
+    Given the dimensions of a pyramid level, returns the number of tile columns and rows in that level.
+
+    :param level_width:     int, required       width of level
+    :param level_height:    int, required       height of level
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :return:                int                 count of tile columns
+                            int                 count of tile rows
+    """
+    return int(math.ceil(level_width / tile_size)), int(math.ceil(level_height / tile_size))
+
+
+def get_tile_file(dzi_path, layer, tile_key, suffix=DZI_SUFFIX):
+    """
+    Given a tile key, as used in layer metadata, returns the path of the tile file, e.g.:
+
+        '12/3_4'    -->     'C:\\path\\to\\layers\\html\\dzi\\base_files\\12\\3_4.png'
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_key:        str, required       tile key, 'level/col_row'
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :return:                str                 tile file path
+    """
+    level, position = tile_key.split('/')
+
+    return os.path.join(get_level_folder(dzi_path, layer, level), '{}.{}'.format(position, suffix))
+
+
+def is_empty_tile(tile):
+    """
+    Returns True if every pixel of a tile is fully transparent (alpha of 0). Tiles without an alpha channel are never
+    empty.
+
+    :param tile:            PIL.Image, required tile image
+    :return:                bool                True if tile is fully transparent
+    """
+    if tile.mode not in ('RGBA', 'LA', 'PA') and 'transparency' not in tile.info:
+        return False
+
+    return tile.convert('RGBA').getchannel('A').getbbox() is None
+
+
+def make_halved_region_reader(level_folder, level_width, level_height, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP,
+                              suffix=DZI_SUFFIX, alias_files=None):
+    """
+    Returns a read_region function for patch_layer_pyramid() which renders an area of the next coarser level by reading
+    the matching area of the given level and halving it with a 2x2 box filter; the result matches the tiles written by
+    make_halved_strip_reader().
+
+    :param level_folder:    str, required       folder path of the level below, from get_level_folder()
+    :param level_width:     int, required       width of the level below
+    :param level_height:    int, required       height of the level below
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :param alias_files:     dict, optional      kept tile file keyed by removed duplicate tile file
+    :return:                function            read_region(box) for the coarser level
+    """
+    def read_halved_region(box):
+        left, top, right, bottom = box
+        box = (left * 2, top * 2, min(right * 2, level_width), min(bottom * 2, level_height))
+        return read_level_region(level_folder, level_width, level_height, box, tile_size, overlap, suffix,
+                                 alias_files).reduce(2)
+
+    return read_halved_region
+
+
+def make_halved_strip_reader(level_folder, level_width, level_height, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP,
+                             suffix=DZI_SUFFIX):
+    """
+    Returns a read_strip function for write_level() which builds the next coarser level by reading strips of the given
+    (already written) level and halving them with a 2x2 box filter.
+
+    :param level_folder:    str, required       folder path of the level below, from get_level_folder()
+    :param level_width:     int, required       width of the level below
+    :param level_height:    int, required       height of the level below
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :return:                function            read_strip(top, bottom) for the coarser level
+    """
+    def read_halved_strip(top, bottom):
+        box = (0, top * 2, level_width, min(bottom * 2, level_height))
+        return read_level_region(level_folder, level_width, level_height, box, tile_size, overlap, suffix).reduce(2)
+
+    return read_halved_strip
+
+
+def palettize_pyramid(dzi_path, layer, tile_format):
+    """
+    Rewrites the png tiles of a layer's pyramid, as written by dzsave in RGBA, as 8 bit palette images, in a pool of
+    threads. As with save_tile(), each tile is paletted from the layer's palette (see quantize_tile()), with colours
+    outside it, such as the blended edges of coarser levels, kept as entries of their own; a tile with too many colours
+    to palette within tolerance is left as RGBA. libvips' own palette quantization isn't used, as it picks its own
+    palette, and would posterize coarser levels.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_format:     dict, required      resolved tile format, from get_tile_format()
+    :return:                int                 count of tiles paletted
+    """
+    if Image is None or tile_format['format'] != TILE_FORMAT_PNG or not tile_format.get('palette'):
+        return 0
+
+    def palettize_tile(tile_file):
+        with Image.open(tile_file) as tile:
+            if tile.mode == 'P':
+                return False
+            paletted = quantize_tile(tile, tile_format['palette'], tile_format['tolerance'], extend=True)
+        if paletted is None:
+            return False
+        save_tile(paletted, tile_file, tile_format)
+        return True
+
+    tile_files = [f for f in get_pyramid_tiles(dzi_path, layer).values() if f.endswith('.png')]
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        return sum(pool.map(palettize_tile, tile_files))
+
+
+def patch_layer_pyramid(layer_path, layer, col, dzi_path, changed_tiles, skip_empty=False, tile_list=None,
+                        verbose=False):
+    """
+    Re-renders only the pyramid tiles above the footprint of the given artboard tiles, in an existing layer pyramid
+    (written by any engine); every other tile is left untouched. At the deepest level, the tiles overlapping a changed
+    artboard are rendered straight from the artboard tiles; at each coarser level, the changed area is halved, and the
+    tiles overlapping it are rendered from the level below, as with build_pyramid_from_grid().
+
+    Tiles are saved in the format recorded in the layer's metadata, if any; see get_tile_format(). Layer metadata is
+    kept in step: a patched tile which was removed as empty, or as a duplicate, is written again,
+    and the duplicates of a patched tile are restored from its previous content; see restore_aliases().
+
+    A layer cropped to its content (see get_crop_bounds()) is patched within its recorded bounds; if the changed
+    artboards have content outside those bounds, the layer is rebuilt instead, cropped to its new content.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param changed_tiles:   list, required      indices of changed artboard tiles, e.g. [4] for base-004.png
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_list:       list, optional      list of files in layer_path; if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                int                 count of tiles re-rendered
+    """
+    dzi = read_dzi(dzi_path, layer)
+    tile_size, overlap, suffix = dzi['tile_size'], dzi['overlap'], dzi['suffix']
+    level_count = get_level_count(dzi['width'], dzi['height'])
+    tile_grid = build_tile_grid(layer_path, layer, col, tile_list)
+    tile_width, tile_height = get_grid_tile_size(tile_grid)
+
+    layer_meta = get_layer_meta(dzi_path, layer)
+    layer_format = layer_meta.get('tile_format')
+    aliases = layer_meta.get('aliases', {})
+    empty_tiles = {
+        level: set([p for start, length in level_runs for p in range(start, start + length)])
+        for level, level_runs in layer_meta.get('empty', {}).items()
+    }
+
+    alias_files = {
+        get_tile_file(dzi_path, layer, alias_key, suffix): get_tile_file(dzi_path, layer, kept_key, suffix)
+        for kept_key, alias_keys in aliases.items() for alias_key in alias_keys
+    }
+
+    left, top, right, bottom = layer_meta.get('bounds', (0, 0, dzi['width'], dzi['height']))
+    if 'bounds' in layer_meta:
+        changed_grid = {(i % col, i // col): tile_grid[(i % col, i // col)] for i in changed_tiles
+                        if (i % col, i // col) in tile_grid}
+        canvas_width, canvas_height = layer_meta['canvas']
+        changed_bounds = get_grid_bounds(changed_grid, tile_width, tile_height, canvas_width, canvas_height)
+        if changed_bounds and (changed_bounds[0] < left or changed_bounds[1] < top or changed_bounds[2] > right or
+                               changed_bounds[3] > bottom):
+            print('{}: content outside of crop; rebuilding pyramid'.format(layer)) if verbose else None
+            row = canvas_height // tile_height
+            if layer_format and layer_format.get('palette'):        # new content may be outside the palette
+                layer_format = get_tile_format(dict(layer_format, palette=TILE_FORMAT_AUTO), layer,
+                                               list(tile_grid.values()))
+            build_pyramid_from_grid(tile_grid, col, row, dzi_path, layer, tile_size, overlap, suffix, skip_empty,
+                                    layer_format, get_crop_bounds(tile_grid, layer, True, col, row), verbose)
+            return len(get_pyramid_tiles(dzi_path, layer))
+
+    dirty_boxes = [
+        (max(i % col * tile_width - left, 0), max(i // col * tile_height - top, 0),
+         min((i % col + 1) * tile_width, right) - left, min((i // col + 1) * tile_height, bottom) - top)
+        for i in changed_tiles
+    ]
+    dirty_boxes = [box for box in dirty_boxes if box[0] < box[2] and box[1] < box[3]]
+
+    def read_grid_box(box):
+        return read_grid_region(tile_grid, tile_width, tile_height,
+                                (box[0] + left, box[1] + top, box[2] + left, box[3] + top))
+
+    read_region = read_grid_box
+    patched = 0
+    for level in range(level_count - 1, -1, -1):
+        level_width, level_height = get_level_size(dzi['width'], dzi['height'], level, level_count)
+        level_folder = get_level_folder(dzi_path, layer, level)
+        level_empty = empty_tiles.setdefault(str(level), set())
+        tile_cols, _ = get_tile_count(level_width, level_height, tile_size)
+        os.makedirs(level_folder, exist_ok=True)
+
+        for tile_col, tile_row in get_dirty_tiles(dirty_boxes, level_width, level_height, tile_size, overlap):
+            tile = read_region(get_tile_bounds(tile_col, tile_row, level_width, level_height, tile_size, overlap))
+            tile_file = os.path.join(level_folder, '{}_{}.{}'.format(tile_col, tile_row, suffix))
+            position = tile_row * tile_cols + tile_col
+
+            restore_aliases(dzi_path, layer, '{}/{}_{}'.format(level, tile_col, tile_row), aliases, suffix)
+            if skip_empty and is_empty_tile(tile):
+                os.remove(tile_file) if os.path.isfile(tile_file) else None
+                level_empty.add(position)
+            else:
+                save_tile(tile, tile_file, layer_format)
+                level_empty.discard(position)
+            patched += 1
+
+        dirty_boxes = [
+            (left // 2, top // 2, int(math.ceil(right / 2)), int(math.ceil(bottom / 2)))
+            for left, top, right, bottom in dirty_boxes
+        ]
+        read_region = make_halved_region_reader(level_folder, level_width, level_height, tile_size, overlap, suffix,
+                                                alias_files)
+
+    update_layer_meta(
+        dzi_path, layer, aliases=aliases or None,
+        empty={level: get_empty_runs(p) for level, p in empty_tiles.items() if p} or None
+    )
+    print('{}: re-rendered {} tiles'.format(layer, patched)) if verbose else None
+
+    return patched
+
+
+def patch_pyramids(layer_path, layer_changes, col, dzi_path, skip_empty=False, catalog=None, verbose=False):
+    """
+    Runs patch_layer_pyramid() for every layer provided, one layer at a time.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_changes:   dict, required      indices of changed artboard tiles keyed by layer, e.g. {'base': [4]}
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tile_list = get_catalog_tiles(catalog, list(layer_changes)) if catalog else get_file_list(layer_path)
+    for layer, changed_tiles in layer_changes.items():
+        print('Patching pyramid for {}...'.format(layer)) if verbose else None
+        patch_layer_pyramid(layer_path, layer, col, dzi_path, changed_tiles, skip_empty, tile_list, verbose)
+
+
+def read_dzi(dzi_path, layer):
+    """
+    Reads a layer's .dzi descriptor, as written by dzsave or write_dzi().
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                dict                width, height, tile_size, overlap and suffix of pyramid
+    """
+    dzi = ElementTree.parse(dzi_path + layer + '.dzi').getroot()
+    size = [e for e in dzi if e.tag.endswith('Size')][0]
+
+    return {
+        'width': int(size.get('Width')),
+        'height': int(size.get('Height')),
+        'tile_size': int(dzi.get('TileSize')),
+        'overlap': int(dzi.get('Overlap')),
+        'suffix': dzi.get('Format')
+    }
+
+
+def read_grid_region(tile_grid, tile_width, tile_height, box):
+    """
+    Assembles an area of a layer straight from the artboard tiles it overlaps; only those artboards are decoded.
+    Missing grid positions are left transparent.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :param tile_width:      int, required       width of artboard tile
+    :param tile_height:     int, required       height of artboard tile
+    :param box:             tuple, required     (left, top, right, bottom) area to read
+    :return:                PIL.Image           RGBA area of layer
+    """
+    left, top, right, bottom = box
+    region = Image.new('RGBA', (right - left, bottom - top))
+
+    for r in range(top // tile_height, (bottom - 1) // tile_height + 1):
+        for c in range(left // tile_width, (right - 1) // tile_width + 1):
+            if (c, r) not in tile_grid:
+                continue
+            with Image.open(tile_grid[(c, r)]) as tile:
+                region.paste(tile.convert('RGBA'), (c * tile_width - left, r * tile_height - top))
+
+    return region
+
+
+def read_grid_strip(tile_grid, tile_width, tile_height, width, top, bottom, row_cache, palette=None, tolerance=0):
+    """
+    Assembles a full-width horizontal strip of a layer, from top to bottom, straight from the artboard tiles it
+    overlaps. Decoded artboard rows are kept in row_cache and dropped once the strip has moved past them, so at most
+    two rows of artboards are held in memory at once. Missing grid positions are left transparent.
+
+    If palette is given (see get_layer_palette()), artboard rows are kept, and the strip returned, as 8 bit palette
+    images; missing grid positions are left as the palette's first, transparent, entry.
+
+    :param tile_grid:       dict, required      tile paths keyed by (column, row), from build_tile_grid()
+    :param tile_width:      int, required       width of artboard tile
+    :param tile_height:     int, required       height of artboard tile
+    :param width:           int, required       width of full layer
+    :param top:             int, required       top of strip, in pixels
+    :param bottom:          int, required       bottom of strip, in pixels
+    :param row_cache:       dict, required      decoded artboard rows, keyed by row; updated in place
+    :param palette:         list, optional      layer palette, from get_layer_palette()
+    :param tolerance:       int, optional       maximum difference in any channel between a pixel and its entry
+    :return:                PIL.Image           RGBA or palette strip
+    """
+    if palette:
+        strip = Image.new('P', (width, bottom - top), 0)
+        strip.putpalette([v for entry in palette for v in entry], rawmode='RGBA')
+    else:
+        strip = Image.new('RGBA', (width, bottom - top))
+    first_row = top // tile_height
+    last_row = (bottom - 1) // tile_height
+
+    for r in [r for r in row_cache if r < first_row]:
+        del row_cache[r]
+
+    for r in range(first_row, last_row + 1):
+        if r not in row_cache:
+            row_cache[r] = {}
+            for (c, tile_row), tile_file in tile_grid.items():
+                if tile_row == r:
+                    with Image.open(tile_file) as tile:
+                        row_cache[r][c] = quantize_tile(tile, palette, tolerance) if palette else tile.convert('RGBA')
+
+        row_top = r * tile_height
+        crop_top = max(top - row_top, 0)
+        crop_bottom = min(bottom - row_top, tile_height)
+        for c, tile in row_cache[r].items():
+            strip.paste(tile.crop((0, crop_top, tile_width, crop_bottom)), (c * tile_width, row_top + crop_top - top))
+
+    return strip
+
+
+def read_level_region(level_folder, level_width, level_height, box, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP,
+                      suffix=DZI_SUFFIX, alias_files=None):
+    """
+    Assembles an area of an existing pyramid level from the tiles written to level_folder. A tile removed by
+    dedupe_pyramid() in manifest mode is read from the tile it duplicates, if found in alias_files; any other missing
+    tile (e.g., removed as empty) is left transparent.
+
+    :param level_folder:    str, required       level folder path, from get_level_folder()
+    :param level_width:     int, required       width of level
+    :param level_height:    int, required       height of level
+    :param box:             tuple, required     (left, top, right, bottom) area to read
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :param alias_files:     dict, optional      kept tile file keyed by removed duplicate tile file
+    :return:                PIL.Image           RGBA area of level
+    """
+    left, top, right, bottom = box
+    region = Image.new('RGBA', (right - left, bottom - top))
+    alias_files = {} if alias_files is None else alias_files
+
+    for tile_row in range(top // tile_size, (bottom - 1) // tile_size + 1):
+        for tile_col in range(left // tile_size, (right - 1) // tile_size + 1):
+            tile_file = os.path.join(level_folder, '{}_{}.{}'.format(tile_col, tile_row, suffix))
+            if not os.path.isfile(tile_file):
+                tile_file = alias_files.get(tile_file)
+            if tile_file is None:
+                continue
+            tile_left, tile_top, _, _ = get_tile_bounds(
+                tile_col, tile_row, level_width, level_height, tile_size, overlap
+            )
+            with Image.open(tile_file) as tile:
+                region.paste(tile.convert('RGBA'), (tile_left - left, tile_top - top))
+
+    return region
+
+
+def restore_aliases(dzi_path, layer, tile_key, aliases, suffix=DZI_SUFFIX):
+    """
+    Before a tile is re-rendered by patch_layer_pyramid(), copies its current content to any duplicates removed by
+    dedupe_pyramid() in manifest mode, as they no longer share content once the tile has changed. The tile, and its
+    duplicates, are dropped from aliases, which is updated in place.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_key:        str, required       tile about to be re-rendered, e.g. '12/3_4'
+    :param aliases:         dict, required      duplicate tile keys keyed by kept tile key, from layer metadata
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :return:                none
+    """
+    for kept_key, alias_keys in list(aliases.items()):
+        if tile_key in alias_keys:
+            alias_keys.remove(tile_key)
+        if kept_key == tile_key:
+            for alias_key in alias_keys:
+                shutil.copyfile(get_tile_file(dzi_path, layer, kept_key, suffix),
+                                get_tile_file(dzi_path, layer, alias_key, suffix))
+            alias_keys.clear()
+        if not alias_keys:
+            del aliases[kept_key]
+
+
+def remove_empty_pyramid_tiles(dzi_path, layer_list, jobs=1, max_memory=0, verbose=False):
+    """
+    Runs remove_empty_tiles() for every layer name provided.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    if Image is None:
+        print('Pillow could not be imported; empty tiles were not removed.') if verbose else None
+        return
+
+    run_layer_jobs(remove_empty_tiles, layer_list, jobs, max_memory, dzi_path=dzi_path, verbose=verbose)
+
+
+def remove_empty_tiles(dzi_path, layer, verbose=False):
+    """
+    Removes fully transparent tiles from an existing layer pyramid (e.g., one written by dzsave), and records them in
+    the layer's metadata as runs of empty tiles per level; see get_empty_runs(). The generated viewer then skips
+    requests for these tiles, rather than getting a 404 for each.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                int                 count of tiles removed
+    """
+    dzi = read_dzi(dzi_path, layer)
+    level_count = get_level_count(dzi['width'], dzi['height'])
+    empty_tiles = {}
+    removed = 0
+
+    for level, level_runs in get_layer_meta(dzi_path, layer).get('empty', {}).items():   # recorded by an earlier run
+        empty_tiles[level] = [p for start, length in level_runs for p in range(start, start + length)]
+
+    for tile_key, tile_file in get_pyramid_tiles(dzi_path, layer).items():
+        with Image.open(tile_file) as tile:
+            empty = is_empty_tile(tile)
+        if not empty:
+            continue
+
+        level, position = tile_key.split('/')
+        tile_col, tile_row = [int(p) for p in position.split('_')]
+        level_width, level_height = get_level_size(dzi['width'], dzi['height'], int(level), level_count)
+        tile_cols, _ = get_tile_count(level_width, level_height, dzi['tile_size'])
+
+        empty_tiles.setdefault(level, []).append(tile_row * tile_cols + tile_col)
+        os.remove(tile_file)
+        removed += 1
+
+    update_layer_meta(dzi_path, layer, empty={level: get_empty_runs(t) for level, t in empty_tiles.items()} or None)
+    print('{}: removed {} empty tiles'.format(layer, removed)) if verbose else None
+
+    return removed
+
+
+def remove_pyramid(dzi_path, layer):
+    """
+    Removes a layer's existing pyramid tiles, archive (see archive_pyramid()) and metadata before the pyramid is
+    rebuilt. Tiles may be hardlinked to one another by dedupe_pyramid(), so they must never be overwritten in place.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                none
+    """
+    shutil.rmtree(dzi_path + layer + '_files', ignore_errors=True)
+
+    for layer_file in (ARCHIVE_FILE.format(layer), LAYER_META.format(layer)):
+        if os.path.isfile(dzi_path + layer_file):
+            os.remove(dzi_path + layer_file)
+
+
+def save_tile(tile, tile_file, tile_format=None):
+    """
+    Saves a tile image, in the given tile format (see get_tile_format()), or else in the format given by its file
+    extension. JPEG tiles are saved without their alpha channel. The tile is written to a temp file which then
+    replaces tile_file, so a tile hardlinked by dedupe_pyramid() is replaced, rather than overwritten for every link.
+
+    If the tile format has a palette, an RGBA tile is paletted (see quantize_tile()), and kept as RGBA only if it has
+    too many colours; a palette tile is saved with just the entries it uses.
+
+    :param tile:            PIL.Image, required tile image
+    :param tile_file:       str, required       path to tile, e.g. 'C:\\path\\layers\\html\\dzi\\base_files\\0\\0_0.png'
+    :param tile_format:     dict, optional      resolved tile format, from get_tile_format()
+    :return:                none
+    """
+    temp_file = tile_file + '.tmp'
+    if tile_format:
+        save_format, save_options = get_pillow_save_options(tile_format)
+        tile = tile.convert('RGB') if save_format == 'JPEG' and tile.mode != 'RGB' else tile
+        if save_format == 'PNG' and tile_format.get('palette') and tile.mode != 'P':
+            tile = quantize_tile(tile, tile_format['palette'], tile_format['tolerance'], extend=True) or tile
+        if tile.mode == 'P':
+            tile = tile.remap_palette([i for i, count in enumerate(tile.histogram()) if count])
+        tile.save(temp_file, format=save_format, **save_options)
+    else:
+        tile.save(temp_file, format=Image.registered_extensions()[os.path.splitext(tile_file)[1].lower()])
+    os.replace(temp_file, tile_file)
+
+
+def write_dzi(dzi_path, layer, width, height, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP, suffix=DZI_SUFFIX):
+    """
+    Writes a .dzi descriptor for a layer, in the same format as dzsave.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param width:           int, required       width of full-size image
+    :param height:          int, required       height of full-size image
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :return:                none
+    """
+    create_file(dzi_path, layer + '.dzi', DZI_XML.format(suffix, overlap, tile_size, height, width))
+
+
+def write_level(read_strip, level_folder, level_width, level_height, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP,
+                suffix=DZI_SUFFIX, skip_empty=False, tile_format=None):
+    """
+    Writes every tile of a pyramid level, one row of tiles at a time. read_strip(top, bottom) must return a full-width
+    RGBA strip of the level covering top to bottom. If skip_empty is True, fully transparent tiles aren't written.
+
+    :param read_strip:      function, required  returns a full-width strip of the level, given top and bottom
+    :param level_folder:    str, required       level folder path, from get_level_folder()
+    :param level_width:     int, required       width of level
+    :param level_height:    int, required       height of level
+    :param tile_size:       int, optional       size of tile, excluding overlap
+    :param overlap:         int, optional       pixels of overlap into neighbouring tiles
+    :param suffix:          str, optional       tile file extension, e.g. 'png'
+    :param skip_empty:      bool, optional      if True, fully transparent tiles are not written
+    :param tile_format:     dict, optional      resolved tile format, from get_tile_format()
+    :return:                list                positions (row * tile columns + column) of tiles not written
+    """
+    os.makedirs(level_folder, exist_ok=True)
+    tile_cols, tile_rows = get_tile_count(level_width, level_height, tile_size)
+    empty_tiles = []
+
+    for tile_row in range(tile_rows):
+        _, top, _, bottom = get_tile_bounds(0, tile_row, level_width, level_height, tile_size, overlap)
+        strip = read_strip(top, bottom)
+        for tile_col in range(tile_cols):
+            left, _, right, _ = get_tile_bounds(tile_col, tile_row, level_width, level_height, tile_size, overlap)
+            tile = strip.crop((left, 0, right, bottom - top))
+            if skip_empty and is_empty_tile(tile):
+                empty_tiles.append(tile_row * tile_cols + tile_col)
+            else:
+                save_tile(tile, os.path.join(level_folder, '{}_{}.{}'.format(tile_col, tile_row, suffix)), tile_format)
+
+    return empty_tiles
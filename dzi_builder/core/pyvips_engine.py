@@ -0,0 +1,218 @@
+try:
+    import pyvips
+except (ImportError, OSError):                                  # OSError is raised when _libvips can't be located
+    pyvips = None
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    filter_layer_tiles,
+    get_catalog_layers,
+    get_catalog_tiles
+)
+
+from dzi_builder.core.parallel import (
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    build_tile_grid,
+    get_crop_bounds,
+    palettize_pyramid,
+    remove_pyramid
+)
+
+from dzi_builder.core.tile_format import (
+    get_tile_format,
+    get_vips_suffix
+)
+
+from dzi_builder.core.toolkit import (
+    get_file_list,
+    update_layer_meta
+)
+
+
+def build_layer_pyramid_pyvips(layer_path, layer, tile_list, col, dzi_path, tile_format=None, crop=False,
+                               verbose=False):
+    """
+    Runs the lazy libvips pipeline of build_pyramids_pyvips() for a single layer. If crop applies to the layer, the
+    joined layer is cropped to the bounding box of its content before it's saved; the box is read from the artboard
+    tiles, exactly as by the other engines (see get_crop_bounds()), so the pipeline is only evaluated once, by dzsave.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of files in layer_path
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list including layer, crops layer to its content
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Generating pyramid for {}...'.format(layer)) if verbose else None
+    layer_tiles = get_layer_tiles(layer_path, layer, tile_list)
+    layer_format = get_tile_format(tile_format, layer, [layer_path + t for t in layer_tiles])
+    layer_img = join_layer(layer_path, layer_tiles, col)
+    canvas = [layer_img.width, layer_img.height]
+    bounds = get_crop_bounds(build_tile_grid(layer_path, layer, col, layer_tiles), layer, crop, col,
+                             len(layer_tiles) // col)
+
+    if bounds:
+        left, top, right, bottom = bounds = list(bounds)
+        layer_img = layer_img.crop(left, top, right - left, bottom - top)
+
+    remove_pyramid(dzi_path, layer)
+    layer_img.dzsave(dzi_path + layer, suffix=get_vips_suffix(layer_format))
+    palettize_pyramid(dzi_path, layer, layer_format)
+    update_layer_meta(dzi_path, layer, tile_format=layer_format, bounds=bounds, canvas=canvas if bounds else None)
+
+
+def build_pyramids_pyvips(layer_path, layer_list, col, dzi_path, jobs=1, max_memory=0, tile_format=None,
+                          crop=False, catalog=None, verbose=False):
+    """
+    Runs alpha normalization, arrayjoin and dzsave as a single lazy libvips pipeline for each layer. Unlike
+    combine_transparent_layer() followed by make_image_pyramid(), no temp tiles or combined layer png are written;
+    tiles are decoded once, and pixels flow straight into the pyramid.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list of layer names, crops layers to their content
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tile_list = get_catalog_tiles(catalog, layer_list) if catalog else get_file_list(layer_path)
+    run_layer_jobs(build_layer_pyramid_pyvips, layer_list, jobs, max_memory, layer_path=layer_path,
+                   tile_list=tile_list, col=col, dzi_path=dzi_path, tile_format=tile_format,
+                   crop=crop, verbose=verbose)
+
+
+def combine_layer_pyvips(layer_path, layer, tile_list, col, verbose=False):
+    """
+    Writes the combined layer png of combine_layers_pyvips() for a single layer.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of files in layer_path
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Combining {}...'.format(layer)) if verbose else None
+    layer_img = join_layer(layer_path, get_layer_tiles(layer_path, layer, tile_list), col)
+    layer_img.write_to_file(layer_path + layer + '.png')
+
+
+def combine_layers_pyvips(layer_path, col, layer_names=None, jobs=1, max_memory=0, catalog=None, verbose=False):
+    """
+    pyvips equivalent of combine_transparent_layer(); writes a combined layer png for each layer. Only needed when
+    running create_layers() and create_dzi_and_site() as separate steps; build_pyramids_pyvips() skips this file.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param layer_names:     list, optional      list of layer names; if None, every layer in catalog
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    catalog = build_tile_catalog(layer_path, headers=False) if catalog is None else catalog
+    layer_names = get_catalog_layers(catalog) if layer_names is None else layer_names
+
+    run_layer_jobs(combine_layer_pyvips, layer_names, jobs, max_memory, layer_path=layer_path,
+                   tile_list=get_catalog_tiles(catalog, layer_names), col=col, verbose=verbose)
+
+
+def get_layer_tiles(layer_path, layer_name, tile_list=None):
+    """
+    Given a layer name, returns the sorted tiles for that layer, e.g. ['base-000.png', 'base-001.png', ...]; see
+    filter_layer_tiles().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_name:      str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, optional      list of files in layer_path; if None, layer_path is listed
+    :return:                list                sorted list of tile file names
+    """
+    tile_list = get_file_list(layer_path) if tile_list is None else tile_list
+
+    return filter_layer_tiles(tile_list, layer_name)
+
+
+def join_layer(layer_path, tile_list, col):
+    """
+    Lazily joins a layer's tiles into a single image, with the number of images across corresponding to col. No pixels
+    are computed until the image is written.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param tile_list:       list, required      sorted list of layer tiles, e.g. ['base-000.png', 'base-001.png', ...]
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :return:                pyvips.Image        joined layer
+    """
+    return pyvips.Image.arrayjoin([load_tile(layer_path + t) for t in tile_list], across=col)
+
+
+def load_tile(tile_file):
+    """
+    Opens a png tile as a lazy pyvips image, forcing it to 4-band sRGB with an alpha channel. This replaces the
+    per-tile 'vips composite' subprocess call, as arrayjoin fails when combining 24 and 32 bit images; nothing is
+    written back to disk.
+
+    :param tile_file:       str, required       path to tile, e.g. 'C:\\path\\to\\layers\\base-000.png'
+    :return:                pyvips.Image        tile with alpha channel
+    """
+    tile = pyvips.Image.new_from_file(tile_file, access='sequential')
+
+    if tile.bands < 3:
+        tile = tile.colourspace('srgb')
+    if not tile.hasalpha():
+        tile = tile.bandjoin(255)
+
+    return tile
+
+
+def make_image_pyramid_pyvips(layer_path, layer_list, dzi_path, jobs=1, max_memory=0, tile_format=None,
+                              catalog=None, verbose=False):
+    """
+    pyvips equivalent of make_image_pyramid(); generates a Deep Zoom Image from each combined layer png.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tile_list = get_catalog_tiles(catalog, layer_list) if catalog else get_file_list(layer_path)
+    run_layer_jobs(make_layer_pyramid_pyvips, layer_list, jobs, max_memory, layer_path=layer_path,
+                   dzi_path=dzi_path, tile_format=tile_format, tile_list=tile_list, verbose=verbose)
+
+
+def make_layer_pyramid_pyvips(layer_path, layer, dzi_path, tile_format=None, tile_list=None, verbose=False):
+    """
+    Runs dzsave on a single combined layer png; see make_image_pyramid_pyvips().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param tile_list:       list, optional      list of files in layer_path; if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    print('Generating pyramid for {}...'.format(layer)) if verbose else None
+    layer_tiles = get_layer_tiles(layer_path, layer, tile_list)
+    layer_format = get_tile_format(tile_format, layer, [layer_path + t for t in layer_tiles])
+    layer_img = pyvips.Image.new_from_file(layer_path + layer + '.png', access='sequential')
+    remove_pyramid(dzi_path, layer)
+    layer_img.dzsave(dzi_path + layer, suffix=get_vips_suffix(layer_format))
+    palettize_pyramid(dzi_path, layer, layer_format)
+    update_layer_meta(dzi_path, layer, tile_format=layer_format)
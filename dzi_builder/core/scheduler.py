@@ -0,0 +1,234 @@
+import os
+import time
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait
+)
+
+from dzi_builder.core.archive import (
+    archive_pyramid
+)
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    get_catalog_tiles
+)
+
+from dzi_builder.core.constants import (
+    TASK_WEIGHTS,
+    WATCH_POLL_INTERVAL
+)
+
+from dzi_builder.core.dedup import (
+    dedupe_pyramid
+)
+
+from dzi_builder.core.events import (
+    dispatch_event,
+    event_hooks
+)
+
+from dzi_builder.core.image_magick import (
+    combine_layer_tiles
+)
+
+from dzi_builder.core.optimize import (
+    optimize_pyramid
+)
+
+from dzi_builder.core.parallel import (
+    get_job_budget,
+    init_job_worker,
+    run_layer_job
+)
+
+from dzi_builder.core.pyramid import (
+    remove_empty_tiles
+)
+
+from dzi_builder.core.vips import (
+    join_layer_tiles,
+    make_layer_pyramid,
+    normalize_layer
+)
+
+
+def build_layer_graph(layer_path, layer_list, col, vips_path, transparency=True, width=0, height=0, skip_empty=False,
+                      dedupe=None, tile_format=None, optimize=False, archive=False, crop=False, catalog=None,
+                      verbose=False):
+    """
+    Expresses the vips subprocess pipeline as a task graph, with a chain of tasks for each layer:
+
+        normalize --> join --> pyramid [--> remove_empty] [--> dedupe] [--> optimize] [--> archive]
+
+    With transparency set to False, join runs ImageMagick's montage, and there's nothing to normalize. Layers are
+    independent of one another, so while one layer's pyramid is being built, another can still be joining. Each task
+    is weighted by the total size of its layer's tiles, scaled by TASK_WEIGHTS; see run_task_graph().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param transparency:    bool, optional      if True, joins tiles with libvips, not ImageMagick
+    :param width:           int, optional       width of artboard tile, for ImageMagick
+    :param height:          int, optional       height of artboard tile, for ImageMagick; if 0, equal to width
+    :param skip_empty:      bool, optional      if True, removes fully transparent tiles; see remove_empty_tiles()
+    :param dedupe:          str, optional       if DEDUP_HARDLINK or DEDUP_MANIFEST, stores identical tiles once
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param optimize:        bool, optional      if True, losslessly recompresses png tiles; see optimize_pyramid()
+    :param archive:         bool, optional      if True, packs tiles into a single file; see archive_pyramid()
+    :param crop:            bool/list, optional if True, or a list of layer names, crops transparent layers to content
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                dict                tasks keyed by task id, e.g. 'base:join'
+    """
+    catalog = build_tile_catalog(layer_path, headers=False) if catalog is None else catalog
+    dzi_path = os.path.join(layer_path, 'html', 'dzi', '')
+    tasks = {}
+
+    for layer in layer_list:
+        layer_tiles = get_catalog_tiles(catalog, [layer])
+        layer_catalog = dict(catalog, files=layer_tiles, layers={layer: catalog['layers'].get(layer, {})})
+        layer_size = sum(tile_entry['size'] for tile_entry in layer_catalog['layers'][layer].values()) or 1
+        steps = []
+
+        if transparency:
+            steps.append(('normalize', normalize_layer, {
+                'layer_path': layer_path, 'tile_list': layer_tiles, 'vips_path': vips_path, 'catalog': layer_catalog,
+                'verbose': verbose}))
+            steps.append(('join', join_layer_tiles, {
+                'layer_path': layer_path, 'tile_list': layer_tiles, 'col': col, 'vips_path': vips_path,
+                'verbose': verbose}))
+        else:
+            steps.append(('join', combine_layer_tiles, {
+                'layer_path': layer_path, 'width': width, 'columns': col, 'height': height, 'verbose': verbose}))
+
+        steps.append(('pyramid', make_layer_pyramid, {
+            'layer_path': layer_path, 'vips_path': vips_path, 'tile_format': tile_format,
+            'crop': crop if transparency else False, 'tile_list': layer_tiles, 'verbose': verbose}))
+        if skip_empty:
+            steps.append(('remove_empty', remove_empty_tiles, {'dzi_path': dzi_path, 'verbose': verbose}))
+        if dedupe:
+            steps.append(('dedupe', dedupe_pyramid, {'dzi_path': dzi_path, 'mode': dedupe, 'verbose': verbose}))
+        if optimize:
+            steps.append(('optimize', optimize_pyramid, {'dzi_path': dzi_path, 'verbose': verbose}))
+        if archive:
+            steps.append(('archive', archive_pyramid, {'dzi_path': dzi_path, 'verbose': verbose}))
+
+        previous = None
+        for step, task_fn, kwargs in steps:
+            task_id = '{}:{}'.format(layer, step)
+            tasks[task_id] = {
+                'fn': task_fn,
+                'layer': layer,
+                'kwargs': kwargs,
+                'deps': [previous] if previous else [],
+                'cost': layer_size * TASK_WEIGHTS[step]
+            }
+            previous = task_id
+
+    return tasks
+
+
+def get_task_priority(tasks):
+    """
+    Returns the priority of each task: its own cost, plus that of the costliest chain of tasks depending on it. Running
+    the highest priority ready task first keeps the critical path moving; for layer chains, the largest layers start
+    first, so a single large layer doesn't start last and finish long after the rest.
+
+    :param tasks:           dict, required      tasks keyed by task id, from build_layer_graph()
+    :return:                dict                priority keyed by task id
+    """
+    dependents = {task_id: [] for task_id in tasks}
+    for task_id, task in tasks.items():
+        for dep in task['deps']:
+            dependents[dep].append(task_id)
+
+    priority = {}
+
+    def get_priority(task_id):
+        if task_id not in priority:
+            priority[task_id] = tasks[task_id]['cost'] + max([get_priority(d) for d in dependents[task_id]] or [0])
+        return priority[task_id]
+
+    for task_id in tasks:
+        get_priority(task_id)
+
+    return priority
+
+
+def run_task_graph(tasks, workers=1, max_memory=0, add_tasks=None, poll_interval=WATCH_POLL_INTERVAL, verbose=False):
+    """
+    Runs a graph of tasks, each as soon as the tasks it depends on have finished, on up to workers processes at once;
+    whenever a worker is free, the ready task with the highest priority is started (see get_task_priority()). CPU and
+    disk stay busy across stage boundaries, rather than every layer waiting for the slowest layer of each stage.
+    Workers share the CPU threads and memory budget as with run_layer_jobs(); as each layer's tasks form a chain, no
+    more workers are started than there are layers.
+
+    Each task is a dict of fn, layer and kwargs, called as fn(layer=layer, **kwargs), as well as deps (task ids it
+    depends on) and cost. Any exception raised by a task is raised here once running tasks have finished; no further
+    tasks are started.
+
+    If add_tasks is given, the graph may grow while it runs: add_tasks() is called every poll_interval seconds, and
+    returns a dict of further tasks (possibly empty), or None once no more tasks will be added; see stream_layers().
+
+    :param tasks:           dict, required      tasks keyed by task id, e.g. from build_layer_graph()
+    :param workers:         int, optional       number of tasks to run at once
+    :param max_memory:      int, optional       memory budget in MB shared by all workers; if 0, based on system memory
+    :param add_tasks:       function, optional  returns tasks to add to the graph, or None once finished adding
+    :param poll_interval:   float, optional     seconds between calls to add_tasks
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tasks = dict(tasks)
+    priority = get_task_priority(tasks)
+    adding = add_tasks is not None
+    done = set()
+
+    def get_ready_tasks(running):
+        ready = [t for t in tasks if t not in done and t not in running and all(d in done for d in tasks[t]['deps'])]
+        return sorted(ready, key=lambda t: -priority[t])
+
+    def update_tasks():
+        new_tasks = add_tasks()
+        if new_tasks:
+            tasks.update(new_tasks)
+            priority.update(get_task_priority(tasks))
+        return new_tasks is not None
+
+    if workers <= 1:
+        while adding or len(done) < len(tasks):
+            adding = update_tasks() if adding else False
+            ready = get_ready_tasks([])
+            if not ready:
+                time.sleep(poll_interval) if adding else None
+                continue
+            task_id = ready[0]
+            print('Running {}...'.format(task_id)) if verbose else None
+            run_layer_job(tasks[task_id]['fn'], tasks[task_id]['layer'], tasks[task_id]['kwargs'])
+            done.add(task_id)
+        return
+
+    layer_count = len(set(task['layer'] for task in tasks.values()))       # a layer's chain runs one task at a time
+    workers, threads, memory = get_job_budget(workers, workers if adding else layer_count, max_memory)
+    relay = bool(event_hooks)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_job_worker, initargs=(threads, memory)) as pool:
+        while adding or len(done) < len(tasks):
+            adding = update_tasks() if adding else False
+            for task_id in get_ready_tasks(running.values())[:workers - len(running)]:
+                print('Running {}...'.format(task_id)) if verbose else None
+                task = tasks[task_id]
+                running[pool.submit(run_layer_job, task['fn'], task['layer'], task['kwargs'], relay)] = task_id
+
+            if not running:
+                time.sleep(poll_interval) if adding else None
+                continue
+
+            finished, _ = wait(running, timeout=poll_interval if adding else None, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done.add(running.pop(future))
+                [dispatch_event(event) for event in future.result()]
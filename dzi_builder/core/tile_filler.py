@@ -1,9 +1,19 @@
+import json
 import os
 import re
 import shutil
 
-from dzi_builder.core.toolkit import (
-    get_file_list
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from dzi_builder.core.constants import (
+    CATALOG_TILE_PATTERN,
+    FILLER_MASK_IMAGE,
+    FILLER_MASK_ROW_SEPARATOR,
+    FILLER_MASK_TILE,
+    FILLER_MASK_TILE_VALUE
 )
 
 from dzi_builder.core.vips import (
@@ -11,88 +21,70 @@ from dzi_builder.core.vips import (
 )
 
 
-def build_matrix(tile_list, filler, duplicate_list, col, row):
+def build_matrix(tile_list, fillers, col, row):
     """
-    Constructs lists of layers with filler tile placeholders, as well as filler tile names per layer. Passes to
-    restructure_layer_matrix() for copying and renaming of tiles:
+    Sorts every tile in a folder by layer, and constructs each layer's complete tile matrix, with filler tiles in place
+    of missing tiles (see build_layer_matrix()). Passes to restructure_layer_matrix() for renaming and linking of tiles:
 
-        layers_lists returns a list of lists, one list for each tile, with added "filler" tiles at the end, e.g.:
+        {'base': ['base-000.png', 'base-001.png', 'base-000.png', ...],
+         'grid': ['grid-000.png', 'grid-001.png', 'grid-000.png', ...]}
 
-            [['base-000.png', 'base-001.png', ...],
-             ['grid-000.png', 'grid-001.png', ...]]
+    Tiles are matched to layers by their full name, so layers such as 'road' and 'roads' are kept apart; png and svg
+    tiles (the latter when transparency is False) are both filled, and files not named as generate_tiles() names tiles
+    are ignored.
 
-        filler_list returns a list of "filler" tiles for each layer, e.g.:
-
-            ['base-003.png', 'grid-003.png']
-
-    :param tile_list:       list, required      list of all tiles in folder, e.g. ['base-000.png', 'base-001.png'...]
-    :param filler:          int, required       "filler" tile position to duplicate into duplicate_list positions
-    :param duplicate_list:  list, required      int tile positions to duplicate "filler" tile into, e.g. [7, 11, 12]
+    :param tile_list:       list, required      list of all files in folder, e.g. ['base-000.png', 'base-001.png'...]
+    :param fillers:         dict, required      filler tile number keyed by grid position; see read_filler_spec()
     :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
     :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
-    :return:                list                layers_lists:   list of layer tile lists, e.g. [[...], [...]]
-                            list                filler_list:    list of filler tiles for each layer
+    :return:                dict                list of tile names per grid position, keyed by layer name
     """
-    filler_list = []
-    layer_list = []
-    layers_lists = []
-
+    layer_tiles = {}
     for tile in tile_list:
-        tile = re.sub(r'(?=-).*', '', tile)
-        layer_list.append(tile)
-    layer_list = list(set(layer_list))
-
-    for layer in layer_list:
-        layer_tiles = [tile for tile in tile_list if tile.startswith(layer)]
-        squared_matrix, filler_tile = build_layer_matrix(layer_tiles, filler, duplicate_list, col, row)
+        tile_match = re.match(CATALOG_TILE_PATTERN, tile)
+        if tile_match and tile_match.group(3) != 'ai':
+            layer_tiles.setdefault(tile_match.group(1), {})[int(tile_match.group(2))] = tile
 
-        filler_list.append(filler_tile)
-        layers_lists.append(squared_matrix)
+    return {layer: build_layer_matrix(tiles, fillers, col, row) for layer, tiles in sorted(layer_tiles.items())}
 
-    return layers_lists, filler_list
 
-
-def build_layer_matrix(tile_list, filler, duplicate_pos, col, row):
+def build_layer_matrix(tile_list, fillers, col, row):
     """
-    For a given layer, for each int in duplicate_pos, append "filler" tile name once, creating a number of items in list
-    equal to col x row.
+    For a given layer, places each exported tile, in order, in the next grid position without a filler, and the named
+    filler tile in every other, making a list of col x row tile names.
 
-    In a 3x3 matrix where filler tile was in position 2 and missing tiles in positions [5, 7, 8], squared_matrix list
-    would return:
+    In a 3x3 matrix where missing positions [5, 7, 8] are filled by tile 2, squared_matrix would be:
 
         ['t-000.png', 't-001.png', 't-002.png',
-         't-003.png', 't-004.png', 't-006.png',
-         't-002.png', 't-002.png', 't-002.png']
+         't-003.png', 't-004.png', 't-002.png',
+         't-005.png', 't-002.png', 't-002.png']
 
     This is then passed to restructure_layer_matrix() for renaming of tiles, including "filler" positions.
 
-    :param tile_list:       list, required      list of tiles in a layer, e.g. ['base-001.png', 'base-002.png', ...]
-    :param filler:          int, required       "filler" tile position to duplicate into duplicate_list positions
-    :param duplicate_pos:   list, required      int tile positions to duplicate "filler" tile into, e.g. [7, 11, 12]
+    A layer already filled by an earlier run has a tile in every grid position, and each filler tile has already moved
+    to its own grid position; its matrix is built from those positions, so filling it again changes nothing.
+
+    :param tile_list:       dict, required      tile names keyed by tile number, e.g. {0: 'base-000.png', ...}
+    :param fillers:         dict, required      filler tile number keyed by grid position; see read_filler_spec()
     :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
     :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
-
     :return:                list                squared_matrix: list of tile names to make a complete matrix
-                            str                 filler_tile:    name of "filler" tile
     """
-    tile = col * row
+    tile_positions = [position for position in range(col * row) if position not in fillers]
+    if any(filler >= len(tile_positions) for filler in fillers.values()):
+        raise ValueError('filler tiles {} must be among the exported tiles'.format(sorted(set(fillers.values()))))
 
-    filler_tile = ''
-    squared_matrix = []
+    if fillers and sorted(tile_list) == list(range(col * row)):                 # filled by an earlier run
+        return [tile_list[tile_positions[fillers[position]]] if position in fillers else tile_list[position]
+                for position in range(col * row)]
 
-    t_iter = t_iter_list = 0
+    if sorted(tile_list) != list(range(len(tile_positions))):
+        raise ValueError('expected tiles numbered 0 to {}, to fill the {} grid positions without a filler; found {}'
+                         .format(len(tile_positions) - 1, len(tile_positions), sorted(tile_list)))
 
-    while t_iter < tile:
-        if t_iter in duplicate_pos:
-            squared_matrix.append(filler_tile)
-        else:
-            if t_iter_list == filler:
-                filler_tile = tile_list[filler]
-            squared_matrix.append(tile_list[t_iter_list])
-            t_iter_list += 1
-        t_iter += 1
+    tiles = iter(tile_list[tile_ct] for tile_ct in range(len(tile_list)))
 
-    return squared_matrix, filler_tile
+    return [tile_list[fillers[position]] if position in fillers else next(tiles) for position in range(col * row)]
 
 
 def create_matrix(col, row, tile_list=None):
@@ -140,8 +132,7 @@ def get_filler_tiles():
     """
     Requests from user location of "filler" tile, and "empty" locations in the tile matrix in which to place "filler".
 
-    :return:                int     f_tile          "filler" tile number
-                            list    duplicates_sep  matrix locations to place "filler" tile
+    :return:                dict                filler spec, e.g. {3: [4, 5, 6]}; see read_filler_spec()
     """
     dialog_get_filler_tile_space = 'Enter number of tile to duplicate into empty spaces (e.g. 3): '
     dialog_get_filler_tiles_list = \
@@ -151,7 +142,7 @@ def get_filler_tiles():
     duplicate_spaces = input(dialog_get_filler_tiles_list)
     duplicates_sep = [int(i) for i in duplicate_spaces.replace(' ', '').split(',')]
 
-    return f_tile, duplicates_sep
+    return {f_tile: duplicates_sep}
 
 
 def make_spacing(tiles_ct):
@@ -176,46 +167,118 @@ def make_spacing(tiles_ct):
     return spacing
 
 
-def reset_tile_names(layer_path):
+def read_filler_spec(filler_spec, col, row):
     """
+    Reads a declarative filler spec, which names the grid positions an incomplete Illustrator file has no artboard for,
+    and the exported tile to fill each with, so fill_incomplete() can run without prompting. Filler tiles are numbered
+    as exported, e.g. 3 for 'base-003.png'; grid positions are numbered as by create_matrix(). A spec may be:
 
-    :param layer_path:       str, required       folder path, e.g. 'C:\\path\\to\\file\\'
-    :return:
-    """
-    tile_list = get_file_list(layer_path)
-    for tile in tile_list:
-        layer_name = re.match(r'^\D+', tile).group(0)
-        layer_number = tile.replace(layer_name, '')
-        reformatted_layer_name = layer_name + '-' + layer_number
-        os.rename(layer_path + tile, layer_path + reformatted_layer_name)
+        dict            grid positions keyed by filler tile, e.g. {3: [5, 7, 8], 0: [12]}
+        .json file      path to a JSON file holding the same, e.g. {"3": [5, 7, 8], "0": [12]}
+        mask image      path to a col x row image (see FILLER_MASK_IMAGE); a pixel of FILLER_MASK_TILE_VALUE is a grid
+                        position with a tile, and any other value the number of the filler tile to place there
+        mask string     rows of a col x row grid, separated by new lines or FILLER_MASK_ROW_SEPARATOR; in each row,
+                        FILLER_MASK_TILE is a grid position with a tile, and a number the filler tile to place there.
+                        Positions are separated by spaces; if no row has spaces, each character is a position, so
+                        only filler tiles 0 to 9 can be named, and two numbers side by side are rejected, as they
+                        could be read as one
+
+    For a 4x3 grid, the following masks are equivalent:
+
+        '# # # #/# # 3 3/# # # 0'       '# # # #\\n# # 3 3\\n# # # 0'       {3: [6, 7], 0: [11]}
 
+    Without spaces, '####/#3#3/###0' is {3: [5, 7], 0: [11]}, but '####/##33/###0' is rejected, as 33 could be tile 33.
 
-def restructure_layer_matrix(layer_path, layers_list, layer_names, filler_list):
+    :param filler_spec:     dict/str, required  filler spec, as above
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param row:             int, required       count of artboard rows in Illustrator file (starting at 1)
+    :return:                dict                filler tile number keyed by grid position, e.g. {6: 3, 7: 3, 11: 0}
+    """
+    if isinstance(filler_spec, str) and filler_spec.lower().endswith('.json'):
+        with open(filler_spec) as spec_file:
+            filler_spec = json.load(spec_file)
+
+    elif isinstance(filler_spec, str) and filler_spec.lower().endswith(FILLER_MASK_IMAGE):
+        if Image is None:
+            raise ImportError('a filler mask image requires Pillow')
+        with Image.open(filler_spec) as mask:
+            if mask.size != (col, row):
+                raise ValueError('filler mask {} must be {}x{} pixels'.format(filler_spec, col, row))
+            mask_values = list(mask.convert('L').getdata())
+        filler_spec = {}
+        for position, value in enumerate(mask_values):
+            if value != FILLER_MASK_TILE_VALUE:
+                filler_spec.setdefault(value, []).append(position)
+
+    elif isinstance(filler_spec, str):
+        mask_rows = [r.strip() for r in filler_spec.replace(FILLER_MASK_ROW_SEPARATOR, '\n').splitlines() if r.strip()]
+        separated = any(len(r.split()) > 1 for r in mask_rows)
+        if not separated and any(re.search(r'\d\d', r) for r in mask_rows):
+            raise ValueError('filler mask has numbers side by side; separate its tiles with spaces: {!r}'
+                             .format(filler_spec))
+        mask_cells = [r.split() if separated else list(r) for r in mask_rows]
+        if len(mask_cells) != row or any(len(cells) != col for cells in mask_cells):
+            raise ValueError('filler mask must be {} rows of {} tiles{}: {!r}'.format(
+                row, col, '' if separated else ', or separated by spaces to name filler tiles above 9', filler_spec))
+        filler_spec = {}
+        for position, cell in enumerate(c for cells in mask_cells for c in cells):
+            if cell != FILLER_MASK_TILE:
+                filler_spec.setdefault(int(cell), []).append(position)
+
+    fillers = {}
+    for filler, positions in filler_spec.items():
+        for position in positions:
+            if position in fillers or not 0 <= position < col * row:
+                raise ValueError('grid position {} is repeated, or outside the {}x{} grid'.format(position, col, row))
+            fillers[position] = int(filler)
+
+    return fillers
+
+
+def restructure_layer_matrix(layer_path, layer_matrix, fillers, catalog=None, verbose=False):
     """
-    Iterates through each tile list in layers_list, renaming numbers (000, 001, etc.) of existing and "filler" tiles,
-    creating "filler" tiles where necessary.
+    For each layer in layer_matrix, renames (numbers 000, 001, etc.) existing tiles to their grid positions, and fills
+    each "filler" position with a hardlink to the layer's filler tile, so filler tiles take no further disk space; where
+    a hardlink can't be created (e.g., the file system doesn't support them), the filler tile is copied instead. A
+    filler position left by an earlier run is removed first, never written in place, as it may be a link. If
+    catalog is given, its entries are moved to match, without listing layer_path again.
 
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
-    :param layers_list:     list, required      list of tiles list, e.g. [['base-000.png', ...], ['grid-000.png', ...]]
-    :param layer_names:     list, required      list of layer names, e.g. ['base', 'grid']
-    :param filler_list:     list, required      list of "filler" tiles by layer, e.g. ['base-003.png', 'grid-003.png']
+    :param layer_matrix:    dict, required      tile names per grid position keyed by layer name, from build_matrix()
+    :param fillers:         dict, required      filler tile number keyed by grid position; see read_filler_spec()
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog()
+    :param verbose:         bool, optional      if True, prints out details of task
     :return:                none
     """
-    layer_ct = 0
-    file_to_remove = ''
-
-    for layer in layers_list:
-        tile_ct = 0
-        layer_name = layer_names[layer_ct]
-        for tile in layer:
-            t = tile_number(tile_ct)
-            if tile == filler_list[layer_ct]:
-                file_to_remove = tile
-                shutil.copy(layer_path + tile, layer_path + layer_name + t + '.png')
-            else:
-                os.rename(layer_path + tile, layer_path + layer_name + t + '.png')
-            tile_ct += 1
-        layer_ct += 1
-        os.remove(layer_path + file_to_remove)
-
-    reset_tile_names(layer_path)
+    for layer, squared_matrix in layer_matrix.items():
+        print('Filling {} positions of {}...'.format(len(fillers), layer)) if verbose else None
+        tile_files = {}
+
+        suffix = os.path.splitext(squared_matrix[0])[1]
+
+        # exported tiles only ever move to a later grid position, so renaming from the last position back never
+        # overwrites a tile which hasn't yet been moved
+        for position in reversed(range(len(squared_matrix))):
+            if position not in fillers:
+                tile_file = layer + '-' + tile_number(position) + suffix
+                if squared_matrix[position] != tile_file:
+                    os.rename(layer_path + squared_matrix[position], layer_path + tile_file)
+                tile_files[squared_matrix[position]] = tile_file
+
+        for position in sorted(fillers):
+            filler_file = layer_path + tile_files[squared_matrix[position]]
+            tile_file = layer_path + layer + '-' + tile_number(position) + suffix
+            os.remove(tile_file) if os.path.isfile(tile_file) else None     # filled by an earlier run
+            try:
+                os.link(filler_file, tile_file)
+            except OSError:
+                shutil.copy(filler_file, tile_file)
+
+        if catalog:
+            source_entries = {e['file']: e for e in catalog['layers'].get(layer, {}).values()}
+            catalog['layers'][layer] = {
+                position: dict(source_entries[tile], file=layer + '-' + tile_number(position) + suffix)
+                for position, tile in enumerate(squared_matrix)
+            }
+            catalog['files'] = sorted(set(catalog['files']).difference(squared_matrix).union(
+                e['file'] for e in catalog['layers'][layer].values()))
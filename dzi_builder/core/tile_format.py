@@ -0,0 +1,257 @@
+import functools
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from dzi_builder.core.constants import (
+    PALETTE_MAX_COLOURS,
+    PALETTE_SCAN_COLOURS,
+    PALETTE_TRANSPARENT,
+    PNG_RGBA,
+    TILE_FORMAT_AUTO,
+    TILE_FORMAT_DEFAULTS,
+    TILE_FORMAT_JPEG,
+    TILE_FORMAT_OPAQUE,
+    TILE_FORMAT_PNG,
+    TILE_FORMAT_TRANSPARENT,
+    TILE_FORMAT_WEBP,
+    TILE_SUFFIXES
+)
+
+from dzi_builder.core.toolkit import (
+    read_png_header
+)
+
+
+def get_layer_palette(tile_files, colours=PALETTE_MAX_COLOURS, tolerance=0):
+    """
+    Returns a palette for a low-colour layer (e.g., grid, borders, labels), or None if the layer has too many colours.
+    The distinct RGBA colours of every artboard tile are counted, with every fully transparent pixel counted as
+    PALETTE_TRANSPARENT, which is always the first entry; from the most common down, each colour is added to the
+    palette unless already within tolerance of an entry (see get_palette_match()). If tolerance is 0, the palette is
+    exact.
+
+    Counting stops at the first tile with more than PALETTE_SCAN_COLOURS distinct colours, so anti-aliased or
+    photographic layers are quick to rule out; a low-colour layer has each tile decoded once.
+
+    :param tile_files:      list, required      paths of layer's artboard tiles
+    :param colours:         int, optional       maximum count of palette entries (2-256)
+    :param tolerance:       int, optional       maximum difference in any channel (0-255) between a pixel and its entry
+    :return:                list                palette, as [r, g, b, a] entries, or None
+    """
+    if Image is None or not tile_files:
+        return None
+
+    colour_counts = {}
+    for tile_file in tile_files:
+        with Image.open(tile_file) as tile:
+            tile_colours = tile.convert('RGBA').getcolors(colours if tolerance == 0 else PALETTE_SCAN_COLOURS)
+        if tile_colours is None:
+            return None
+        for count, colour in tile_colours:
+            colour = colour if colour[3] else PALETTE_TRANSPARENT
+            colour_counts[colour] = colour_counts.get(colour, 0) + count
+        if len(colour_counts) > PALETTE_SCAN_COLOURS:
+            return None
+
+    palette = [PALETTE_TRANSPARENT]
+    for colour in sorted(colour_counts, key=lambda c: (-colour_counts[c], c)):
+        if get_palette_match(colour, tuple(palette), tolerance) is None:
+            palette.append(colour)
+        if len(palette) > colours:
+            return None
+
+    return [list(c) for c in palette]
+
+
+@functools.lru_cache(maxsize=65536)
+def get_palette_match(colour, palette, tolerance=0):
+    """
+    Returns the index of the palette entry nearest to an RGBA colour, by the largest difference in any channel, or None
+    if no entry is within tolerance. A fully transparent colour matches PALETTE_TRANSPARENT, whatever its RGB.
+
+    :param colour:          tuple, required     RGBA colour, e.g. (255, 0, 0, 255)
+    :param palette:         tuple, required     palette, as (r, g, b, a) entries
+    :param tolerance:       int, optional       maximum difference in any channel (0-255)
+    :return:                int                 index of palette entry, or None
+    """
+    colour = colour if colour[3] else PALETTE_TRANSPARENT
+    if tolerance == 0:
+        return palette.index(colour) if colour in palette else None
+
+    distance, index = min((max(abs(a - b) for a, b in zip(colour, entry)), i) for i, entry in enumerate(palette))
+
+    return index if distance <= tolerance else None
+
+
+def get_pillow_save_options(tile_format):
+    """
+    Returns the Pillow format and save options for a resolved tile format; see get_tile_format(). Effort maps to
+    optimize for JPEG, method (0-6) for WebP, and compress_level (0-9) for png; a WebP quality of 100 is lossless.
+
+    :param tile_format:     dict, required      tile format, from get_tile_format()
+    :return:                str                 Pillow format, e.g. 'JPEG'
+                            dict                Pillow save options
+    """
+    quality, effort = tile_format['quality'], tile_format['effort']
+
+    if tile_format['format'] == TILE_FORMAT_JPEG:
+        return 'JPEG', {'quality': quality, 'optimize': effort > 0}
+    if tile_format['format'] == TILE_FORMAT_WEBP:
+        return 'WEBP', {'quality': quality, 'method': min(effort, 6), 'lossless': quality >= 100}
+
+    return 'PNG', {'compress_level': min(effort, 9)}
+
+
+def get_tile_format(tile_format, layer, tile_files):
+    """
+    Resolves the output tile format of a layer's pyramid. tile_format may be given for every layer, or per layer, as a
+    dict keyed by layer name (layers not listed are TILE_FORMAT_AUTO); each format is one of:
+
+        'jpeg', 'webp' or 'png'                             default quality and effort; see TILE_FORMAT_DEFAULTS
+        {'format': 'webp', 'quality': 80, 'effort': 4}      quality (1-100) and effort are optional
+        TILE_FORMAT_AUTO, or None                           TILE_FORMAT_OPAQUE if the layer has no transparent
+                                                            pixels (see is_layer_opaque()), else TILE_FORMAT_TRANSPARENT
+
+    e.g. {'base': {'format': 'jpeg', 'quality': 90}, 'roads': 'webp'}.
+
+    A png layer is also checked for being low-colour (see get_layer_palette()); if it is, its palette is returned, and
+    its tiles are saved as 8 bit palette images, with a tRNS chunk for transparency, rather than as 32 bit RGBA. By
+    default the palette is exact; png formats may also give:
+
+        {'format': 'png', 'colours': 64, 'tolerance': 8}    quantizes to at most 64 colours, each pixel within 8 of
+                                                            its original value in every channel
+        {'format': 'png', 'palette': False}                 never uses a palette
+
+    :param tile_format:     str/dict, required  tile format, for every layer or keyed by layer name
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_files:      list, required      paths of layer's artboard tiles, to check for transparency and colours
+    :return:                dict                format, quality and effort, and palette for png
+    """
+    if isinstance(tile_format, dict) and 'format' not in tile_format:
+        tile_format = tile_format.get(layer)
+    if tile_format in (None, TILE_FORMAT_AUTO):
+        tile_format = TILE_FORMAT_OPAQUE if is_layer_opaque(tile_files) else TILE_FORMAT_TRANSPARENT
+
+    tile_format = {'format': tile_format} if isinstance(tile_format, str) else dict(tile_format)
+    tile_format['format'] = tile_format['format'].lower().replace('jpg', TILE_FORMAT_JPEG)
+    if tile_format['format'] not in TILE_SUFFIXES:
+        raise ValueError('{}: tile format must be one of {}'.format(layer, sorted(TILE_SUFFIXES)))
+
+    resolved = dict(TILE_FORMAT_DEFAULTS[tile_format['format']])
+    resolved.update(tile_format)
+    if resolved['format'] == TILE_FORMAT_PNG:
+        if resolved['palette'] == TILE_FORMAT_AUTO:
+            resolved['palette'] = get_layer_palette(tile_files, resolved['colours'], resolved['tolerance'])
+        resolved['palette'] = resolved['palette'] or None
+
+    return resolved
+
+
+def get_vips_suffix(tile_format):
+    """
+    Returns the dzsave suffix, with save options, for a resolved tile format; see get_tile_format(). e.g.:
+
+        {'format': 'jpeg', 'quality': 85, 'effort': 1}      -->     '.jpg[Q=85,optimize_coding]'
+
+    A png format is always saved as RGBA, palette or not: libvips' own palette quantization picks its own palette, for
+    every level alike, so the blended edges of coarser levels would be posterized. Tiles are paletted after dzsave
+    instead; see palettize_pyramid().
+
+    :param tile_format:     dict, required      tile format, from get_tile_format()
+    :return:                str                 dzsave suffix
+    """
+    quality, effort = tile_format['quality'], tile_format['effort']
+    suffix = '.' + TILE_SUFFIXES[tile_format['format']]
+
+    if tile_format['format'] == TILE_FORMAT_JPEG:
+        return suffix + '[Q={}{}]'.format(quality, ',optimize_coding' if effort > 0 else '')
+    if tile_format['format'] == TILE_FORMAT_WEBP:
+        return suffix + '[Q={},effort={}{}]'.format(quality, min(effort, 6), ',lossless' if quality >= 100 else '')
+
+    return suffix + '[compression={}]'.format(min(effort, 9))
+
+
+def is_layer_opaque(tile_files):
+    """
+    Returns True if no pixel of any of a layer's artboard tiles is transparent, so the layer can be saved in a format
+    without an alpha channel. Checking stops at the first tile with a transparent pixel, so overlay layers are quick
+    to rule out; an opaque layer has each tile decoded once. Without Pillow, only png headers are read, and a tile
+    with an alpha channel is taken to be transparent.
+
+    :param tile_files:      list, required      paths of layer's artboard tiles
+    :return:                bool                True if layer is fully opaque
+    """
+    if not tile_files:
+        return False
+
+    for tile_file in tile_files:
+        if Image is None:
+            if read_png_header(tile_file)[3] in (4, PNG_RGBA):
+                return False
+            continue
+
+        with Image.open(tile_file) as tile:
+            if 'A' not in tile.getbands() and 'transparency' not in tile.info:
+                continue
+            if tile.convert('RGBA').getchannel('A').getextrema()[0] < 255:
+                return False
+
+    return True
+
+
+def quantize_tile(tile, palette, tolerance=0, extend=False):
+    """
+    Converts a tile to an 8 bit palette image, mapping each pixel to its palette entry; see get_palette_match(). If any
+    colour has no entry within tolerance, None is returned; or, if extend is True, the colour is kept as an entry of
+    its own, and the tile gets a palette of just the entries it uses (e.g., a coarser pyramid tile, whose blended
+    edges weren't in the layer's artboard tiles). None is also returned if that palette has more than
+    PALETTE_MAX_COLOURS entries. Pixels are mapped with a vectorized lookup if numpy can be imported, and one at a time
+    otherwise.
+
+    :param tile:            PIL.Image, required tile image
+    :param palette:         list, required      palette, from get_layer_palette()
+    :param tolerance:       int, optional       maximum difference in any channel (0-255)
+    :param extend:          bool, optional      if True, colours not in palette are added to the tile's palette
+    :return:                PIL.Image           palette image, or None
+    """
+    tile = tile.convert('RGBA')
+    tile_colours = tile.getcolors(PALETTE_SCAN_COLOURS)
+    if tile_colours is None:
+        return None
+
+    palette = tuple(tuple(c) for c in palette)
+    tile_palette = [] if extend else list(palette)
+    tile_index = {c: i for i, c in enumerate(tile_palette)}
+    lookup = {}
+    for _, colour in tile_colours:
+        index = get_palette_match(colour, palette, tolerance)
+        if index is None and not extend:
+            return None
+        entry = colour if index is None else palette[index]
+        if entry not in tile_index:
+            tile_index[entry] = len(tile_palette)
+            tile_palette.append(entry)
+        lookup[int.from_bytes(bytes(colour), sys.byteorder)] = tile_index[entry]
+
+    if len(tile_palette) > PALETTE_MAX_COLOURS:
+        return None
+
+    if np is not None:
+        colours, indices = (np.array(v) for v in zip(*sorted(lookup.items())))
+        pixels = np.frombuffer(tile.tobytes(), dtype=np.uint32)         # one 32 bit int per RGBA pixel
+        pixel_indices = indices.astype(np.uint8)[np.searchsorted(colours.astype(np.uint32), pixels)].tobytes()
+    else:
+        pixel_indices = bytes(map(lookup.__getitem__, memoryview(tile.tobytes()).cast('I')))
+    paletted = Image.frombytes('P', tile.size, pixel_indices)
+    paletted.putpalette([v for entry in tile_palette for v in entry], rawmode='RGBA')
+
+    return paletted
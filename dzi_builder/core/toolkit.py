@@ -1,8 +1,14 @@
+import hashlib
+import json
 import os
 import re
+import struct
 
 from dzi_builder.core.constants import (
-    LAYERS_FOLDER
+    BUILD_MANIFEST,
+    LAYER_META,
+    LAYERS_FOLDER,
+    PNG_SIGNATURE
 )
 
 
@@ -117,16 +123,36 @@ def get_layer_list(layer_path, verbose=False):
 
         ['base', 'grid']
 
+    The build manifest (see write_build_manifest()) is not a layer, and is skipped.
+
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                list                list of layer names
     """
     print('Creating tile conversion prep list...') if verbose else None
-    layer_name_list = list(set([re.sub(r'-\d{1,3}\.\D*|\.\D*', '', i) for i in get_file_list(layer_path)]))
+    layer_name_list = list(set([re.sub(r'-\d{1,3}\.\D*|\.\D*', '', i) for i in get_file_list(layer_path)
+                                if i != BUILD_MANIFEST]))
 
     return layer_name_list
 
 
+def get_layer_meta(dzi_path, layer):
+    """
+    Returns the metadata recorded for a layer's pyramid by post-processing steps (e.g., dedupe_pyramid()), stored next
+    to the layer's .dzi file, e.g. dzi/base.json. Returns an empty dict if nothing has been recorded.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                dict                layer metadata
+    """
+    meta_file = dzi_path + LAYER_META.format(layer)
+    if not os.path.isfile(meta_file):
+        return {}
+
+    with open(meta_file) as f:
+        return json.load(f)
+
+
 def get_path(path):
     """
     Given a file path, strips off the file, and returns only the directory.
@@ -137,6 +163,31 @@ def get_path(path):
     return path[:path.rfind('\\')+1]
 
 
+def hash_data(data):
+    """
+    Returns a content hash of bytes, matching hash_file() for a file with that content.
+
+    :param data:            bytes, required     content to hash
+    :return:                str                 hex digest
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_file(file_path):
+    """
+    Returns a content hash of a file, read in chunks so large files aren't held in memory.
+
+    :param file_path:       str, required       path to file
+    :return:                str                 hex digest
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
 def prefix_path_to_list(path, file_list):
     """
     Given a folder path, creates a list of files with path.
@@ -146,3 +197,45 @@ def prefix_path_to_list(path, file_list):
     :return:                list                converted list
     """
     return [path + r for r in file_list]
+
+
+def read_png_header(tile_file):
+    """
+    Reads only the IHDR chunk at the start of a png file, without decoding any pixels. Colour types are:
+
+        0   greyscale               2   RGB                     3   palette
+        4   greyscale with alpha    6   RGB with alpha (RGBA)
+
+    :param tile_file:       str, required       path to png file, e.g. 'C:\\path\\to\\layers\\base-000.png'
+    :return:                int                 width
+                            int                 height
+                            int                 bit depth
+                            int                 colour type
+    """
+    with open(tile_file, 'rb') as f:
+        header = f.read(26)
+
+    if len(header) < 26 or header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        raise ValueError('{} is not a png file'.format(tile_file))
+
+    width, height, bit_depth, colour_type = struct.unpack('>IIBB', header[16:26])
+
+    return width, height, bit_depth, colour_type
+
+
+def update_layer_meta(dzi_path, layer, **meta):
+    """
+    Adds or replaces keys in a layer's metadata; see get_layer_meta(). A key set to None is removed.
+
+    :param dzi_path:        str, required       dzi folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\dzi\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param meta:            optional            keys and values to record
+    :return:                dict                updated layer metadata
+    """
+    layer_meta = get_layer_meta(dzi_path, layer)
+    layer_meta.update(meta)
+    layer_meta = {k: v for k, v in layer_meta.items() if v is not None}
+
+    create_file(dzi_path, LAYER_META.format(layer), json.dumps(layer_meta, separators=(',', ':')))
+
+    return layer_meta
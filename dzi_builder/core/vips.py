@@ -1,24 +1,120 @@
 import os
-import subprocess
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    filter_layer_tiles,
+    get_catalog_entry,
+    get_catalog_layers,
+    get_catalog_tiles,
+    update_tile_catalog
+)
+
+from dzi_builder.core.events import (
+    run_command
+)
+
+from dzi_builder.core.parallel import (
+    get_thread_count,
+    run_layer_jobs
+)
+
+from dzi_builder.core.pyramid import (
+    Image,
+    build_tile_grid,
+    get_crop_bounds,
+    palettize_pyramid,
+    remove_pyramid
+)
+
+from dzi_builder.core.pyvips_engine import (
+    get_layer_tiles,
+    pyvips
+)
+
+from dzi_builder.core.tile_format import (
+    get_tile_format,
+    get_vips_suffix
+)
 
 from dzi_builder.core.toolkit import (
-    get_layer_list
+    get_file_list,
+    read_png_header,
+    update_layer_meta
 )
 
 from dzi_builder.core.constants import (
     ARRAYJOIN,
     COMPOSITE,
-    DZSAVE
+    CROP,
+    DZSAVE,
+    PNG_RGBA
 )
 
 
-def combine_transparent_layer(layer_path, col, vips_path, verbose=False):
+def add_alpha_channel(layer_path, tile, vips_path, verbose=False):
+    """
+    Rewrites a single tile as an 8 bit RGBA png. Runs in-process with pyvips or Pillow where either can be imported;
+    otherwise, runs 'vips composite'. In every case the tile is written to a temp file, which then replaces the tile, as
+    libvips reads the source tile lazily, and writing over it in place would truncate it mid-read.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param tile:            str, required       name of tile, e.g. 'base-000.png'
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    if pyvips is not None:
+        tile_img = pyvips.Image.new_from_file(layer_path + tile, access='sequential')
+        if tile_img.bands < 3 or tile_img.format != 'uchar':
+            tile_img = tile_img.colourspace('srgb')
+        if not tile_img.hasalpha():
+            tile_img = tile_img.bandjoin(255)
+        tile_img.write_to_file(layer_path + 'temp_' + tile)
+
+    elif Image is not None:
+        with Image.open(layer_path + tile) as tile_img:
+            rgba = tile_img.convert('RGBA')
+        rgba.save(layer_path + 'temp_' + tile, format='PNG')
+
+    else:
+        vips_fmt_layer_path = layer_path.replace('\\', '\\\\')                  # libvips arrays need double \\ in paths
+        composite = COMPOSITE.format(vips_fmt_layer_path + tile, vips_fmt_layer_path + 'temp_' + tile)
+        print(composite) if verbose else None
+        run_command(composite, cwd=vips_path, shell=True, verbose=verbose)
+
+    os.replace(layer_path + 'temp_' + tile, layer_path + tile)
+
+
+def combine_layer(layer_path, layer, tile_list, col, vips_path, catalog=None, verbose=False):
+    """
+    Runs the alpha normalization and arrayjoin steps of combine_transparent_layer() for a single layer; see
+    normalize_layer() and join_layer_tiles().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of all tiles in folder, e.g. ['base-000.png', 'base-001.png'...]
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog()
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    normalize_layer(layer_path, layer, tile_list, vips_path, catalog, verbose)
+    join_layer_tiles(layer_path, layer, tile_list, col, vips_path, verbose)
+
+
+def combine_transparent_layer(layer_path, col, vips_path, jobs=1, max_memory=0, layer_names=None, catalog=None,
+                              verbose=False):
     """
     Uses libvips to combine individual tiles into a complete layer, to convert to a Deep Zoom Image.
 
     Blank tiles and tiles with no transparency are by default produced as 24 bit, while transparent layers have an
-    alpha channel (are 32 bit). libvips fails when trying to combine 24 and 32 bit images; as such, the libvips
-    function 'composite' is called as a loop on each tile to force-add an alpha channel to the image.
+    alpha channel (are 32 bit). libvips fails when trying to combine 24 and 32 bit images; as such, normalize_tiles()
+    force-adds an alpha channel to every tile which doesn't already have one.
 
     Once all tiles are 32 bit, a list of all tiles is generated, and fed to the libvips function 'arrayjoin', joining
     all tiles into a single image, with the number of images across corresponding to the col variable of this function.
@@ -37,50 +133,56 @@ def combine_transparent_layer(layer_path, col, vips_path, verbose=False):
     and was going to deprecate after I was finished - and I may do so in the future - but for now, it's easy
     enough to point the script to wherever you compiled/unzipped vips-dev-x.x
 
+    Layers are independent of one another; if jobs is greater than 1, they are combined concurrently, see
+    run_layer_jobs(). Tiles, and their png headers, are taken from catalog (see build_tile_catalog()), so layer_path
+    is listed once at most.
+
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
     :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
     :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param layer_names:     list, optional      list of layer names; if None, every layer in catalog
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                none
     """
+    catalog = build_tile_catalog(layer_path) if catalog is None else catalog
+    layer_name_list = get_catalog_layers(catalog) if layer_names is None else layer_names
 
-    try:
+    run_layer_jobs(combine_layer, layer_name_list, jobs, max_memory, layer_path=layer_path,
+                   tile_list=get_catalog_tiles(catalog, layer_name_list), col=col, vips_path=vips_path,
+                   catalog=catalog, verbose=verbose)
 
-        layer_list = []
-        vips_fmt_layer_path = layer_path.replace('\\', '\\\\')                  # libvips arrays need double \\ in paths
-        lx = 0
-
-        tile_list = [f for f in os.listdir(layer_path) if os.path.isfile(os.path.join(layer_path, f))]
-        layer_name_list = get_layer_list(layer_path)
-
-        for l in layer_name_list:
 
-            for layer_name in layer_name_list:
-                layer_list.append([t for t in tile_list if t.startswith(layer_name)])
-
-            tile_list = layer_list[lx]
-            lx += 1
+def join_layer_tiles(layer_path, layer, tile_list, col, vips_path, verbose=False):
+    """
+    Runs arrayjoin on a single layer's tiles, writing the combined layer png; tiles must already be normalized.
 
-            for t in tile_list:
-                temp_t = 'temp_' + t
-                os.rename(layer_path + t, layer_path + temp_t)
-                composite = COMPOSITE.format(vips_fmt_layer_path + temp_t, vips_fmt_layer_path + t)
-                print(composite) if verbose else None
-                subprocess.run(composite, cwd=vips_path, shell=True, capture_output=True, text=True)
-                os.remove(layer_path + 'temp_' + t)
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of all tiles in folder, e.g. ['base-000.png', 'base-001.png'...]
+    :param col:             int, required       count of artboard columns in Illustrator file (starting at 1)
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    try:
 
-            tile_list = [vips_fmt_layer_path + t for t in tile_list]
+        vips_fmt_layer_path = layer_path.replace('\\', '\\\\')                  # libvips arrays need double \\ in paths
+        tile_list = [vips_fmt_layer_path + t for t in filter_layer_tiles(tile_list, layer)]
 
-            tile_array = '"' + ' '.join(tile_list) + '"'
-            arrayjoin = ARRAYJOIN.format(tile_array, vips_fmt_layer_path + l + '.png', col)
-            print(arrayjoin) if verbose else None
-            subprocess.run(arrayjoin, cwd=vips_path, shell=True, capture_output=True, text=True)
+        tile_array = '"' + ' '.join(tile_list) + '"'
+        arrayjoin = ARRAYJOIN.format(tile_array, vips_fmt_layer_path + layer + '.png', col)
+        print(arrayjoin) if verbose else None
+        run_command(arrayjoin, cwd=vips_path, shell=True, layer=layer, verbose=verbose)
 
     except IndexError as e:
         print('tile_{}; clear non-tile files from layer_path'.format(e))
 
 
-def make_image_pyramid(layer_path, layer_list, vips_path, verbose=False):
+def make_image_pyramid(layer_path, layer_list, vips_path, jobs=1, max_memory=0, tile_format=None, crop=False,
+                       catalog=None, verbose=False):
     """
     Use libvips to generate a Deep Zoom Image from png in directory, for every layer name provided.
     In the .../layers/html/dzi/ folder, a dzi file and a series of tile pyramid folders will be created:
@@ -96,23 +198,133 @@ def make_image_pyramid(layer_path, layer_list, vips_path, verbose=False):
 
     For more, see: https://libvips.github.io/libvips/API/current/Making-image-pyramids.md.html
 
+    Tiles are written in the format given by tile_format, for every layer or per layer; by default, layers with no
+    transparent pixels are written as JPEG, and the rest as png. See get_tile_format().
+
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
     :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
     :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param jobs:            int, optional       number of layers to process at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list of layer names, crops layers to their content
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog(); if None, layer_path is listed
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                none
+    """
+    tile_list = get_catalog_tiles(catalog, layer_list) if catalog else get_file_list(layer_path)
+    run_layer_jobs(make_layer_pyramid, layer_list, jobs, max_memory, layer_path=layer_path, vips_path=vips_path,
+                   tile_format=tile_format, crop=crop, tile_list=tile_list, verbose=verbose)
+
+
+def make_layer_pyramid(layer_path, layer, vips_path, tile_format=None, crop=False, tile_list=None, verbose=False):
+    """
+    Runs dzsave for a single layer; see make_image_pyramid(). If crop applies to the layer, the bounding box of its
+    content is read from its artboard tiles, exactly as by the other engines (see get_crop_bounds()), and dzsave is run
+    on a temp crop of the combined layer to that box. The tiles of a low-colour png layer are then paletted; see
+    palettize_pyramid().
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param tile_format:     str/dict, optional  output tile format, for every layer or keyed by layer name
+    :param crop:            bool/list, optional if True, or a list including layer, crops layer to its content
+    :param tile_list:       list, optional      list of files in layer_path; if None, layer_path is listed
     :param verbose:         bool, optional      if True, prints out details of task
     :return:                none
     """
-    for layer in layer_list:
-        dz_save = DZSAVE.format(
-            layer_path,
-            layer + '.png',
-            layer_path + 'html\\dzi\\',
-            layer
-        )
-        print(dz_save) if verbose else None
-
-        sp_out = subprocess.run(dz_save, cwd=vips_path, shell=True, capture_output=verbose, text=verbose)
-        print(sp_out.stdout) if verbose else None
+    layer_tiles = get_layer_tiles(layer_path, layer, tile_list)
+    layer_format = get_tile_format(tile_format, layer, [layer_path + t for t in layer_tiles])
+    source = layer + '.png'
+    canvas = list(read_png_header(layer_path + source)[:2])
+    bounds = None
+
+    if crop is True or (crop and layer in crop):
+        tile_width, tile_height = read_png_header(layer_path + layer_tiles[0])[:2]
+        col, row = canvas[0] // tile_width, canvas[1] // tile_height                # combined layer is col x row tiles
+        bounds = get_crop_bounds(build_tile_grid(layer_path, layer, col, layer_tiles), layer, crop, col, row)
+
+    if bounds:
+        left, top, right, bottom = bounds = list(bounds)
+        run_command(CROP.format(layer_path, source, layer_path, layer + '.crop.v', left, top, right - left,
+                                bottom - top), cwd=vips_path, shell=True, layer=layer, verbose=verbose)
+        source = layer + '.crop.v'
+
+    dzi_path = os.path.join(layer_path, 'html', 'dzi', '')
+    dz_save = DZSAVE.format(
+        layer_path,
+        source,
+        dzi_path,
+        layer,
+        get_vips_suffix(layer_format)
+    )
+    print(dz_save) if verbose else None
+
+    remove_pyramid(dzi_path, layer)
+    run_command(dz_save, cwd=vips_path, shell=True, layer=layer, verbose=verbose)
+    palettize_pyramid(dzi_path, layer, layer_format)
+    os.remove(layer_path + source) if bounds else None
+    update_layer_meta(dzi_path, layer, tile_format=layer_format, bounds=bounds,
+                      canvas=canvas if bounds else None)
+
+
+def normalize_layer(layer_path, layer, tile_list, vips_path, catalog=None, verbose=False):
+    """
+    Runs normalize_tiles() on a single layer's tiles.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :param tile_list:       list, required      list of all tiles in folder, e.g. ['base-000.png', 'base-001.png'...]
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog()
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                list                list of tiles which were rewritten
+    """
+    return normalize_tiles(layer_path, filter_layer_tiles(tile_list, layer), vips_path, catalog, verbose)
+
+
+def normalize_tiles(layer_path, tile_list, vips_path, catalog=None, verbose=False):
+    """
+    Ensures every tile in tile_list is an 8 bit RGBA png, so tiles can be joined by arrayjoin. Only the png header of
+    each tile is read to sort tiles, or its header as recorded in catalog, if given; tiles which are already 8 bit RGBA
+    are left untouched, and only the remainder are rewritten, in a pool of threads (see add_alpha_channel()), and
+    updated in catalog. Tiles hardlinked to one another (e.g., filler tiles; see restructure_layer_matrix()) are
+    rewritten once, and linked again to the tile which replaced them.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
+    :param tile_list:       list, required      list of tiles, e.g. ['base-000.png', 'base-001.png'...]
+    :param vips_path:       str. required       path to vips.exe, e.g. 'C:\\Program Files\\vips\\bin\\'
+    :param catalog:         dict, optional      tile catalog, from build_tile_catalog()
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                list                list of tiles which were rewritten
+    """
+    def get_png_format(t):
+        tile_entry = get_catalog_entry(catalog, t) if catalog else None
+        if tile_entry and tile_entry['colour_type'] is not None:
+            return tile_entry['bit_depth'], tile_entry['colour_type']
+        return read_png_header(layer_path + t)[2:]
+
+    needs_alpha = [t for t in tile_list if get_png_format(t) != (8, PNG_RGBA)]
+    print('Adding alpha channel to {} of {} tiles...'.format(len(needs_alpha), len(tile_list))) if verbose else None
+
+    linked_tiles = {}
+    for t in needs_alpha:
+        tile_stat = os.stat(layer_path + t)
+        linked_tiles.setdefault((tile_stat.st_dev, tile_stat.st_ino), []).append(t)
+
+    with ThreadPoolExecutor(max_workers=get_thread_count()) as pool:
+        list(pool.map(lambda tiles: add_alpha_channel(layer_path, tiles[0], vips_path, verbose), linked_tiles.values()))
+
+    for tiles in linked_tiles.values():
+        for t in tiles[1:]:
+            if not os.path.samefile(layer_path + tiles[0], layer_path + t):
+                os.link(layer_path + tiles[0], layer_path + t + '.tmp')
+                os.replace(layer_path + t + '.tmp', layer_path + t)
+
+    if catalog:
+        update_tile_catalog(catalog, needs_alpha)
+
+    return needs_alpha
 
 
 def tile_number(n, mod=0):
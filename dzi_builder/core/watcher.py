@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+
+from dzi_builder.core.constants import (
+    PNG_END,
+    WATCH_POLL_INTERVAL,
+    WATCH_TILE_PATTERN
+)
+
+from dzi_builder.core.scheduler import (
+    run_task_graph
+)
+
+
+def get_ready_layers(layer_path, tile_count, tile_sizes, final=False):
+    """
+    Scans layer_path for artboard tiles, named [layer]-[iter].png, and returns the layers whose tiles are all there
+    and finished being written. A layer is ready once it has tile_count tiles, every one of which is a complete png
+    (see is_png_complete()) whose size hasn't changed since the previous scan; tile_sizes holds the sizes from the
+    previous scan, and is updated in place.
+
+    If final is True (the export has finished, so nothing is still being written), tiles needn't be stable.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\layers\\'
+    :param tile_count:      int, required       count of tiles in a complete layer, i.e. col * row
+    :param tile_sizes:      dict, required      tile sizes from the previous scan, keyed by file name
+    :param final:           bool, optional      if True, doesn't wait for tile sizes to be stable
+    :return:                list                list of layer names
+    """
+    layer_tiles = {}
+    for f in os.listdir(layer_path):
+        match = re.match(WATCH_TILE_PATTERN, f)
+        if match:
+            layer_tiles.setdefault(match.group(1), []).append(f)
+
+    ready = []
+    for layer, tile_list in sorted(layer_tiles.items()):
+        if len(tile_list) != tile_count:
+            continue
+
+        stable = True
+        for tile in tile_list:
+            try:
+                tile_size = os.path.getsize(layer_path + tile)
+            except OSError:                                     # removed or renamed since listing
+                tile_size = None
+            stable = stable and tile_size is not None and (final or tile_sizes.get(tile) == tile_size)
+            tile_sizes[tile] = tile_size
+
+        if stable and all(is_png_complete(layer_path + t) for t in tile_list):
+            ready.append(layer)
+
+    return ready
+
+
+def is_png_complete(tile_file):
+    """
+    Returns True if a png file has been written through to its closing IEND chunk; a tile still being exported by
+    Illustrator is cut off before it.
+
+    :param tile_file:       str, required       path to png file, e.g. 'C:\\path\\to\\layers\\base-000.png'
+    :return:                bool                True if png is complete
+    """
+    try:
+        with open(tile_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < len(PNG_END):
+                return False
+            f.seek(-len(PNG_END), os.SEEK_END)
+            return f.read() == PNG_END
+    except OSError:
+        return False
+
+
+def make_layer_watcher(layer_path, tile_count, build_layer_tasks, export_done, streamed_layers, verbose=False):
+    """
+    Returns a function for run_task_graph() to poll for new tasks: each call scans layer_path (see get_ready_layers())
+    and returns the tasks of any layer which has become ready since, from build_layer_tasks(layer). Once export_done
+    is set, one final scan is made, after which the function returns None.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\layers\\'
+    :param tile_count:      int, required       count of tiles in a complete layer, i.e. col * row
+    :param build_layer_tasks:   function, required  returns a dict of tasks for a single layer
+    :param export_done:     Event, required     set once tiles are no longer being exported
+    :param streamed_layers: list, required      list to append names of layers to, as their tasks are added
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                function            returns tasks to add, or None once finished
+    """
+    tile_sizes = {}
+    finished = []
+
+    def add_tasks():
+        if finished:
+            return None
+
+        final = export_done.is_set()                            # checked before scanning, so no tile is missed
+        new_tasks = {}
+        for layer in get_ready_layers(layer_path, tile_count, tile_sizes, final):
+            if layer not in streamed_layers:
+                print('{} exported; starting...'.format(layer)) if verbose else None
+                streamed_layers.append(layer)
+                new_tasks.update(build_layer_tasks(layer))
+
+        finished.append(True) if final else None
+        return new_tasks
+
+    return add_tasks
+
+
+def stream_layers(layer_path, tile_count, export_fn, build_layer_tasks, jobs=1, max_memory=0,
+                  poll_interval=WATCH_POLL_INTERVAL, verbose=False):
+    """
+    Builds layers while their tiles are still being exported. export_fn() (e.g., generate_tiles(), which exports one
+    layer's tiles at a time) is run in the calling thread, as Illustrator's COM object belongs to it; meanwhile, a
+    background thread watches layer_path, and as soon as a layer has all of its tiles exported, adds the layer's tasks
+    (e.g., from build_layer_graph()) to a running task graph; see run_task_graph(). Export and build then take roughly
+    as long as the slower of the two, rather than the sum of both.
+
+    Layers which never have tile_count complete tiles (e.g., an incomplete Illustrator file, to be filled in with
+    filler tiles) aren't built here; they're left out of the returned list of streamed layers.
+
+    Any exception raised by a task is raised here once export_fn() has returned.
+
+    :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\layers\\'
+    :param tile_count:      int, required       count of tiles in a complete layer, i.e. col * row
+    :param export_fn:       function, required  exports tiles to layer_path, taking no arguments
+    :param build_layer_tasks:   function, required  returns a dict of tasks for a single layer, e.g.:
+
+                                                    lambda layer: build_layer_graph(layer_path, [layer], col, vips_path)
+
+    :param jobs:            int, optional       number of tasks to run at once
+    :param max_memory:      int, optional       memory budget in MB shared by all jobs; if 0, based on system memory
+    :param poll_interval:   float, optional     seconds between scans of layer_path
+    :param verbose:         bool, optional      if True, prints out details of task
+    :return:                object              value returned by export_fn()
+                            list                list of layer names streamed
+    """
+    export_done = threading.Event()
+    streamed_layers = []
+    errors = []
+    add_tasks = make_layer_watcher(layer_path, tile_count, build_layer_tasks, export_done, streamed_layers, verbose)
+
+    def run_watcher():
+        try:
+            run_task_graph({}, jobs, max_memory, add_tasks, poll_interval, verbose=verbose)
+        except Exception as e:
+            errors.append(e)
+
+    watcher = threading.Thread(target=run_watcher, name='dzi-builder-watcher', daemon=True)
+    watcher.start()
+    try:
+        export_result = export_fn()
+    finally:
+        export_done.set()
+        watcher.join()
+
+    if errors:
+        raise errors[0]
+
+    return export_result, streamed_layers
@@ -0,0 +1,28 @@
+import argparse
+
+from dzi_builder.core.deploy import (
+    make_deploy
+)
+
+
+def main():
+    """
+    Command line entry point for make_deploy(), e.g.:
+
+        python -m dzi_builder.deploy C:\\path\\to\\file\\layers\\ --tarball
+
+    :return:                none
+    """
+    parser = argparse.ArgumentParser(prog='python -m dzi_builder.deploy', description='List the files of a generated '
+                                     'site added, changed or removed since the previous build.')
+    parser.add_argument('layer_path', help='layers folder of a generated site, containing html')
+    parser.add_argument('--tarball', action='store_true', help='also pack the files to push into a tarball')
+    parser.add_argument('--dry-run', action='store_true', help="don't store the new hash index")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    make_deploy(args.layer_path, args.tarball, args.dry_run, verbose=True)
+
+
+if __name__ == '__main__':
+    main()
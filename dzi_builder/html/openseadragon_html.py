@@ -1,46 +1,102 @@
+import json
+import os
+
 from dzi_builder.core.constants import (
     BASE_LAYER,
+    COMBINATION_SEPARATOR,
     OPACITY_TOGGLE_DIV,
+    OSD_EVICT_SECONDS,
     OSD_VIEWER_ID,
+    SERVICE_WORKER,
     SITE_NAME
 )
 
+from dzi_builder.core.pyramid import (
+    read_dzi
+)
+
 from dzi_builder.core.toolkit import (
-    create_file
+    create_file,
+    get_layer_meta
 )
 
+from dzi_builder.html.service_worker import (
+    make_precache_manifest,
+    make_service_worker
+)
 
-def make_site(layer_path, layer_list):
+
+def make_site(layer_path, layer_list, combinations=None, viewer_options=None, evict_after=OSD_EVICT_SECONDS,
+              precache_level=None):
     """
     Given a layer path and a list of layer names, generates the necessary html/css/js files for OpenJavascript to load
     a dzi file on the web.
 
+    If precache_level is given, also generates a service worker, which the viewer registers, and its precache
+    manifest: every pyramid tile at or below precache_level is downloaded once, and served from the browser's cache
+    thereafter. See make_service_worker().
+
     See /layers/openseadragon/readme.txt - requires OpenSeadragon files here: https://openseadragon.github.io/#download
     :param layer_path:      str, required       folder path, e.g. 'C:\\path\\to\\file\\'
     :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
+    :param combinations:    list, optional      names of pre-composited layer combinations; see get_combination_name()
+    :param viewer_options:  dict, optional      OpenSeadragon viewer options; see make_openseadragon_html()
+    :param evict_after:     int, optional       seconds a hidden layer is kept in the viewer; if 0, never removed
+    :param precache_level:  int, optional       deepest pyramid level to precache; if None, no service worker
     :return:                none
     """
-    html_path = layer_path + 'html\\'
-    osd_path = html_path + 'openseadragon\\'
+    html_path = os.path.join(layer_path, 'html', '')
+    osd_path = os.path.join(html_path, 'openseadragon', '')
 
     readme = 'download the zip from https://openseadragon.github.io/#download, drop openseadragon files here.\n\n' \
              'download the zip from https://jquery.com/download/, drop jquery file here; you will likely need\n' \
              'to modify the html file to point to the correct jquery-#.#.#.min.js (line 5 in viewer.html).'
     create_file(osd_path, 'README.txt', readme)
 
-    make_openseadragon_html(html_path, layer_list)
+    make_openseadragon_html(html_path, layer_list, combinations=combinations, viewer_options=viewer_options,
+                            evict_after=evict_after, service_worker=precache_level is not None)
     make_openseadragon_css(html_path)
 
+    if precache_level is not None:
+        version = make_precache_manifest(html_path, layer_list + list(combinations or []), precache_level)
+        make_service_worker(html_path, version)
+
 
-def make_openseadragon_html(html_path, layer_list, viewer_id=OSD_VIEWER_ID, opacity_div=OPACITY_TOGGLE_DIV):
+def make_openseadragon_html(html_path, layer_list, viewer_id=OSD_VIEWER_ID, opacity_div=OPACITY_TOGGLE_DIV,
+                            combinations=None, viewer_options=None, evict_after=OSD_EVICT_SECONDS,
+                            service_worker=False):
     """
     Generates HTML file with JS necessary for a basic implementation of a Deep Zoom Image, based on a list of layer
     names, div name for OpenSeadragon viewer, and div name for OpenSeadragon layer opacity toggle buttons.
 
+    Only BASE_LAYER is opened with the viewer; every other layer is added to the viewer with addTiledImage() the first
+    time it's toggled on, at its place in the stacking order, so page load and tile requests scale with the layers
+    shown, rather than every layer. A layer toggled off is hidden; once it has been hidden for evict_after seconds,
+    it's removed from the viewer, freeing its cached tiles, and is added again if it's toggled back on.
+
+    If combinations are given (see build_combination_pyramid()), each is stacked after the layers. Whenever the layers
+    toggled on match a combination, the combination is shown in their place, so the viewer requests and draws one tile
+    per viewport cell rather than one per layer; any other set of layers is shown layer by layer. A combination is
+    only used if its layers are in the viewer's stacking order, BASE_LAYER first.
+
+    Layers cropped to their content (see get_crop_bounds()) are placed at their offset in the full layer; see
+    make_placement_js().
+
+    viewer_options are passed to OpenSeadragon as they are, to tune its tile pipeline, e.g.:
+
+        {'imageLoaderLimit': 4}             tiles downloaded at once; by default, unlimited
+        {'maxImageCacheCount': 500}         decoded tiles kept in memory, across every layer; by default, 200
+        {'immediateRender': True}           draws the zoom level being loaded, without blending in from coarser levels
+        {'drawer': 'canvas'}                'webgl', 'canvas' or 'html'; OpenSeadragon 5 and later
+
     :param html_path:       str, required       path to generate html file, e.g. '\\layers\\html\\'
     :param layer_list:      list, required      list of layer names, e.g. ['river', 'base', 'grid']
     :param viewer_id:       str, optional       div name for OpenSeadragon viewer
     :param opacity_div:     str, optional       div name for OpenSeadragon layer opacity toggle buttons
+    :param combinations:    list, optional      names of pre-composited layer combinations; see get_combination_name()
+    :param viewer_options:  dict, optional      OpenSeadragon viewer options, e.g. {'imageLoaderLimit': 4}
+    :param evict_after:     int, optional       seconds a hidden layer is kept in the viewer; if 0, never removed
+    :param service_worker:  bool, optional      if True, registers the site's service worker; see make_service_worker()
     :return:                none
     """
     toggle_button_layers = ''
@@ -56,50 +112,42 @@ def make_openseadragon_html(html_path, layer_list, viewer_id=OSD_VIEWER_ID, opac
     except ValueError:
         pass
 
-    for layer in layer_list:
+    combination_items = {}
+    for combination in combinations or []:
+        combined_layers = combination.split(COMBINATION_SEPARATOR)
+        if all(layer in layer_list for layer in combined_layers) and \
+                combined_layers == sorted(combined_layers, key=layer_list.index):
+            combination_items[','.join(combined_layers)] = combination
+    layer_order = layer_list + list(combination_items.values())
+
+    for layer in layer_order:
         # generate openseadragon map layer variables
-        layer_fmt = '            var {0} = \'dzi/{0}.dzi\'\n'.format(layer)
-        script_layers += layer_fmt
-
-        # generate openseadragon tileSources
-        suffix = ',' if layer_ct < layers_len else ''
-        opacity = 1 if layer == BASE_LAYER else 0
-        js_layers = """
-                    {{
-                        x: 0,
-                        y: 0,
-                        opacity: {0},
-                        tileSource: {1}
-                    }}{2}""".format(opacity, layer, suffix)
-
-        if layer != BASE_LAYER:
+        script_layers += make_tile_source_js(html_path, layer)
+
+        # generate openseadragon tile sources, added to the viewer when first shown
+        suffix = ',' if layer_ct < len(layer_order) - 1 else ''
+        script_sources_layers += """
+                {0}: {{{1}
+                    tileSource: {0}
+                }}{2}""".format(layer, make_placement_js(html_path, layer), suffix)
+
+        if layer in layer_list and layer != BASE_LAYER:
             # generate toggle buttons html
             sep = ' - ' if layer_ct < layers_len else ''
             button_fmt = '            <a class="{0}Toggle">{0}</a>{1}\n'.format(layer, sep)
             toggle_button_layers += button_fmt
 
             # generate toggle buttons jquery functionality
-            layer_fmt = """
-                var {0}Opacity = 0;
-                $('.{0}Toggle').on('click', function() {{
-                    if ({0}Opacity === 0) {{
-                        {0}Opacity = 1;
-                    }} else {{
-                        {0}Opacity = 0;
-                    }}
-                    {0}Fade(viewer.world.getItemAt({1}), {0}Opacity);
-                }});
-                var {0}Fade = function(image, opacity) {{
-                    image.setOpacity({0}Opacity);
-                    OpenSeadragon.requestAnimationFrame(frame);
-                }};
-                """.format(layer, layer_ct)
+            script_toggle_layers += """
+            $('.{0}Toggle').on('click', function() {{
+                toggleLayer('{0}');
+            }});""".format(layer)
 
-            script_toggle_layers += layer_fmt
-
-        script_sources_layers += js_layers
         layer_ct += 1
 
+    options = ''.join('\n                {}: {},'.format(option, json.dumps(value))
+                      for option, value in (viewer_options or {}).items())
+
     html_str = """
 <html>
     <head>
@@ -114,6 +162,17 @@ def make_openseadragon_html(html_path, layer_list, viewer_id=OSD_VIEWER_ID, opac
         <script>
             // map layers
 {3}
+            // tile sources, keyed by layer, in stacking order
+            var layerSources = {{{5}
+            }};
+            var layerOrder = {6};
+            var layerVisible = {7};
+            var combinationItems = {8};
+            var layerItems = {{}};
+            var layerLoading = {{}};
+            var hiddenSince = {{}};
+            var evictAfter = {9};
+
             // openseadragon viewer
             var viewer = OpenSeadragon({{
                 id: '{4}',
@@ -122,12 +181,85 @@ def make_openseadragon_html(html_path, layer_list, viewer_id=OSD_VIEWER_ID, opac
                 zoomInButton: 'zoom-in',
                 zoomOutButton: 'zoom-out',
                 homeButton: 'home',
-                fullPageButton: 'full-page',
-                tileSources: [{5}
-                ]
+                fullPageButton: 'full-page',{10}
+                tileSources: layerVisible.{11} ? [$.extend({{opacity: 1}}, layerSources.{11})] : []
             }});
+            if (layerVisible.{11}) {{
+                layerLoading.{11} = true;
+                viewer.addOnceHandler('open', function() {{
+                    delete layerLoading.{11};
+                    layerItems.{11} = viewer.world.getItemAt(0);
+                    updateLayers();
+                }});
+            }}
+
+            // position of a layer in the viewer, counting only the layers added to it
+            var getItemIndex = function(layer) {{
+                return layerOrder.slice(0, layerOrder.indexOf(layer)).filter(function(other) {{
+                    return layerItems[other];
+                }}).length;
+            }};
+
+            // shows or hides a layer; a layer is only added to the viewer the first time it's shown
+            var showLayer = function(layer, shown) {{
+                var item = layerItems[layer];
+                if (shown) {{
+                    delete hiddenSince[layer];
+                }} else if (item && !(layer in hiddenSince)) {{
+                    hiddenSince[layer] = Date.now();
+                }}
+                if (item) {{
+                    item.setOpacity(shown ? 1 : 0);
+                }} else if (shown && !layerLoading[layer]) {{
+                    layerLoading[layer] = true;
+                    viewer.addTiledImage($.extend({{
+                        opacity: 1,
+                        success: function(event) {{
+                            delete layerLoading[layer];
+                            layerItems[layer] = event.item;
+                            viewer.world.setItemIndex(event.item, getItemIndex(layer));
+                            updateLayers();
+                        }},
+                        error: function() {{
+                            delete layerLoading[layer];
+                        }}
+                    }}, layerSources[layer]));
+                }}
+            }};
+
+            // shows the layers toggled on, or the pre-composited combination of them, if there is one; the layers stay
+            // shown until the combination has been added to the viewer
+            var updateLayers = function() {{
+                var visible = layerOrder.filter(function(layer) {{
+                    return layerVisible[layer];
+                }});
+                var combined = combinationItems[visible.join(',')];
+                var ready = combined && layerItems[combined];
+                $.each(layerOrder, function(i, layer) {{
+                    showLayer(layer, ready ? layer === combined : layer === combined || layerVisible[layer] === true);
+                }});
+            }};
 
-            // jquery button functionality {6}
+            var toggleLayer = function(layer) {{
+                layerVisible[layer] = !layerVisible[layer];
+                updateLayers();
+            }};
+
+            // removes layers hidden for longer than evictAfter, freeing their cached tiles
+            var evictLayers = function() {{
+                $.each(Object.keys(hiddenSince), function(i, layer) {{
+                    if (Date.now() - hiddenSince[layer] >= evictAfter) {{
+                        viewer.world.removeItem(layerItems[layer]);
+                        delete layerItems[layer];
+                        delete hiddenSince[layer];
+                    }}
+                }});
+            }};
+            if (evictAfter) {{
+                setInterval(evictLayers, Math.min(evictAfter, 60000));
+            }}
+{13}
+            // jquery button functionality {12}
         </script>
     </body>
 </html>""".format(
@@ -137,7 +269,19 @@ def make_openseadragon_html(html_path, layer_list, viewer_id=OSD_VIEWER_ID, opac
             script_layers,
             viewer_id,
             script_sources_layers,
-            script_toggle_layers
+            json.dumps(layer_order),
+            json.dumps({layer: layer == BASE_LAYER for layer in layer_list}),
+            json.dumps(combination_items),
+            evict_after * 1000,
+            options,
+            BASE_LAYER,
+            script_toggle_layers,
+            """
+            // service worker, serving coarse pyramid levels from the browser's cache
+            if ('serviceWorker' in navigator) {{
+                navigator.serviceWorker.register('{0}');
+            }}
+""".format(SERVICE_WORKER) if service_worker else ''
         )
 
     create_file(html_path, '{}.html'.format(SITE_NAME), html_str)
@@ -168,3 +312,94 @@ a {{
 }}""".format(viewer_id, opacity_div)
 
     create_file(html_path, '{}.css'.format(SITE_NAME), css_str)
+
+
+def make_placement_js(html_path, layer):
+    """
+    Generates the position of a layer's tiled image in the viewer, in viewport coordinates, where the full layer is 1
+    wide. A layer cropped to its content (see get_crop_bounds()) is placed at its offset, and scaled to its width, from
+    the bounds and full layer size recorded in its metadata; any other layer is placed at 0, 0, at full width.
+
+    :param html_path:       str, required       path to generate html file, e.g. '\\layers\\html\\'
+    :param layer:           str, required       name of layer, e.g. 'rivers'
+    :return:                str                 JavaScript x, y and width properties
+    """
+    layer_meta = get_layer_meta(os.path.join(html_path, 'dzi', ''), layer)
+    if 'bounds' not in layer_meta:
+        return """
+                    x: 0,
+                    y: 0,"""
+
+    left, top, right, _ = layer_meta['bounds']
+    canvas_width = layer_meta['canvas'][0]
+
+    return """
+                    x: {0},
+                    y: {1},
+                    width: {2},""".format(left / canvas_width, top / canvas_width, (right - left) / canvas_width)
+
+
+def make_tile_source_js(html_path, layer):
+    """
+    Generates the JavaScript variable holding a layer's OpenSeadragon tile source. Usually this is simply the path to
+    the layer's .dzi file; if tiles have been removed from the layer's pyramid, a custom tile source is generated from
+    the .dzi descriptor instead:
+
+        aliases     duplicate tiles removed by dedupe_pyramid(); getTileUrl() requests the kept tile in their place
+        empty       fully transparent tiles removed by remove_empty_tiles(), or never written by the grid engine;
+                    tileExists() returns false for these, so OpenSeadragon never requests them
+
+    :param html_path:       str, required       path to generate html file, e.g. '\\layers\\html\\'
+    :param layer:           str, required       name of layer, e.g. 'base'
+    :return:                str                 JavaScript variable declaration
+    """
+    dzi_path = os.path.join(html_path, 'dzi', '')
+    layer_meta = get_layer_meta(dzi_path, layer)
+
+    if not layer_meta.get('aliases') and not layer_meta.get('empty'):
+        return '            var {0} = \'dzi/{0}.dzi\'\n'.format(layer)
+
+    dzi = read_dzi(dzi_path, layer)
+
+    return """            var {0}Aliases = {{}};
+            $.each({1}, function(tile, duplicates) {{
+                $.each(duplicates, function(i, duplicate) {{
+                    {0}Aliases[duplicate] = tile;
+                }});
+            }});
+            var {0}Empty = {2};
+            var {0} = {{
+                width: {3},
+                height: {4},
+                tileSize: {5},
+                tileOverlap: {6},
+                getTileUrl: function(level, x, y) {{
+                    var tile = level + '/' + x + '_' + y;
+                    return 'dzi/{0}_files/' + ({0}Aliases[tile] || tile) + '.{7}';
+                }},
+                tileExists: function(level, x, y) {{
+                    var numTiles = this.getNumTiles(level);
+                    if (level < this.minLevel || level > this.maxLevel || x < 0 || y < 0 ||
+                            x >= numTiles.x || y >= numTiles.y) {{
+                        return false;
+                    }}
+                    var runs = {0}Empty[level] || [];
+                    var position = y * numTiles.x + x;
+                    for (var i = 0; i < runs.length && runs[i][0] <= position; i++) {{
+                        if (position < runs[i][0] + runs[i][1]) {{
+                            return false;
+                        }}
+                    }}
+                    return true;
+                }}
+            }}
+""".format(
+        layer,
+        json.dumps(layer_meta.get('aliases', {}), separators=(',', ':')),
+        json.dumps(layer_meta.get('empty', {}), separators=(',', ':')),
+        dzi['width'],
+        dzi['height'],
+        dzi['tile_size'],
+        dzi['overlap'],
+        dzi['suffix']
+    )
@@ -0,0 +1,253 @@
+import json
+import os
+
+from dzi_builder.core.archive import (
+    get_archive_file,
+    hash_archive_tiles
+)
+
+from dzi_builder.core.constants import (
+    PRECACHE_MANIFEST,
+    SERVICE_WORKER,
+    SW_PRECACHE_BATCH,
+    SW_RUNTIME_CACHE_SIZE
+)
+
+from dzi_builder.core.pyramid import (
+    get_pyramid_tiles,
+    read_dzi
+)
+
+from dzi_builder.core.toolkit import (
+    create_file,
+    hash_data,
+    hash_file
+)
+
+
+def get_precache_files(html_path, layer_list, precache_level):
+    """
+    Returns every file of a generated site to precache, as URLs relative to the site, with a content hash of each:
+    the viewer files in html_path (any OpenSeadragon and jQuery files included), each layer's .dzi descriptor, and
+    each layer's pyramid tiles at or below precache_level, read from its layer_files/ folder or its archive (see
+    archive_pyramid()). Levels are numbered as by dzsave, so level 8 is at most 256 pixels across.
+
+    :param html_path:       str, required       html folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\'
+    :param layer_list:      list, required      list of layer (and combination) names, e.g. ['base', 'grid']
+    :param precache_level:  int, required       deepest pyramid level to precache
+    :return:                dict                hex digests keyed by URL, e.g. 'dzi/base_files/0/0_0.jpg'
+    """
+    dzi_path = os.path.join(html_path, 'dzi', '')
+    precache_files = {}
+
+    for folder, folders, files in os.walk(html_path):
+        folders[:] = [f for f in folders if os.path.join(folder, f) != os.path.normpath(dzi_path)]
+        for file_name in sorted(files):
+            url = os.path.relpath(os.path.join(folder, file_name), html_path).replace(os.sep, '/')
+            if url not in (SERVICE_WORKER, PRECACHE_MANIFEST):
+                precache_files[url] = hash_file(os.path.join(folder, file_name))
+
+    for layer in layer_list:
+        precache_files['dzi/{}.dzi'.format(layer)] = hash_file(dzi_path + layer + '.dzi')
+        suffix = read_dzi(dzi_path, layer)['suffix']
+        tile_url = 'dzi/' + layer + '_files/{}.' + suffix
+
+        for tile_key, tile_file in get_pyramid_tiles(dzi_path, layer).items():
+            if int(tile_key.split('/')[0]) <= precache_level:
+                precache_files[tile_url.format(tile_key)] = hash_file(tile_file)
+
+        if os.path.isfile(get_archive_file(dzi_path, layer)):
+            for tile_key, tile_hash in hash_archive_tiles(get_archive_file(dzi_path, layer), precache_level).items():
+                precache_files[tile_url.format(tile_key)] = tile_hash
+
+    return precache_files
+
+
+def make_precache_manifest(html_path, layer_list, precache_level):
+    """
+    Writes the precache manifest read by the service worker, html/precache.json: every file from get_precache_files(),
+    with its content hash, and a version hashed from all of them, which changes whenever any file does.
+
+    :param html_path:       str, required       html folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\'
+    :param layer_list:      list, required      list of layer (and combination) names, e.g. ['base', 'grid']
+    :param precache_level:  int, required       deepest pyramid level to precache
+    :return:                str                 manifest version
+    """
+    precache_files = get_precache_files(html_path, layer_list, precache_level)
+    version = hash_data(json.dumps(precache_files, sort_keys=True).encode())
+    create_file(html_path, PRECACHE_MANIFEST, json.dumps({'version': version, 'files': precache_files},
+                                                         separators=(',', ':'), sort_keys=True))
+
+    return version
+
+
+def make_service_worker(html_path, version, cache_size=SW_RUNTIME_CACHE_SIZE):
+    """
+    Writes the service worker for a generated site, html/sw.js, which the viewer registers:
+
+        install     fills a precache named for the manifest version with every file in the precache manifest (see
+                    make_precache_manifest()): files whose hash is unchanged are copied from the precaches of earlier
+                    versions, and the rest are downloaded in batches of SW_PRECACHE_BATCH, so an update only downloads
+                    the tiles which changed; the worker already active keeps serving its own precache meanwhile, so a
+                    failed install never leaves it serving a mix of old and new tiles
+        activate    deletes the precaches of earlier versions
+        fetch       serves precached files cache-first; serves any other pyramid tile from a runtime cache, kept to
+                    the cache_size tiles most recently used; passes everything else to the network
+
+    The manifest version is written into the worker, so browsers see a changed worker, and install it, whenever any
+    precached file changes. Repeat visits, and offline use at overview zoom, need no network requests.
+
+    :param html_path:       str, required       html folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\'
+    :param version:         str, required       manifest version, from make_precache_manifest()
+    :param cache_size:      int, optional       pyramid tiles kept in the runtime cache
+    :return:                none
+    """
+    sw_str = """// dzi-builder service worker, manifest version {0}
+var VERSION = '{0}';
+var MANIFEST = '{1}';
+var PRECACHE_PREFIX = 'dzi-precache';
+var PRECACHE = PRECACHE_PREFIX + '-' + VERSION;
+var RUNTIME = 'dzi-runtime';
+var PRECACHE_BATCH = {2};
+var RUNTIME_CACHE_SIZE = {3};
+var TILE_PATTERN = /_files\\/\\d+\\/\\d+_\\d+\\.\\w+$/;
+
+var getPath = function(url) {{
+    return url.slice(self.registration.scope.length).split('?')[0];
+}};
+
+// downloads files a batch at a time, bypassing the browser's http cache; any failure fails the install, and the
+// worker already installed carries on
+var addFiles = function(cache, urls) {{
+    return urls.reduce(function(previous, url, i) {{
+        if (i % PRECACHE_BATCH) {{
+            return previous;
+        }}
+        return previous.then(function() {{
+            return cache.addAll(urls.slice(i, i + PRECACHE_BATCH).map(function(batchUrl) {{
+                return new Request(batchUrl, {{cache: 'reload'}});
+            }}));
+        }});
+    }}, Promise.resolve());
+}};
+
+// drops the least recently used entries past size; entries are kept in the order they were last put
+var trimCache = function(cache, size) {{
+    return cache.keys().then(function(keys) {{
+        return Promise.all(keys.slice(0, Math.max(keys.length - size, 0)).map(function(key) {{
+            return cache.delete(key);
+        }}));
+    }});
+}};
+
+// copies each url from the precaches of earlier versions which hold it with the same hash, skipping those already in
+// precache from an earlier, failed install of this version; returns the urls left to download
+var copyFiles = function(precache, manifest) {{
+    return Promise.all([caches.keys(), precache.keys()]).then(function(results) {{
+        var cached = results[1].map(function(key) {{
+            return getPath(key.url);
+        }});
+        var urls = Object.keys(manifest.files).filter(function(url) {{
+            return cached.indexOf(url) === -1;
+        }});
+        return results[0].filter(function(name) {{
+            return name.indexOf(PRECACHE_PREFIX) === 0 && name !== PRECACHE;
+        }}).reduce(function(previous, name) {{
+            return previous.then(function(remaining) {{
+                return caches.open(name).then(function(cache) {{
+                    return cache.match(MANIFEST).then(function(response) {{
+                        return response ? response.json() : {{files: {{}}}};
+                    }}).then(function(earlier) {{
+                        return Promise.all(remaining.map(function(url) {{
+                            if (earlier.files[url] !== manifest.files[url]) {{
+                                return url;
+                            }}
+                            return cache.match(url).then(function(response) {{
+                                return response ? precache.put(url, response).then(function() {{
+                                    return null;
+                                }}) : url;
+                            }});
+                        }}));
+                    }});
+                }}).then(function(left) {{
+                    return left.filter(function(url) {{
+                        return url !== null;
+                    }});
+                }});
+            }});
+        }}, Promise.resolve(urls));
+    }});
+}};
+
+self.addEventListener('install', function(event) {{
+    event.waitUntil(Promise.all([
+        fetch(MANIFEST, {{cache: 'no-store'}}).then(function(response) {{
+            return response.json();
+        }}),
+        caches.open(PRECACHE)
+    ]).then(function(results) {{
+        var manifest = results[0];
+        var precache = results[1];
+        if (manifest.version !== VERSION) {{
+            throw new Error('precache manifest is version ' + manifest.version + ', not ' + VERSION);
+        }}
+        return copyFiles(precache, manifest).then(function(changed) {{
+            return addFiles(precache, changed);
+        }}).then(function() {{
+            return precache.put(MANIFEST, new Response(JSON.stringify(manifest)));
+        }});
+    }}).then(function() {{
+        return self.skipWaiting();
+    }}));
+}});
+
+self.addEventListener('activate', function(event) {{
+    event.waitUntil(caches.keys().then(function(names) {{
+        return Promise.all(names.filter(function(name) {{
+            return name.indexOf(PRECACHE_PREFIX) === 0 && name !== PRECACHE;
+        }}).map(function(name) {{
+            return caches.delete(name);
+        }}));
+    }}).then(function() {{
+        return self.clients.claim();
+    }}));
+}});
+
+var fetchRuntime = function(event, request) {{
+    return caches.open(RUNTIME).then(function(runtime) {{
+        return runtime.match(request).then(function(cached) {{
+            if (cached) {{
+                var copy = cached.clone();
+                event.waitUntil(runtime.delete(request).then(function() {{
+                    return runtime.put(request, copy);
+                }}));
+                return cached;
+            }}
+            return fetch(request).then(function(response) {{
+                if (response.ok) {{
+                    var copy = response.clone();
+                    event.waitUntil(runtime.put(request, copy).then(function() {{
+                        return trimCache(runtime, RUNTIME_CACHE_SIZE);
+                    }}));
+                }}
+                return response;
+            }});
+        }});
+    }});
+}};
+
+self.addEventListener('fetch', function(event) {{
+    var request = event.request;
+    if (request.method !== 'GET' || request.url.indexOf(self.registration.scope) !== 0) {{
+        return;
+    }}
+    var tile = TILE_PATTERN.test(getPath(request.url));
+    event.respondWith(caches.open(PRECACHE).then(function(precache) {{
+        return precache.match(request, {{ignoreSearch: true}});
+    }}).then(function(response) {{
+        return response || (tile ? fetchRuntime(event, request) : fetch(request));
+    }}));
+}});
+""".format(version, PRECACHE_MANIFEST, SW_PRECACHE_BATCH, cache_size)
+
+    create_file(html_path, SERVICE_WORKER, sw_str)
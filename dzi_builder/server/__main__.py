@@ -0,0 +1,33 @@
+import argparse
+
+from dzi_builder.core.constants import (
+    SERVER_HOST,
+    SERVER_PORT
+)
+
+from dzi_builder.server.tile_server import (
+    serve_site
+)
+
+
+def main():
+    """
+    Command line entry point for serve_site(), e.g.:
+
+        python -m dzi_builder.server C:\\path\\to\\file\\layers\\html\\ --port 8080
+
+    :return:                none
+    """
+    parser = argparse.ArgumentParser(prog='python -m dzi_builder.server', description='Serve a dzi-builder site, with '
+                                     'tiles from layer archives.')
+    parser.add_argument('html_path', help='html folder of a generated site')
+    parser.add_argument('--host', default=SERVER_HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='port to listen on')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    serve_site(args.html_path, args.host, args.port, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
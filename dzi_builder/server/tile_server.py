@@ -0,0 +1,93 @@
+import functools
+import mimetypes
+import os
+import re
+import urllib.parse
+
+from http.server import (
+    SimpleHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+
+from dzi_builder.core.archive import (
+    get_archive_file,
+    read_archive_tile
+)
+
+from dzi_builder.core.constants import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_TILE_PATTERN
+)
+
+
+class TileRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the generated site from html_path as static files, as SimpleHTTPRequestHandler does, except that a pyramid
+    tile request, dzi/[layer]_files/[level]/[col]_[row].[suffix], with no tile file on disk is served from the layer's
+    archive, if it has one; see archive_pyramid().
+    """
+    def __init__(self, *args, html_path, verbose=False, **kwargs):
+        self.html_path = html_path
+        self.verbose = verbose
+        super().__init__(*args, directory=html_path, **kwargs)
+
+    def do_GET(self):
+        self.send_archive_tile() or super().do_GET()
+
+    def do_HEAD(self):
+        self.send_archive_tile(head=True) or super().do_HEAD()
+
+    def log_message(self, format, *args):
+        super().log_message(format, *args) if self.verbose else None
+
+    def send_archive_tile(self, head=False):
+        """
+        Sends a tile from a layer's archive, if the request is for a pyramid tile not on disk, and the layer has an
+        archive; a tile not in the archive gets a 404.
+
+        :param head:            bool, optional      if True, sends headers only
+        :return:                bool                True if the request was answered from an archive
+        """
+        match = re.match(SERVER_TILE_PATTERN, urllib.parse.unquote(urllib.parse.urlsplit(self.path).path))
+        if not match or os.path.isfile(self.translate_path(self.path)):
+            return False
+
+        layer, level, position, suffix = match.groups()
+        archive_file = get_archive_file(os.path.join(self.html_path, 'dzi', ''), layer)
+        if not os.path.isfile(archive_file):
+            return False
+
+        data = read_archive_tile(archive_file, '{}/{}'.format(level, position), suffix)
+        if data is None:
+            self.send_error(404)
+            return True
+
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type('tile.' + suffix)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data) if not head else None
+
+        return True
+
+
+def serve_site(html_path, host=SERVER_HOST, port=SERVER_PORT, verbose=False):
+    """
+    Serves a generated site (see make_site()) over HTTP until interrupted, from a pool of threads. Layers whose
+    pyramids have been packed by archive_pyramid() are served from their archives, at the same URLs as the folder
+    layout, so the site works unchanged against either; see TileRequestHandler.
+
+    :param html_path:       str, required       html folder path, e.g. 'C:\\path\\to\\file\\layers\\html\\'
+    :param host:            str, optional       address to listen on
+    :param port:            int, optional       port to listen on
+    :param verbose:         bool, optional      if True, prints out every request
+    :return:                none
+    """
+    handler = functools.partial(TileRequestHandler, html_path=html_path, verbose=verbose)
+    with ThreadingHTTPServer((host, port), handler) as server:
+        print('Serving {} at http://{}:{}/'.format(html_path, host, server.server_address[1]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
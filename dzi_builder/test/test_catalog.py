@@ -0,0 +1,64 @@
+import os
+
+from PIL import (
+    Image
+)
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    filter_layer_tiles,
+    get_catalog_entry,
+    get_catalog_layers,
+    get_catalog_tiles,
+    update_tile_catalog
+)
+
+
+def write_tiles(layer_path, tile_names, mode='RGBA'):
+    for tile_name in tile_names:
+        Image.new(mode, (8, 8)).save(layer_path + tile_name)
+
+
+def test_layers_sharing_a_prefix_are_kept_apart(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    write_tiles(layer_path, ['road-000.png', 'road-001.png', 'roads-000.png', 'road.png'])
+    catalog = build_tile_catalog(layer_path)
+
+    assert get_catalog_layers(catalog) == ['road', 'roads']
+    assert get_catalog_tiles(catalog, ['road']) == ['road-000.png', 'road-001.png']
+    assert 'road.png' in catalog['files']
+
+
+def test_tiles_are_sorted_by_tile_number():
+    tile_list = ['base-1000.png', 'base-999.png', 'base-101.png', 'base-000.png', 'base-001.svg']
+
+    assert filter_layer_tiles(tile_list, 'base') == ['base-000.png', 'base-101.png', 'base-999.png', 'base-1000.png']
+    assert filter_layer_tiles(tile_list, 'base', 'svg') == ['base-001.svg']
+
+
+def test_headers_are_read_and_updated(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    write_tiles(layer_path, ['base-000.png', 'base-001.png'], mode='RGB')
+    catalog = build_tile_catalog(layer_path)
+    assert get_catalog_entry(catalog, 'base-000.png')['colour_type'] == 2
+
+    write_tiles(layer_path, ['base-000.png'])                              # rewritten as RGBA
+    write_tiles(layer_path, ['grid-000.png'])                              # added
+    os.remove(layer_path + 'base-001.png')                                 # removed
+    update_tile_catalog(catalog, ['base-000.png', 'base-001.png', 'grid-000.png'])
+
+    assert get_catalog_entry(catalog, 'base-000.png')['colour_type'] == 6
+    assert get_catalog_entry(catalog, 'base-001.png') is None
+    assert catalog == build_tile_catalog(layer_path)
+
+
+def test_renamed_tiles_are_updated(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    write_tiles(layer_path, ['labels-000.png', 'labels-001.png'])
+    catalog = build_tile_catalog(layer_path)
+
+    os.rename(layer_path + 'labels-001.png', layer_path + 'labels-003.png')
+    update_tile_catalog(catalog, ['labels-001.png', 'labels-003.png'])
+
+    assert get_catalog_tiles(catalog) == ['labels-000.png', 'labels-003.png']
+    assert catalog == build_tile_catalog(layer_path)
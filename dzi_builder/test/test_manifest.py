@@ -0,0 +1,73 @@
+import os
+import random
+
+from PIL import (
+    Image
+)
+
+from dzi_builder.benchmark.fixtures import (
+    make_tile,
+    make_tile_grid
+)
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog
+)
+
+from dzi_builder.core.manifest import (
+    get_changed_layers,
+    get_changed_tiles,
+    get_layer_inputs,
+    write_build_manifest
+)
+
+from dzi_builder.core.pyramid import (
+    build_pyramids_grid,
+    get_pyramid_tiles,
+    patch_pyramids
+)
+
+from dzi_builder.core.vips import (
+    tile_number
+)
+
+
+def test_changed_tiles_are_indexed_in_grid_order(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    open(layer_path + 'base.dzi', 'w').close()
+    tiles = {'base-' + tile_number(t) + '.png': 'hash' for t in range(1200)}
+    write_build_manifest(layer_path, {'base': {'params': {}, 'tiles': tiles}})
+
+    changed = dict(tiles, **{'base-101.png': 'changed', 'base-1000.png': 'changed'})
+    layer_changes = get_changed_tiles(layer_path, layer_path, {'base': {'params': {}, 'tiles': changed}}, ['base'])
+
+    assert layer_changes == {'base': [101, 1000]}
+
+
+def test_patched_pyramid_matches_full_rebuild(tmp_path):
+    layer_path = str(tmp_path / 'layers') + os.sep
+    patch_path, build_path = str(tmp_path / 'patch') + os.sep, str(tmp_path / 'build') + os.sep
+    os.makedirs(layer_path)
+    col, row = 4, 3
+    layer_names, _, _ = make_tile_grid(layer_path, col, row, tile_width=300, layer_count=2, transparent_ratio=1.0)
+    build_params = {'col': col, 'row': row}
+
+    build_pyramids_grid(layer_path, layer_names, col, row, patch_path, tile_format='png')
+    write_build_manifest(layer_path, get_layer_inputs(layer_path, layer_names, build_params))
+
+    make_tile(300, 300, True, random.Random(1)).save(layer_path + 'roads-' + tile_number(6) + '.png')
+    catalog = build_tile_catalog(layer_path)
+    layer_inputs = get_layer_inputs(layer_path, layer_names, build_params, catalog)
+    changed_layers = get_changed_layers(layer_path, patch_path, layer_inputs)
+    layer_changes = get_changed_tiles(layer_path, patch_path, layer_inputs, changed_layers)
+    assert layer_changes == {'roads': [6]}
+
+    patch_pyramids(layer_path, layer_changes, col, patch_path, catalog=catalog)
+    build_pyramids_grid(layer_path, layer_names, col, row, build_path, tile_format='png')
+
+    for layer in layer_names:
+        patched_tiles, built_tiles = get_pyramid_tiles(patch_path, layer), get_pyramid_tiles(build_path, layer)
+        assert sorted(patched_tiles) == sorted(built_tiles)
+        for tile_key, tile_file in built_tiles.items():
+            with Image.open(tile_file) as built, Image.open(patched_tiles[tile_key]) as patched:
+                assert built.convert('RGBA').tobytes() == patched.convert('RGBA').tobytes(), tile_key
@@ -0,0 +1,41 @@
+import os
+
+from PIL import (
+    Image
+)
+
+from dzi_builder.core.optimize import (
+    optimize_png,
+    optimize_pyramid
+)
+
+
+def write_pyramid_tile(dzi_path, layer, tile_key, colour):
+    level, position = tile_key.split('/')
+    tile_file = os.path.join(dzi_path + layer + '_files', level, position + '.png')
+    os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+    Image.new('RGB', (64, 64), colour).save(tile_file, compress_level=0)
+
+    return tile_file
+
+
+def test_rewritten_tile_of_same_size_is_optimized_again(tmp_path):
+    dzi_path = str(tmp_path) + os.sep
+    tile_file = write_pyramid_tile(dzi_path, 'base', '0/0_0', (10, 20, 30))
+    write_pyramid_tile(dzi_path, 'base', '1/0_0', (10, 20, 30))
+
+    assert sorted(optimize_pyramid(dzi_path, 'base')) == ['0', '1']
+    assert optimize_pyramid(dzi_path, 'base') == {}                         # nothing rewritten since
+
+    optimized_size = os.path.getsize(tile_file)
+    write_pyramid_tile(dzi_path, 'base', '0/0_0', (30, 20, 10))             # rewritten by a patch, say
+    with open(tile_file, 'rb') as f:
+        png_data = optimize_png(f.read())
+    with open(tile_file, 'wb') as f:
+        f.write(png_data)
+    os.utime(tile_file, ns=(0, os.stat(tile_file).st_mtime_ns + 10 ** 9))
+    assert os.path.getsize(tile_file) == optimized_size
+
+    assert list(optimize_pyramid(dzi_path, 'base')) == ['0']
+    with Image.open(tile_file) as tile:
+        assert tile.getpixel((0, 0)) == (30, 20, 10)
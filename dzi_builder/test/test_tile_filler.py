@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from PIL import (
+    Image
+)
+
+from dzi_builder.core.catalog import (
+    build_tile_catalog,
+    remove_catalog_tiles
+)
+
+from dzi_builder.core.tile_filler import (
+    build_matrix,
+    read_filler_spec,
+    restructure_layer_matrix
+)
+
+
+def test_filler_specs_are_equivalent(tmp_path):
+    fillers = {6: 3, 7: 3, 11: 0}
+    spec_file = str(tmp_path / 'fillers.json')
+    with open(spec_file, 'w') as f:
+        json.dump({'3': [6, 7], '0': [11]}, f)
+    mask_file = str(tmp_path / 'fillers.png')
+    mask = Image.new('L', (4, 3), 255)
+    mask.putpixel((2, 1), 3), mask.putpixel((3, 1), 3), mask.putpixel((3, 2), 0)
+    mask.save(mask_file)
+
+    assert read_filler_spec({3: [6, 7], 0: [11]}, 4, 3) == fillers
+    assert read_filler_spec(spec_file, 4, 3) == fillers
+    assert read_filler_spec(mask_file, 4, 3) == fillers
+    assert read_filler_spec('# # # #/# # 3 3/# # # 0', 4, 3) == fillers
+    assert read_filler_spec('# # # #\n# # 3 3\n# # # 0', 4, 3) == fillers
+    assert read_filler_spec('####/#3#3/###0', 4, 3) == {5: 3, 7: 3, 11: 0}
+
+
+def test_filler_mask_numbers_above_nine_need_separators():
+    assert read_filler_spec('# # # #/# # 12 12/# # # 0', 4, 3) == {6: 12, 7: 12, 11: 0}
+    with pytest.raises(ValueError):
+        read_filler_spec('####/##33/###0', 4, 3)                        # 3, 3 or 33
+    with pytest.raises(ValueError):
+        read_filler_spec('###/#12/##0', 3, 3)
+    with pytest.raises(ValueError):
+        read_filler_spec('# # # #/##33/# # # 0', 4, 3)                  # rows mixing the two forms
+
+
+def test_filler_spec_positions_are_checked():
+    with pytest.raises(ValueError):
+        read_filler_spec({3: [6, 7], 0: [7]}, 4, 3)
+    with pytest.raises(ValueError):
+        read_filler_spec({3: [12]}, 4, 3)
+
+
+def test_svg_tiles_are_filled(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    for tile_ct in range(3):
+        with open(layer_path + 'base-00{}.svg'.format(tile_ct), 'w') as f:
+            f.write('<svg id="{}"/>'.format(tile_ct))
+    fillers = read_filler_spec('##/#0', 2, 2)
+
+    restructure_layer_matrix(layer_path, build_matrix(os.listdir(layer_path), fillers, 2, 2), fillers)
+
+    assert sorted(os.listdir(layer_path)) == ['base-000.svg', 'base-001.svg', 'base-002.svg', 'base-003.svg']
+    with open(layer_path + 'base-003.svg') as f:
+        assert f.read() == '<svg id="0"/>'
+
+
+def test_restructured_catalog_matches_folder(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    for layer in ('road', 'roads'):
+        for tile_ct in range(4):
+            Image.new('RGBA', (8, 8), (tile_ct, 0, 0, 255)).save(layer_path + '{}-00{}.png'.format(layer, tile_ct))
+    catalog = build_tile_catalog(layer_path)
+    fillers = read_filler_spec({1: [2, 5]}, 3, 2)
+
+    restructure_layer_matrix(layer_path, build_matrix(catalog['files'], fillers, 3, 2), fillers, catalog)
+
+    assert catalog == build_tile_catalog(layer_path)
+    assert os.path.samefile(layer_path + 'roads-001.png', layer_path + 'roads-005.png')
+    with Image.open(layer_path + 'road-004.png') as tile:
+        assert tile.getpixel((0, 0)) == (3, 0, 0, 255)
+
+
+def export_layer(layer_path, layer, tile_count, shade):
+    for tile_ct in range(tile_count):
+        Image.new('RGBA', (8, 8), (tile_ct, shade, 0, 255)).save(layer_path + '{}-00{}.png'.format(layer, tile_ct))
+
+
+def fill_layers(layer_path, fillers, col, row):
+    catalog = build_tile_catalog(layer_path)
+    restructure_layer_matrix(layer_path, build_matrix(catalog['files'], fillers, col, row), fillers, catalog)
+
+    return catalog
+
+
+def test_filling_a_filled_grid_changes_nothing(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    export_layer(layer_path, 'base', 6, 0)
+    fillers = read_filler_spec({2: [5, 7, 8]}, 3, 3)
+    fill_layers(layer_path, fillers, 3, 3)
+    filled = {f: open(layer_path + f, 'rb').read() for f in os.listdir(layer_path)}
+
+    catalog = fill_layers(layer_path, fillers, 3, 3)
+
+    assert {f: open(layer_path + f, 'rb').read() for f in os.listdir(layer_path)} == filled
+    assert catalog == build_tile_catalog(layer_path)
+    assert all(os.path.samefile(layer_path + 'base-002.png', layer_path + 'base-00{}.png'.format(p)) for p in (5, 7, 8))
+
+
+def test_export_after_filling_starts_from_an_empty_grid(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    export_layer(layer_path, 'base', 6, 0)
+    open(layer_path + 'base.png', 'w').close()
+    fillers = read_filler_spec({2: [5, 7, 8]}, 3, 3)
+    fill_layers(layer_path, fillers, 3, 3)
+
+    assert len(remove_catalog_tiles(layer_path)) == 9
+    export_layer(layer_path, 'base', 6, 100)                               # as generate_tiles() exports again
+    fill_layers(layer_path, fillers, 3, 3)
+
+    assert sorted(os.listdir(layer_path)) == ['base-00{}.png'.format(p) for p in range(9)] + ['base.png']
+    for position, tile_ct in {2: 2, 5: 2, 6: 5, 8: 2}.items():
+        with Image.open(layer_path + 'base-00{}.png'.format(position)) as tile:
+            assert tile.getpixel((0, 0)) == (tile_ct, 100, 0, 255)
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+from PIL import (
+    Image
+)
+
+from dzi_builder.core import (
+    tile_format
+)
+
+from dzi_builder.core.tile_format import (
+    quantize_tile
+)
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_quantized_tile_keeps_every_pixel(monkeypatch, numpy):
+    monkeypatch.setattr(tile_format, 'np', tile_format.np if numpy else None)
+    rng = random.Random(0)
+    palette = [(0, 0, 0, 0)] + [(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255) for _ in range(20)]
+    tile = Image.new('RGBA', (64, 48))
+    tile.putdata([palette[rng.randrange(len(palette))] for _ in range(64 * 48)])
+    tile.putpixel((5, 5), (1, 2, 3, 255))                                  # a blended edge, not in palette
+
+    assert quantize_tile(tile, palette) is None
+    paletted = quantize_tile(tile, palette, extend=True)
+
+    assert paletted.mode == 'P'
+    assert paletted.convert('RGBA').tobytes() == tile.tobytes()
@@ -0,0 +1,89 @@
+import os
+import random
+import threading
+import time
+
+from dzi_builder.benchmark.fixtures import (
+    make_tile,
+    write_tile_slowly
+)
+
+from dzi_builder.core.vips import (
+    tile_number
+)
+
+from dzi_builder.core.watcher import (
+    get_ready_layers,
+    is_png_complete,
+    stream_layers
+)
+
+
+def write_layer(layer_path, layer, tile_count, interval=0.0):
+    """
+    Writes a layer's artboard tiles, as the benchmark fixtures do; each tile is written in two parts, interval seconds
+    apart, if interval is given.
+    """
+    rng = random.Random(layer)
+    for tile_ct in range(tile_count):
+        tile = make_tile(32, 32, True, rng)
+        tile_file = layer_path + layer + '-' + tile_number(tile_ct) + '.png'
+        write_tile_slowly(tile, tile_file, interval) if interval else tile.save(tile_file)
+
+
+def test_layer_ready_once_tile_sizes_are_stable(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    write_layer(layer_path, 'base', 2)
+    write_layer(layer_path, 'roads', 1)
+    tile_sizes = {}
+
+    assert get_ready_layers(layer_path, 2, tile_sizes) == []           # sizes not yet seen twice
+    assert get_ready_layers(layer_path, 2, tile_sizes) == ['base']     # roads is missing a tile
+    assert get_ready_layers(layer_path, 2, {}, final=True) == ['base']
+
+
+def test_partly_written_tile_is_not_ready(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    tile_file = layer_path + 'base-000.png'
+    writer = threading.Thread(target=write_tile_slowly, args=(make_tile(32, 32, True, random.Random(0)), tile_file, 2))
+    writer.start()
+    try:
+        while not os.path.isfile(tile_file) or not os.path.getsize(tile_file):
+            time.sleep(0.01)
+        tile_sizes = {}
+        get_ready_layers(layer_path, 1, tile_sizes)
+        assert not is_png_complete(tile_file)
+        assert get_ready_layers(layer_path, 1, tile_sizes) == []       # size is stable, but IEND isn't written yet
+        assert get_ready_layers(layer_path, 1, tile_sizes, final=True) == []
+    finally:
+        writer.join()
+
+    assert is_png_complete(tile_file)
+    assert get_ready_layers(layer_path, 1, {}, final=True) == ['base']
+
+
+def test_stream_layers_starts_each_layer_before_the_next_is_exported(tmp_path):
+    layer_path = str(tmp_path) + os.sep
+    layer_names = ['base', 'roads', 'labels']
+    exported = {}
+    started = {}
+
+    def export_tiles():
+        for layer in layer_names:
+            write_layer(layer_path, layer, 2, interval=0.3)
+            exported[layer] = time.monotonic()
+        return 'exported'
+
+    def record_start(layer):
+        started[layer] = time.monotonic()
+        assert all(os.path.isfile(layer_path + layer + '-' + tile_number(t) + '.png') for t in range(2))
+
+    def build_layer_tasks(layer):
+        return {layer + ':build': {'fn': record_start, 'layer': layer, 'kwargs': {}, 'deps': [], 'cost': 1}}
+
+    export_result, streamed_layers = stream_layers(layer_path, 2, export_tiles, build_layer_tasks, poll_interval=0.05)
+
+    assert export_result == 'exported'
+    assert sorted(streamed_layers) == sorted(layer_names)
+    for layer, next_layer in zip(layer_names, layer_names[1:]):
+        assert started[layer] < exported[next_layer]